@@ -184,6 +184,38 @@ class UserDatabase:
             cursor.close()
             conn.close()
 
+    def save_chat_turns_bulk(self, entries) -> bool:
+        """Persist a batch of chat turns in one INSERT.
+
+        entries: iterable of (user_id, chat_id, question, response, sql_query, tokens_used).
+        Chat counts are not touched here - increment_chat_count runs on the request path,
+        so a failed history write can never roll back a free-trial increment.
+        """
+        entries = list(entries)
+        if not entries:
+            return True
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            psycopg2.extras.execute_values(
+                cursor,
+                '''
+                INSERT INTO chat_history (user_id, chat_id, question, response, sql_query, tokens_used)
+                VALUES %s
+                ''',
+                [(user_id, chat_id, question, response, sql_query or "", tokens_used or 0)
+                 for user_id, chat_id, question, response, sql_query, tokens_used in entries]
+            )
+            conn.commit()
+            return True
+        except Exception as e:
+            print(f"❌ Error saving chat turns: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cursor.close()
+            conn.close()
+
     def get_user_chats_overview(self, user_id: int):
         """Return list of chat overviews for a user: chat_id, title (first question), last_message timestamp."""
         conn = self.get_connection()
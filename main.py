@@ -6,26 +6,37 @@ import os
 import sys
 
 # Environment Configuration Setup
-# Priority: run-env.yaml (deployment) > config.env (local) > system env vars
+# Priority: run-env.env / run-env.yaml (deployment) > config.env (local) > system env vars
 
 # Check if we're in deployment mode (Cloud Run)
 is_deployment = os.getenv('K_SERVICE') is not None or os.getenv('PORT') is not None
 
 if is_deployment:
-    # Load environment variables from run-env.yaml for Cloud Run deployment
+    # Prefer the dotenv file baked from run-env.yaml at image build time (see Dockerfile),
+    # which avoids parsing YAML on every cold start
+    baked_env_path = os.path.join(os.path.dirname(__file__), 'run-env.env')
+    run_env_path = os.path.join(os.path.dirname(__file__), 'run-env.yaml')
     try:
-        import yaml
-        run_env_path = os.path.join(os.path.dirname(__file__), 'run-env.yaml')
-        if os.path.exists(run_env_path):
+        if os.path.exists(baked_env_path):
+            from dotenv import load_dotenv
+            load_dotenv(baked_env_path, override=True, interpolate=False)
+            print("✅ Loaded environment variables from run-env.env (deployment mode)")
+        elif os.path.exists(run_env_path):
+            # Load environment variables from run-env.yaml for Cloud Run deployment
+            import yaml
+            try:
+                from yaml import CSafeLoader as SafeLoader  # libyaml-backed loader
+            except ImportError:
+                from yaml import SafeLoader
             with open(run_env_path, 'r') as file:
-                env_vars = yaml.safe_load(file)
+                env_vars = yaml.load(file, Loader=SafeLoader)
                 for key, value in env_vars.items():
                     os.environ[key] = str(value)
             print("✅ Loaded environment variables from run-env.yaml (deployment mode)")
         else:
             print("⚠️ run-env.yaml not found, using system environment variables")
     except Exception as e:
-        print(f"⚠️ Could not load run-env.yaml: {e}")
+        print(f"⚠️ Could not load deployment environment: {e}")
 else:
     # Load environment variables from config.env for local development
     try:
@@ -59,27 +70,38 @@ import asyncio
 import time
 import json
 import re
+import queue
+import threading
+import hashlib
+import functools
+import itertools
+import orjson
 from typing import Dict, Any, List, Optional
 from contextlib import asynccontextmanager
+from types import SimpleNamespace
 
 # FastAPI imports for API server
 from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse, Response
 from pydantic import BaseModel
 
 # Core modules
 from modules.postgresql_loader import load_into_postgresql
-from modules.query_cleaner import clean_sql_query, print_sql, normalize_user_query, enhance_query_with_corrections, normalize_skills_in_result
+from modules.query_cleaner import clean_sql_query, print_sql, normalize_user_query, enhance_query_with_corrections, normalize_skills_in_result, format_scalar_answer
 from modules.logging_config import configure_logging
-from modules.prompts import SYSTEM_PROMPT_TEMPLATE, ANSWER_PROMPT_TEMPLATE
+from modules.prompts import EMPTY_RESULT_MSG, render_answer, render_sql_fix, readable_header, check_static_prefix
 
 # Authentication modules
 from User_sign.auth_routes import router as auth_router
 from User_sign.database import user_db
 
 # Enhanced modules - now properly imported and used
-from modules.enhanced_query_cache import query_cache, optimize_prompt_tokens
+from modules.enhanced_query_cache import query_cache, optimize_prompt_tokens, generate_cache_key, get_prompt_skeleton, render_prompt_skeleton
+from modules.prompt_cache import prompt_cache, PROMPT_CACHE_CONTEXT_WINDOW
+from modules.domain_map import try_template_sql
+from modules.sql_compile import parse_ir, compile_ir, validate_sql, SQLCompileError
+from modules.sql_examples import example_block
 from modules.conversation_memory import ConversationMemory, ConversationTurn
 from modules.question_suggestions import AIQuestionSuggester
 from modules.feedback_system import feedback_system, FeedbackEntry
@@ -90,18 +112,22 @@ from modules.llm_config import get_llm
 
 # LangChain imports
 from langchain_community.utilities import SQLDatabase
-from langchain_community.tools.sql_database.tool import QuerySQLDataBaseTool
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from sqlalchemy import text
 import tiktoken
 
 configure_logging()
 
+# Shared tokenizer - loading the BPE ranks is expensive, so do it once per process
+_ENC = tiktoken.get_encoding("cl100k_base")
+
 # API Models for FastAPI
 class ChatRequest(BaseModel):
     message: str
     chat_id: Optional[str] = None
     user_id: Optional[int] = None  # For authenticated users
+    want_suggestions: bool = True  # Clients that discard suggestions can skip the follow-up LLM call
     
     class Config:
         extra = "allow"  # Allow extra fields to prevent validation errors
@@ -146,11 +172,246 @@ class FeedbackResponse(BaseModel):
 api_start_time = time.time()
 
 # Performance optimization settings
-MAX_CONCURRENT_REQUESTS = 10
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "10"))
+# Caps how many blocking LLM/DB calls run in worker threads at once
+work_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 # REQUEST_TIMEOUT = 30  # seconds - REMOVED TO PREVENT TIMEOUT ISSUES
 CACHE_PRELOAD_ENABLED = True
 STREAMING_ENABLED = True
 
+# Database error classification - one compiled scan instead of repeated substring checks
+DB_ERROR_PATTERN = re.compile(
+    r"(column\b.*\bdoes not exist)|(syntax error)|(connection)",
+    re.IGNORECASE | re.DOTALL
+)
+DB_ERROR_LABELS = {
+    1: "Column not found in database schema",
+    2: "SQL syntax error",
+    3: "Database connection failed"
+}
+
+class TTLCache:
+    """Small thread-safe TTL cache with a size bound (oldest entries evicted first)"""
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = {}  # key -> (expires_at, value), insertion-ordered
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                return None
+            return entry[1]
+    
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._data) >= self.maxsize:
+                del self._data[next(iter(self._data))]
+            self._data[key] = (time.monotonic() + self.ttl, value)
+    
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+# Short-lived auth caches - repeated requests from the same caller skip the JWT decode
+# and the chat-limit query. TTLs are kept short to bound staleness after revocation/upgrade.
+BEARER_PREFIX = "Bearer "
+BEARER_PREFIX_LEN = len(BEARER_PREFIX)
+JWT_CACHE_TTL = 5.0
+CHAT_LIMIT_CACHE_TTL = 2.0
+AUTH_CACHE_MAXSIZE = 10_000
+jwt_cache = TTLCache(maxsize=AUTH_CACHE_MAXSIZE, ttl=JWT_CACHE_TTL)
+chat_limit_cache = TTLCache(maxsize=AUTH_CACHE_MAXSIZE, ttl=CHAT_LIMIT_CACHE_TTL)
+
+def verify_jwt_token_cached(token: str) -> Optional[int]:
+    """Verify a JWT, reusing a recent successful verification (keyed by token hash, never the raw token)"""
+    key = hashlib.sha256(token.encode()).digest()[:16]
+    user_id = jwt_cache.get(key)
+    if user_id is None:
+        user_id = user_db.verify_jwt_token(token)
+        if user_id:
+            jwt_cache.set(key, user_id)
+    return user_id
+
+def can_user_chat_cached(user_id: int) -> Dict[str, Any]:
+    """Check the chat limit, reusing a result read within the last CHAT_LIMIT_CACHE_TTL seconds"""
+    chat_limit_result = chat_limit_cache.get(user_id)
+    if chat_limit_result is None:
+        chat_limit_result = user_db.can_user_chat(user_id)
+        chat_limit_cache.set(user_id, chat_limit_result)
+    return chat_limit_result
+
+# /suggestions responses, keyed by (team, chat_id, session memory version)
+SUGGESTIONS_CACHE_TTL = 30.0
+suggestions_cache = TTLCache(maxsize=128, ttl=SUGGESTIONS_CACHE_TTL)
+
+# /chat follow-up suggestions, keyed by (response digest, chat_id, session memory version)
+FOLLOW_UP_CACHE_TTL = 60.0
+follow_up_cache = TTLCache(maxsize=512, ttl=FOLLOW_UP_CACHE_TTL)
+
+# /chat returns at most this many suggestions
+MAX_CHAT_SUGGESTIONS = 3
+FALLBACK_FOLLOW_UP_SUGGESTIONS = (
+    "Show more detailed statistics",
+    "Compare with other teams",
+    "Analyze by time period"
+)
+
+def take_suggestions(*sources) -> List[str]:
+    """Take the first MAX_CHAT_SUGGESTIONS suggestions across sources without building the full list"""
+    return list(itertools.islice(itertools.chain(*sources), MAX_CHAT_SUGGESTIONS))
+
+# Constant fallback payloads, serialized once instead of per error response
+_FALLBACK_SUGGESTIONS_BODY = orjson.dumps({
+    "suggestions": [
+        "Show me the top raiders with most successful raids",
+        "How many points did Bengaluru Bulls score this season?",
+        "Show me all raids by Pawan Sehrawat",
+        "Compare raid success rates between TT and BB teams",
+        "List all do-or-die raids in the season",
+        "Show me super tackle opportunities by team"
+    ]
+})
+# Everything but the uptime is fixed; the uptime value and closing brace are appended per response
+_STATS_FALLBACK_HEAD = orjson.dumps({
+    "performance": {"avg_time": 0, "success_rate": 1.0},
+    "session": {"total_questions": 0},
+    "cache": {"hit_rate": 0, "total_queries": 0},
+    "optimization_settings": {
+        "max_concurrent_requests": MAX_CONCURRENT_REQUESTS,
+        "cache_preload_enabled": CACHE_PRELOAD_ENABLED,
+        "streaming_enabled": STREAMING_ENABLED
+    }
+})[:-1] + b',"uptime":'
+
+# Chat request bodies are small JSON documents - cap the size and how long a client may take to send one
+CHAT_BODY_MAX_BYTES = int(os.getenv("CHAT_BODY_MAX_BYTES", "65536"))
+CHAT_BODY_TIMEOUT = float(os.getenv("CHAT_BODY_TIMEOUT", "2.0"))  # seconds
+
+async def read_chat_body(request: Request) -> bytes:
+    """Read a chat request body, rejecting oversized payloads and slow senders"""
+    try:
+        content_length = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if content_length > CHAT_BODY_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Request body too large")
+    try:
+        body = await asyncio.wait_for(request.body(), timeout=CHAT_BODY_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=408, detail="Timed out reading request body")
+    # Chunked uploads carry no Content-Length, so check the actual size as well
+    if len(body) > CHAT_BODY_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Request body too large")
+    return body
+
+async def parse_chat_request(request: Request) -> ChatRequest:
+    """Read and validate a chat body once: 400 for malformed JSON, 422 for a body that isn't a ChatRequest"""
+    body = await read_chat_body(request)
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    try:
+        return ChatRequest(**data)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Invalid request format: {str(e)}")
+
+# Generated chat ids - nanosecond clock plus a counter so bursts can't collide
+_session_ctr = itertools.count()
+
+# Server-sent event framing for /chat/stream
+SSE_PREFIX = b"data: "
+SSE_SUFFIX = b"\n\n"
+SSE_CHUNK_SIZE = 4096
+SSE_CHUNK_HEAD = SSE_PREFIX + b'{"chunk":'
+
+# /summary prompts - the template text never changes, so parse it once per process
+_SUMMARY_PROMPT = PromptTemplate.from_template("""
+                    You are a helpful assistant that summarizes conversations.
+                    Please summarize the following conversation history and session statistics.
+                    Conversation History:
+                    {conversation_history}
+                    Session Statistics:
+                    {session_stats}
+                    Provide a concise summary of the key points discussed and the overall context.
+                """)
+
+_HIGHLIGHTS_PROMPT = PromptTemplate.from_template("""
+                    Based on the conversation history below, provide 3-5 key highlights or insights:
+                    {conversation_history}
+                    
+                    Return only the highlights, one per line, without numbering or bullet points.
+                """)
+
+_summary_llm = None
+_summary_llm_lock = threading.Lock()
+
+def get_summary_llm():
+    """Lazily create the LLM used by /summary and reuse it across requests"""
+    global _summary_llm
+    if _summary_llm is None:
+        with _summary_llm_lock:
+            if _summary_llm is None:
+                _summary_llm = get_llm()
+    return _summary_llm
+
+# Background chat persistence - chat turns are batched into one INSERT per flush
+# instead of a DB round-trip per request. Chat-count increments are not batched:
+# they run on the request path so the free-trial limit sees them immediately.
+CHAT_WRITE_BATCH_SIZE = 50
+CHAT_WRITE_FLUSH_INTERVAL = 0.2  # seconds
+CHAT_WRITE_STOP = None  # queue sentinel - the writer flushes what it holds and exits
+chat_write_queue = None  # asyncio.Queue, created in lifespan
+
+async def enqueue_chat_write(entry):
+    """Queue a (user_id, chat_id, question, response, sql_query, tokens_used) chat turn"""
+    if chat_write_queue is None:
+        # Writer not running (e.g. lifespan skipped) - persist this turn in a worker thread
+        try:
+            await asyncio.to_thread(user_db.save_chat_turns_bulk, [entry])
+        except Exception as e:
+            print(f"⚠️ Could not persist chat turn: {e}")
+        return
+    chat_write_queue.put_nowait(entry)
+
+def increment_chat_count(user_id: int):
+    """Count a chat against the user's limit and drop their cached limit check"""
+    user_db.increment_chat_count(user_id)
+    chat_limit_cache.pop(user_id)
+
+async def _chat_writer_loop():
+    """Drain chat_write_queue, flushing every CHAT_WRITE_BATCH_SIZE entries or CHAT_WRITE_FLUSH_INTERVAL"""
+    stopping = False
+    while not stopping:
+        entry = await chat_write_queue.get()
+        if entry is CHAT_WRITE_STOP:
+            return
+        batch = [entry]
+        deadline = time.monotonic() + CHAT_WRITE_FLUSH_INTERVAL
+        while len(batch) < CHAT_WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = await asyncio.wait_for(chat_write_queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if entry is CHAT_WRITE_STOP:
+                stopping = True
+                break
+            batch.append(entry)
+        try:
+            await asyncio.to_thread(user_db.save_chat_turns_bulk, batch)
+        except Exception as e:
+            print(f"⚠️ Could not persist chat turns: {e}")
+
 # Initialize enhanced modules
 ai_question_suggester = None  # Will be initialized with LLM
 enhanced_agent = None  # Will be initialized in lifespan
@@ -170,6 +431,10 @@ class SessionManager:
             self.sessions[chat_id] = ConversationMemory()
         return self.sessions[chat_id]
     
+    def get_session(self, chat_id):
+        """Existing session for chat_id, or None - never creates one"""
+        return self.sessions.get(chat_id)
+    
     def get_session_stats(self, chat_id):
         """Get stats for a specific session"""
         if chat_id in self.sessions:
@@ -248,6 +513,55 @@ class SimplePerformanceMonitor:
 # Initialize session manager
 session_manager = SessionManager()
 
+# Background recorder - metrics are written off the request path. Session turns are not:
+# ConversationMemory is read by request threads, so add_turn stays synchronous.
+# process_question runs in worker threads, so this is a thread-safe queue drained by
+# a single daemon thread (started in lifespan) rather than an asyncio.Queue.
+RECORD_QUEUE_MAXSIZE = 10_000
+_record_queue = queue.Queue(maxsize=RECORD_QUEUE_MAXSIZE)
+_record_thread = None
+
+def _record_worker():
+    """Apply queued recording calls in arrival order"""
+    while True:
+        func, arg = _record_queue.get()
+        try:
+            func(arg)
+        except Exception as e:
+            print(f"⚠️ Background record failed ({getattr(func, '__qualname__', func)}): {e}")
+
+def start_record_worker():
+    """Start the background recorder thread once"""
+    global _record_thread
+    if _record_thread is None:
+        _record_thread = threading.Thread(target=_record_worker, name="record-writer", daemon=True)
+        _record_thread.start()
+
+def enqueue_record(func, arg):
+    """Queue a recording call; drop it when the queue is full instead of blocking the request"""
+    try:
+        _record_queue.put_nowait((func, arg))
+    except queue.Full:
+        pass
+
+# Greeting responses keyed by the first word of the greeting
+GREETING_FAREWELL_RESPONSE = "Goodbye! I'm your KabaddiGuru analyst. Feel free to come back anytime to analyze player performance, match statistics, team strategies, and more Kabaddi insights! 🏏"
+GREETING_THANKS_RESPONSE = "You're welcome! I'm here to help you with all your Kabaddi analytics needs. Feel free to ask me about player performance, match statistics, team strategies, or any other Kabaddi-related questions! 🏏"
+GREETING_HOW_ARE_YOU_RESPONSE = "I'm doing great! I'm your dedicated KabaddiGuru analyst, ready to help you explore player performance, match statistics, team strategies, and uncover insights from your Kabaddi data. What would you like to analyze today? 🏏"
+GREETING_DEFAULT_RESPONSE = "Hello! I'm your KabaddiGuru analyst. I can help you analyze player performance, match statistics, team strategies, and much more from your Kabaddi data. What would you like to know about your Kabaddi analytics? 🏏"
+GREETING_RESPONSES = {
+    'bye': GREETING_FAREWELL_RESPONSE,
+    'goodbye': GREETING_FAREWELL_RESPONSE,
+    'see': GREETING_FAREWELL_RESPONSE,
+    'take': GREETING_FAREWELL_RESPONSE,
+    'thanks': GREETING_THANKS_RESPONSE,
+    'thank': GREETING_THANKS_RESPONSE,
+    'how': GREETING_HOW_ARE_YOU_RESPONSE,
+    'what\'s': GREETING_HOW_ARE_YOU_RESPONSE,
+    'sup': GREETING_HOW_ARE_YOU_RESPONSE
+}
+GREETING_FIRST_WORD_PATTERN = re.compile(r"[a-z']+")
+
 class EnhancedKabaddiAgent:
     """Enhanced Kabaddi Analytics Agent with all improvements integrated"""
     
@@ -256,7 +570,6 @@ class EnhancedKabaddiAgent:
         self.db = None
         self.llm = None
         self.table_details = None
-        self.execute_query = None
         self.rephrase_answer = None
         self.session_start = time.time()
         
@@ -265,6 +578,7 @@ class EnhancedKabaddiAgent:
         self.common_queries_cache = {}
         self.table_schema_summary = None
         self.optimized_prompts = {}
+        self._sql_prompt_skeleton = None
     
     def _is_greeting(self, user_input: str) -> bool:
         """Check if the user input is a greeting"""
@@ -287,22 +601,11 @@ class EnhancedKabaddiAgent:
     
     def _get_greeting_response(self, user_input: str) -> str:
         """Generate appropriate greeting response for Kabaddi analyst"""
-        cleaned_input = user_input.lower().strip()
-        
-        # Farewell responses
-        if any(word in cleaned_input for word in ['bye', 'goodbye', 'see you', 'take care']):
-            return "Goodbye! I'm your KabaddiGuru analyst. Feel free to come back anytime to analyze player performance, match statistics, team strategies, and more Kabaddi insights! 🏏"
-        
-        # Thank you responses
-        if any(word in cleaned_input for word in ['thanks', 'thank you']):
-            return "You're welcome! I'm here to help you with all your Kabaddi analytics needs. Feel free to ask me about player performance, match statistics, team strategies, or any other Kabaddi-related questions! 🏏"
-        
-        # How are you responses
-        if any(word in cleaned_input for word in ['how are you', 'what\'s up', 'sup']):
-            return "I'm doing great! I'm your dedicated KabaddiGuru analyst, ready to help you explore player performance, match statistics, team strategies, and uncover insights from your Kabaddi data. What would you like to analyze today? 🏏"
-        
-        # General greeting responses
-        return "Hello! I'm your KabaddiGuru analyst. I can help you analyze player performance, match statistics, team strategies, and much more from your Kabaddi data. What would you like to know about your Kabaddi analytics? 🏏"
+        # Greetings are matched at the start of the input, so the first word picks the response
+        first_word = GREETING_FIRST_WORD_PATTERN.match(user_input.lower().strip())
+        if first_word:
+            return GREETING_RESPONSES.get(first_word.group(0), GREETING_DEFAULT_RESPONSE)
+        return GREETING_DEFAULT_RESPONSE
     
     def initialize(self):
         """Initialize the enhanced agent"""
@@ -317,10 +620,12 @@ class EnhancedKabaddiAgent:
         # Pre-optimize table schema for faster processing
         self.table_schema_summary = optimize_prompt_tokens("", self.table_details)
         
-        # Set up query execution and answer generation
-        self.execute_query = QuerySQLDataBaseTool(db=self.db)
-        answer_prompt = PromptTemplate.from_template(ANSWER_PROMPT_TEMPLATE)
-        self.rephrase_answer = answer_prompt | self.llm | StrOutputParser()
+        # Pre-render the static SQL prompt once; requests only splice in the question
+        self._prepare_sql_prompt()
+        check_static_prefix(self._sql_prompt_skeleton[0][0])
+        
+        # The answer prompt is rendered by concatenation in render_answer(), so the chain starts at the LLM
+        self.rephrase_answer = self.llm | StrOutputParser()
         
         # Initialize AI-powered question suggester with LLM
         global ai_question_suggester
@@ -337,6 +642,16 @@ class EnhancedKabaddiAgent:
         
         print("✅ Enhanced agent initialized successfully!")
     
+    def _prepare_sql_prompt(self):
+        """Render and optimize SYSTEM_PROMPT_TEMPLATE once, split around the example and question slots"""
+        # Imported here so the lazily built template is only assembled when the agent initializes
+        from modules.prompts import SYSTEM_PROMPT_TEMPLATE
+        self._sql_prompt_skeleton = get_prompt_skeleton(SYSTEM_PROMPT_TEMPLATE, self.table_details, ('example', 'input'))
+    
+    def build_sql_prompt(self, question: str) -> str:
+        """Build the optimized SQL prompt for a question with its closest worked example"""
+        return render_prompt_skeleton(self._sql_prompt_skeleton, example=example_block(question), input=question)
+    
     def _preload_common_queries(self):
         """Preload cache with common queries for faster response"""
         common_questions = [
@@ -356,28 +671,41 @@ class EnhancedKabaddiAgent:
         for question in common_questions:
             try:
                 # Pre-generate optimized prompts for common questions
-                optimized_prompt = optimize_prompt_tokens(
-                    SYSTEM_PROMPT_TEMPLATE.format(
-                        input=question,
-                        table_info=self.table_details
-                    ),
-                    self.table_details
-                )
-                self.optimized_prompts[question] = optimized_prompt
+                self.optimized_prompts[question] = self.build_sql_prompt(question)
             except Exception as e:
                 print(f"Warning: Could not preload query '{question}': {e}")
         
         print(f"✅ Preloaded {len(self.optimized_prompts)} common queries")
         
-    def generate_sql_with_caching(self, question: str, session_memory=None) -> Dict[str, str]:
-        """Generate SQL with enhanced caching and optimization"""
+    def generate_sql_with_caching(self, question: str, session_memory=None) -> Dict[str, Any]:
+        """
+        Generate SQL with enhanced caching and optimization.
+        "cacheable" is False for error queries and SQL that still fails validate_sql, which callers must not cache.
+        Fresh LLM output also carries "prompt_cache_key" for prompt_cache.set once the query has run successfully
+        """
         # Normalize the question to handle player name variations
         normalized_question = normalize_user_query(question)
         
         # Check cache first (try both original and normalized versions)
         cached_result = query_cache.get_sql(question) or query_cache.get_sql(normalized_question)
         if cached_result:
-            return {"raw_query": cached_result, "query": clean_sql_query(cached_result)}
+            return {"raw_query": cached_result, "query": clean_sql_query(cached_result), "cacheable": True}
+        
+        # Rephrasings of earlier questions reuse their SQL; follow-ups are keyed on the questions before them
+        cache_context = ""
+        if session_memory and hasattr(session_memory, 'get_recent_turns') and session_memory.is_follow_up_question(question):
+            cache_context = prompt_cache.context_key(
+                [turn.user_question for turn in session_memory.get_recent_turns(PROMPT_CACHE_CONTEXT_WINDOW)]
+            )
+        # Standalone counts over a single mapped filter don't need the LLM at all
+        if not cache_context:
+            template_sql = try_template_sql(normalized_question)
+            if template_sql:
+                return {"raw_query": template_sql, "query": template_sql, "cacheable": True}
+        
+        semantic_result = prompt_cache.get(normalized_question, cache_context)
+        if semantic_result:
+            return {"raw_query": semantic_result, "query": semantic_result, "cacheable": True}
         
         # Check if we have a pre-optimized prompt for this question
         if question in self.optimized_prompts:
@@ -402,32 +730,19 @@ class EnhancedKabaddiAgent:
             if conversation_context:
                 try:
                     from modules.prompts import CONTEXT_AWARE_SYSTEM_PROMPT_TEMPLATE
-                    optimized_prompt = optimize_prompt_tokens(
-                        CONTEXT_AWARE_SYSTEM_PROMPT_TEMPLATE.format(
-                            input=processed_question,
-                            table_info=self.table_details,
-                            conversation_context=conversation_context
-                        ),
-                        self.table_details
+                    # The optimized template is memoized; only the question and context are filled per request
+                    optimized_prompt = render_prompt_skeleton(
+                        get_prompt_skeleton(CONTEXT_AWARE_SYSTEM_PROMPT_TEMPLATE, self.table_details, ('input', 'conversation_context', 'example')),
+                        input=processed_question,
+                        conversation_context=conversation_context,
+                        example=example_block(processed_question)
                     )
                 except:
                     # Fallback to regular prompt
-                    optimized_prompt = optimize_prompt_tokens(
-                        SYSTEM_PROMPT_TEMPLATE.format(
-                            input=processed_question,
-                            table_info=self.table_details
-                        ),
-                        self.table_details
-                    )
+                    optimized_prompt = self.build_sql_prompt(processed_question)
             else:
                 # Generate optimized prompt with reduced token usage
-                optimized_prompt = optimize_prompt_tokens(
-                    SYSTEM_PROMPT_TEMPLATE.format(
-                        input=processed_question,
-                        table_info=self.table_details
-                    ),
-                    self.table_details
-                )
+                optimized_prompt = self.build_sql_prompt(processed_question)
         
         # LLM call without timeout to prevent hanging issues
         response = None
@@ -437,22 +752,78 @@ class EnhancedKabaddiAgent:
             # Return a simple error query
             return {
                 "raw_query": "SELECT 'Error: Could not generate SQL query. Please try again.' as error",
-                "query": "SELECT 'Error: Could not generate SQL query. Please try again.' as error"
+                "query": "SELECT 'Error: Could not generate SQL query. Please try again.' as error",
+                "cacheable": False
             }
         
         # Check if response was successful
         if response is None:
             return {
                 "raw_query": "SELECT 'Error: Could not generate SQL query. Please try again.' as error",
-                "query": "SELECT 'Error: Could not generate SQL query. Please try again.' as error"
+                "query": "SELECT 'Error: Could not generate SQL query. Please try again.' as error",
+                "cacheable": False
             }
         
+        # Simple queries come back as a JSON query object; compile it so the caches hold SQL
+        raw_query = response.content
+        query_ir = parse_ir(raw_query)
+        if query_ir is not None:
+            try:
+                raw_query = compile_ir(query_ir)
+            except SQLCompileError as e:
+                # Ask for the same query as plain SQL rather than failing the request
+                print(f"⚠️ Could not compile JSON query: {e}")
+                fixed_query = self.fix_sql(raw_query, [f"the JSON query could not be compiled ({e}) - write it as a PostgreSQL SELECT instead"])
+                if fixed_query is not None and parse_ir(fixed_query) is None:
+                    raw_query = fixed_query
+                else:
+                    return {
+                        "raw_query": "SELECT 'Error: Could not generate SQL query. Please try again.' as error",
+                        "query": "SELECT 'Error: Could not generate SQL query. Please try again.' as error",
+                        "cacheable": False
+                    }
+        else:
+            # SELECT * or unquoted names would fail or mislead at the database; fix them before it sees the query
+            problems = validate_sql(clean_sql_query(raw_query))
+            if problems:
+                fixed_query = self.fix_sql(raw_query, problems)
+                if fixed_query is None:
+                    # Let the database report the error, but never cache the invalid query
+                    return {"raw_query": raw_query, "query": clean_sql_query(raw_query), "cacheable": False}
+                raw_query = fixed_query
+        
         # Cache the result using both original and normalized questions
-        query_cache.set_sql(question, response.content)
+        query_cache.set_sql(question, raw_query)
         if normalized_question != question:
-            query_cache.set_sql(normalized_question, response.content)
+            query_cache.set_sql(normalized_question, raw_query)
         
-        return {"raw_query": response.content, "query": clean_sql_query(response.content)}
+        cleaned_query = clean_sql_query(raw_query)
+        return {"raw_query": raw_query, "query": cleaned_query, "cacheable": True,
+                "prompt_cache_key": (normalized_question, cache_context)}
+    
+    def fix_sql(self, sql_query: str, problems: List[str]) -> Optional[str]:
+        """One retry with the short SQL_FIX_TEMPLATE prompt; the corrected SQL, or None if it is still invalid"""
+        print(f"⚠️ Generated SQL failed validation: {'; '.join(problems)}")
+        try:
+            fixed_query = self.llm.invoke(render_sql_fix(clean_sql_query(sql_query), problems)).content
+        except Exception as e:
+            print(f"⚠️ SQL fix request failed: {e}")
+            return None
+        return None if validate_sql(clean_sql_query(fixed_query)) else fixed_query
+    
+    def run_query(self, sql_query: str) -> str:
+        """Run SQL and return its rows as text, keyed by readable headers (HEADER_MAP) rather than column names"""
+        with self.engine.begin() as conn:
+            result = conn.execute(text(sql_query))
+            if not result.returns_rows:
+                return ""
+            headers = []
+            for column in result.keys():
+                header = readable_header(column)
+                # Two columns mapping to one header (e.g. raw and clean skills) keep their own names
+                headers.append(column if header in headers else header)
+            rows = [dict(zip(headers, row)) for row in result]
+        return str(rows) if rows else ""
     
     def execute_with_caching(self, sql_query: str) -> str:
         """Execute query with result caching"""
@@ -462,23 +833,24 @@ class EnhancedKabaddiAgent:
         else:
             try:
                 # Database query without timeout
-                query_result = self.execute_query.invoke(sql_query)
+                query_result = self.run_query(sql_query)
                 query_cache.set_result(sql_query, query_result)
                 return query_result
             except Exception as e:
                 # Provide more specific error messages based on the type of error
-                error_msg = str(e).lower()
-                if "column" in error_msg and "does not exist" in error_msg:
-                    return f"Error: Column not found in database schema - {str(e)}"
-                elif "syntax error" in error_msg:
-                    return f"Error: SQL syntax error - {str(e)}"
-                elif "connection" in error_msg:
-                    return f"Error: Database connection failed - {str(e)}"
-                else:
-                    return f"Error: Database query failed - {str(e)}"
+                error_msg = str(e)
+                match = DB_ERROR_PATTERN.search(error_msg)
+                label = DB_ERROR_LABELS[match.lastindex] if match else "Database query failed"
+                return f"Error: {label} - {error_msg}"
     
-    def process_question(self, user_input: str, chat_id: str = None) -> Dict[str, Any]:
-        """Process user question with full pipeline and session context"""
+    def process_question(self, user_input: str, chat_id: str = None, on_event=None) -> Dict[str, Any]:
+        """
+        Process user question with full pipeline and session context.
+        If on_event is given, it is called with {'sql_query': ...} as soon as the SQL is known
+        (before it runs) and with {'chunk': ...} for each piece of the answer as the LLM streams it.
+        {'reset': True} means the chunks sent so far are void - the stream failed and the answer
+        that follows replaces them
+        """
         start_time = time.time()
         
         try:
@@ -533,26 +905,21 @@ class EnhancedKabaddiAgent:
             output_tokens = 0
             
             # Check cache first for SQL query
-            cached_sql = query_cache.get_sql(user_input)
+            sql_key = generate_cache_key(user_input)
+            cached_sql = query_cache.get_sql_by_key(sql_key)
             if cached_sql:
                 sql_result = {"query": cached_sql, "raw_query": cached_sql, "cached": True}
             else:
                 # Calculate tokens for optimized prompt
-                optimized_prompt_str = optimize_prompt_tokens(
-                    SYSTEM_PROMPT_TEMPLATE.format(
-                        input=user_input, 
-                        table_info=self.table_details
-                    ),
-                    self.table_details
-                )
-                enc = tiktoken.get_encoding("cl100k_base")
-                input_tokens = len(enc.encode(optimized_prompt_str))
+                optimized_prompt_str = self.build_sql_prompt(user_input)
+                input_tokens = len(_ENC.encode(optimized_prompt_str))
                 
                 # Generate SQL query with session context
                 sql_result = self.generate_sql_with_caching(user_input, session_memory)
                 
-                # Cache the SQL query
-                query_cache.set_sql(user_input, sql_result["query"])
+                # Cache the SQL query unless it is an error query or still failed validation
+                if sql_result["cacheable"]:
+                    query_cache.set_sql_by_key(sql_key, sql_result["query"], user_input)
                 
                 print_sql({
                     "raw_query": sql_result["raw_query"], 
@@ -560,22 +927,33 @@ class EnhancedKabaddiAgent:
                     "question": user_input
                 })
             
+            # Streaming clients can show the SQL while the database is still running it
+            if on_event:
+                on_event({'sql_query': sql_result["query"]})
+            
             # Check cache for query result
-            cached_result = query_cache.get_result(sql_result["query"])
+            result_key = generate_cache_key(sql_result["query"])
+            cached_result = query_cache.get_result_by_key(result_key)
             if cached_result:
                 query_result = cached_result
             else:
                 # Execute query
                 query_result = self.execute_with_caching(sql_result["query"])
+                if not isinstance(query_result, str):
+                    query_result = str(query_result)
                 
                 # Normalize skills in textual results if techniques are involved
                 try:
-                    query_result = normalize_skills_in_result(sql_result["query"], str(query_result))
+                    query_result = normalize_skills_in_result(sql_result["query"], query_result)
                 except Exception:
                     pass
 
                 # Cache the query result
-                query_cache.set_result(sql_result["query"], query_result)
+                query_cache.set_result_by_key(result_key, query_result)
+            
+            # Near-duplicate questions reuse the SQL only once the database has accepted it
+            if sql_result.get("prompt_cache_key") and not query_result.startswith("Error:"):
+                prompt_cache.set(*sql_result["prompt_cache_key"], sql_result["query"])
             
             # Format answer without timeout protection to prevent hanging
             suggestions = []
@@ -600,43 +978,55 @@ class EnhancedKabaddiAgent:
                     "What are the top raiders by total points?",
                     "Which teams have won the most matches?"
                 ]
-            elif not query_result.strip():
-                # Empty result - this could mean no data found for the specific query
-                # but data exists in the database, so we should provide a more helpful response
-                response = "No data found matching your specific criteria. The database contains data, but your query returned no results. Please try rephrasing your question or using different search terms."
+            elif query_result.strip() in ("", "[]"):
+                # No rows: the reply is fixed, so the answer LLM is skipped
+                response = EMPTY_RESULT_MSG
                 
                 # Add suggestions for similar player names
                 enhancement = enhance_query_with_corrections(user_input, query_result)
                 suggestions = enhancement.get("suggestions", [])
                 if suggestions:
                     response += "\n\n" + "\n".join(suggestions)
+            elif (scalar_answer := format_scalar_answer(sql_result["query"], query_result)):
+                # A single number is restated in Python; the answer LLM is only needed for tables
+                response = scalar_answer
             else:
+                answer_prompt = render_answer(user_input, sql_result["query"], query_result)
                 try:
-                    response = self.rephrase_answer.invoke({
-                        "question": user_input,
-                        "query": sql_result["query"],
-                        "result": query_result
-                    })
+                    if on_event:
+                        # Forward the answer as the LLM produces it instead of after the last token
+                        parts = []
+                        for chunk in self.rephrase_answer.stream(answer_prompt):
+                            parts.append(chunk)
+                            on_event({'chunk': chunk})
+                        response = "".join(parts)
+                    else:
+                        response = self.rephrase_answer.invoke(answer_prompt)
                 except Exception as e:
                     # Fallback to simple formatting
                     response = f"Here are the results for your query:\n\n{query_result}"
+                    if on_event:
+                        if parts:
+                            # The stream died mid-answer; clients drop the partial text before the fallback
+                            on_event({'reset': True})
+                        on_event({'chunk': response})
             
             # Calculate metrics
             end_time = time.time()
             total_time = end_time - start_time
-            enc = tiktoken.get_encoding("cl100k_base")
-            output_tokens = len(enc.encode(str(response)))
+            output_tokens = len(_ENC.encode(str(response)))
             total_tokens = input_tokens + output_tokens
             
             # Record this conversation turn in session memory
             if session_memory:
                 try:
                     # Enhanced conversation memory with ConversationTurn
+                    result_preview = query_result if len(query_result) <= 500 else f"{query_result[:500]}..."
                     turn = ConversationTurn(
                         timestamp=time.time(),
                         user_question=user_input,
                         sql_query=sql_result["query"],
-                        sql_result=query_result[:500] + "..." if len(query_result) > 500 else query_result,
+                        sql_result=result_preview,
                         ai_response=response,
                         tokens_used=total_tokens,
                         response_time=total_time
@@ -656,7 +1046,7 @@ class EnhancedKabaddiAgent:
                         cache_hit=False,
                         error=None
                     )
-                    performance_monitor.record_metric(metric)
+                    enqueue_record(performance_monitor.record_metric, metric)
                 except Exception as e:
                     pass
             
@@ -687,7 +1077,7 @@ class EnhancedKabaddiAgent:
                         cache_hit=False,
                         error=str(e)
                     )
-                    performance_monitor.record_metric(metric)
+                    enqueue_record(performance_monitor.record_metric, metric)
                 except Exception as metric_error:
                     pass
             
@@ -715,36 +1105,17 @@ def setup_api_routes(app: FastAPI):
             uptime=time.time() - api_start_time
         )
 
-    @app.post("/chat", response_model=ChatResponse)
-    async def chat_endpoint(request: Request, authorization: Optional[str] = Header(None)):
-        """Main chat endpoint for processing user questions"""
-        try:
-            # Get raw body first
-            body = await request.body()
-            
-            # Try to parse as JSON
-            try:
-                data = json.loads(body)
-            except json.JSONDecodeError as e:
-                raise HTTPException(status_code=400, detail="Invalid JSON")
-            
-            # Create ChatRequest object
-            chat_request = ChatRequest(**data)
-        except Exception as e:
-            raise HTTPException(status_code=422, detail=f"Invalid request format: {str(e)}")
-        
-        # Use chat_request instead of request for the rest of the function
-        request = chat_request
-        
+    async def _handle_chat(request: ChatRequest, authorization: Optional[str]):
+        """Shared chat handling for /chat and /chat/raw once the body has been parsed"""
         # Check user authentication and chat limits
         user_id = None
         if authorization:
             try:
-                token = authorization.replace("Bearer ", "")
-                user_id = user_db.verify_jwt_token(token)
+                token = authorization[BEARER_PREFIX_LEN:] if authorization.startswith(BEARER_PREFIX) else authorization
+                user_id = verify_jwt_token_cached(token)
                 if user_id:
                     # Check if user can chat (free trial limit)
-                    chat_limit_result = user_db.can_user_chat(user_id)
+                    chat_limit_result = can_user_chat_cached(user_id)
                     if not chat_limit_result["can_chat"]:
                         raise HTTPException(
                             status_code=403, 
@@ -761,103 +1132,70 @@ def setup_api_routes(app: FastAPI):
             # Generate chat_id if not provided
             chat_id = request.chat_id
             if not chat_id:
-                chat_id = f"session_{int(time.time() * 1000)}"
+                chat_id = f"s_{time.time_ns():x}_{next(_session_ctr):x}"
                 
             # Process the question using the enhanced agent with session context
-            result = enhanced_agent.process_question(request.message, chat_id)
+            # (runs in a worker thread so tokenization and LLM/DB calls don't block the event loop)
+            async with work_semaphore:
+                result = await asyncio.to_thread(enhanced_agent.process_question, request.message, chat_id)
             
             if result['success']:
                 # Get AI suggestions for follow-up questions and player name corrections
-                suggestions = result.get('suggestions', [])  # Get suggestions from player name matcher
-                try:
-                    if hasattr(enhanced_agent, 'ai_question_suggester') and enhanced_agent.ai_question_suggester:
-                        ai_suggestions = enhanced_agent.ai_question_suggester.get_follow_up_suggestions(
-                            result['response'], 
-                            enhanced_agent.conversation_memory if hasattr(enhanced_agent, 'conversation_memory') else None
-                        )
-                        suggestions.extend(ai_suggestions)
-                    else:
-                        ai_suggestions = ai_question_suggester.get_follow_up_suggestions(result['response'])
-                        suggestions.extend(ai_suggestions)
-                except Exception as e:
-                    suggestions.extend([
-                        "Show more detailed statistics",
-                        "Compare with other teams",
-                        "Analyze by time period"
-                    ])
-                
-                # Record metrics
-                total_tokens = result.get('input_tokens', 0) + result.get('output_tokens', 0)
-                if hasattr(performance_monitor, 'record_metric'):
+                matcher_suggestions = result.get('suggestions') or []  # Get suggestions from player name matcher
+                caps = app.state.caps
+                ai_suggestions = ()
+                # Only ask for follow-ups if the name matcher hasn't already filled every slot
+                if request.want_suggestions and len(matcher_suggestions) < MAX_CHAT_SUGGESTIONS:
                     try:
-                        # Create a PerformanceMetric object for the enhanced monitor
-                        if hasattr(PerformanceMetric, '__init__'):
-                            metric = PerformanceMetric(
-                                timestamp=time.time(),
-                                operation="chat_query",
-                                duration=result['total_time'],
-                                tokens_used=total_tokens,
-                                cache_hit=False,
-                                error=None
-                            )
-                            performance_monitor.record_metric(metric)
-                        else:
-                            # Use simple monitor method signature
-                            try:
-                                metric = PerformanceMetric(
-                                    timestamp=time.time(),
-                                    operation="chat_query",
-                                    duration=result['total_time'],
-                                    tokens_used=total_tokens,
-                                    cache_hit=False,
-                                    error=None
+                        # Identical responses (common for canned questions) in the same session state reuse their follow-ups
+                        memory = session_manager.get_or_create_session(chat_id)
+                        follow_up_key = (hashlib.sha1(result['response'].encode()).digest(), chat_id, memory.version)
+                        ai_suggestions = follow_up_cache.get(follow_up_key)
+                        if ai_suggestions is None:
+                            if caps.has_ai_suggester:
+                                ai_suggestions = enhanced_agent.ai_question_suggester.get_follow_up_suggestions(
+                                    result['response'], 
+                                    memory
                                 )
-                                performance_monitor.record_metric(metric)
-                            except Exception as metric_error:
-                                # Fallback to simple monitor
-                                if hasattr(performance_monitor, 'record_metric'):
-                                    try:
-                                        performance_monitor.record_metric(result['total_time'], total_tokens, True)
-                                    except Exception as e:
-                                        pass
+                            else:
+                                ai_suggestions = ai_question_suggester.get_follow_up_suggestions(result['response'])
+                            follow_up_cache.set(follow_up_key, ai_suggestions)
                     except Exception as e:
-                        # Use simple monitor fallback
-                        if hasattr(performance_monitor, 'metrics'):
-                            performance_monitor.metrics.append({
-                                'duration': result['total_time'],
-                                'tokens': total_tokens,
-                                'success': True,
-                                'timestamp': time.time()
-                            })
+                        ai_suggestions = FALLBACK_FOLLOW_UP_SUGGESTIONS
+                suggestions = take_suggestions(matcher_suggestions, ai_suggestions or ()) if request.want_suggestions else []
+                
+                # Record metrics
+                total_tokens = result.get('input_tokens', 0) + result.get('output_tokens', 0)
+                try:
+                    caps.record_chat_metric(result['total_time'], total_tokens)
+                except Exception as e:
+                    pass
                 
                 # Get session-specific memory for suggestions
                 session_memory = session_manager.get_or_create_session(chat_id)
                 
                 # Persist chat turn and increment chat count for authenticated users
                 if user_id:
+                    # The count is committed before responding; only the history INSERT is batched
                     try:
-                        # Save chat to DB
-                        user_db.save_chat_turn(
-                            user_id=user_id,
-                            chat_id=chat_id,
-                            question=request.message,
-                            response=result['response'],
-                            sql_query=result.get('sql_query') or "",
-                            tokens_used=(result.get('input_tokens', 0) + result.get('output_tokens', 0))
-                        )
-                    except Exception as e:
-                        pass
-                    try:
-                        user_db.increment_chat_count(user_id)
+                        await asyncio.to_thread(increment_chat_count, user_id)
                     except Exception as e:
-                        pass
+                        print(f"⚠️ Could not update chat count: {e}")
+                    await enqueue_chat_write((
+                        user_id,
+                        chat_id,
+                        request.message,
+                        result['response'],
+                        result.get('sql_query') or "",
+                        result.get('input_tokens', 0) + result.get('output_tokens', 0)
+                    ))
                 
                 response_data = {
                     'response': result['response'],
                     'sql_query': result.get('sql_query'),
                     'success': True,
                     'response_time': result['total_time'],
-                    'suggestions': suggestions[:3],  # Limit to 3 suggestions
+                    'suggestions': suggestions,
                     'chat_id': chat_id
                 }
                 return ChatResponse(**response_data)
@@ -874,27 +1212,15 @@ def setup_api_routes(app: FastAPI):
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    @app.post("/chat", response_model=ChatResponse)
+    async def chat_endpoint(request: Request, authorization: Optional[str] = Header(None)):
+        """Main chat endpoint for processing user questions"""
+        return await _handle_chat(await parse_chat_request(request), authorization)
+
     @app.post("/chat/raw")
     async def chat_endpoint_raw(request: Request, authorization: Optional[str] = Header(None)):
         """Alternative chat endpoint that handles raw JSON body"""
-        try:
-            # Get raw body
-            body = await request.body()
-            
-            # Parse JSON
-            try:
-                data = json.loads(body)
-            except json.JSONDecodeError as e:
-                raise HTTPException(status_code=400, detail="Invalid JSON")
-            
-            # Create ChatRequest object
-            chat_request = ChatRequest(**data)
-            
-            # Call the main chat endpoint
-            return await chat_endpoint(chat_request, authorization)
-            
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+        return await _handle_chat(await parse_chat_request(request), authorization)
 
     @app.post("/chat/stream")
     async def chat_stream_endpoint(request: ChatRequest):
@@ -907,46 +1233,84 @@ def setup_api_routes(app: FastAPI):
                 # Generate chat_id if not provided
                 chat_id = request.chat_id
                 if not chat_id:
-                    chat_id = f"session_{int(time.time() * 1000)}"
+                    chat_id = f"s_{time.time_ns():x}_{next(_session_ctr):x}"
                 
                 # Send initial status
-                yield f"data: {json.dumps({'status': 'processing', 'chat_id': chat_id})}\n\n"
+                yield SSE_PREFIX + orjson.dumps({'status': 'processing', 'chat_id': chat_id}) + SSE_SUFFIX
+                
+                # chat_id is fixed for the stream, so only the chunk text is encoded per frame
+                chunk_tail = b',"chat_id":' + orjson.dumps(chat_id) + b'}' + SSE_SUFFIX
+                
+                # Process the question off the event loop; the worker hands the SQL and answer
+                # chunks over as they are produced, and None once it has finished
+                loop = asyncio.get_running_loop()
+                events = asyncio.Queue()
                 
-                # Process the question
-                result = enhanced_agent.process_question(request.message, chat_id)
+                def on_event(event):
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+                
+                def run_question():
+                    try:
+                        return enhanced_agent.process_question(request.message, chat_id, on_event)
+                    finally:
+                        on_event(None)
+                
+                async def run_limited():
+                    # The permit covers the worker thread only, not the time the client takes to read the stream
+                    async with work_semaphore:
+                        return await asyncio.to_thread(run_question)
+                
+                sql_sent = False
+                answer_streamed = False
+                worker = asyncio.create_task(run_limited())
+                try:
+                    while (event := await events.get()) is not None:
+                        if 'chunk' in event:
+                            answer_streamed = True
+                            yield b"".join((SSE_CHUNK_HEAD, orjson.dumps(event['chunk']), chunk_tail))
+                        elif 'reset' in event:
+                            # Discard the answer chunks received so far; a replacement answer follows
+                            yield SSE_PREFIX + orjson.dumps({'status': 'reset', 'chat_id': chat_id}) + SSE_SUFFIX
+                        else:
+                            sql_sent = True
+                            yield SSE_PREFIX + orjson.dumps({'sql_query': event['sql_query'], 'chat_id': chat_id}) + SSE_SUFFIX
+                finally:
+                    # The thread can't be stopped on disconnect, so wait for it; asyncio.wait never
+                    # cancels the worker, so its permit stays held until the thread is done
+                    await asyncio.wait((worker,))
+                result = worker.result()
                 
                 if result['success']:
-                    # Send SQL query first
-                    yield f"data: {json.dumps({'sql_query': result.get('sql_query'), 'chat_id': chat_id})}\n\n"
+                    if not sql_sent:
+                        yield SSE_PREFIX + orjson.dumps({'sql_query': result.get('sql_query'), 'chat_id': chat_id}) + SSE_SUFFIX
                     
-                    # Send response in chunks for streaming
-                    response = result['response']
-                    chunk_size = 100
-                    for i in range(0, len(response), chunk_size):
-                        chunk = response[i:i + chunk_size]
-                        yield f"data: {json.dumps({'chunk': chunk, 'chat_id': chat_id})}\n\n"
-                        await asyncio.sleep(0.01)  # Small delay for smooth streaming
+                    # Responses that didn't come from the LLM (greetings, errors, empty results) are sent in chunks
+                    if not answer_streamed:
+                        response = result['response']
+                        for i in range(0, len(response), SSE_CHUNK_SIZE):
+                            yield b"".join((SSE_CHUNK_HEAD, orjson.dumps(response[i:i + SSE_CHUNK_SIZE]), chunk_tail))
                     
                     # Send final status
-                    yield f"data: {json.dumps({'status': 'complete', 'response_time': result['total_time'], 'chat_id': chat_id})}\n\n"
+                    yield SSE_PREFIX + orjson.dumps({'status': 'complete', 'response_time': result['total_time'], 'chat_id': chat_id}) + SSE_SUFFIX
                 else:
-                    yield f"data: {json.dumps({'error': result.get('error', 'Unknown error'), 'chat_id': chat_id})}\n\n"
+                    yield SSE_PREFIX + orjson.dumps({'error': result.get('error', 'Unknown error'), 'chat_id': chat_id}) + SSE_SUFFIX
                     
             except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                yield SSE_PREFIX + orjson.dumps({'error': str(e)}) + SSE_SUFFIX
         
         return StreamingResponse(
             generate_stream(),
-            media_type="text/plain",
-            headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
         )
 
     @app.get("/suggestions")
     async def get_suggestions(request: Request):
         """Get AI-generated question suggestions.
 
-        Optional query parameter:
+        Optional query parameters:
         - team: str -> if provided, generate team-focused suggestions
+        - chat_id: str -> if provided, suggestions follow that chat session's history
         """
         if not enhanced_agent:
             raise HTTPException(status_code=500, detail="Agent not initialized")
@@ -959,13 +1323,23 @@ def setup_api_routes(app: FastAPI):
             except Exception:
                 team = None
             
+            # Serve a recent answer for the same team and conversation state if we have one
+            caps = app.state.caps
+            # An unknown chat_id gets the session-free suggestions; a GET must not create sessions
+            chat_id = request.query_params.get("chat_id") or ""
+            memory = session_manager.get_session(chat_id) if chat_id else None
+            cache_key = (team or "", chat_id if memory is not None else "", getattr(memory, 'version', 0))
+            cached_body = suggestions_cache.get(cache_key)
+            if cached_body is not None:
+                return Response(content=cached_body, media_type="application/json")
+            
             # Get suggestions from the AI suggester
             suggestions = []
-            if hasattr(enhanced_agent, 'ai_question_suggester') and enhanced_agent.ai_question_suggester:
+            if caps.has_ai_suggester:
                 try:
                     suggestions = enhanced_agent.ai_question_suggester.get_suggestions(
                         6,
-                        enhanced_agent.conversation_memory if hasattr(enhanced_agent, 'conversation_memory') else None,
+                        memory,
                         query_cache,
                         team=team
                     )
@@ -973,7 +1347,7 @@ def setup_api_routes(app: FastAPI):
                     # Backward compatibility for suggesters without team param
                     suggestions = enhanced_agent.ai_question_suggester.get_suggestions(
                         6,
-                        enhanced_agent.conversation_memory if hasattr(enhanced_agent, 'conversation_memory') else None,
+                        memory,
                         query_cache
                     )
             else:
@@ -983,21 +1357,14 @@ def setup_api_routes(app: FastAPI):
                 except TypeError:
                     suggestions = ai_question_suggester.get_suggestions(6, None, query_cache)
             
-            return {"suggestions": suggestions}
+            body = orjson.dumps({"suggestions": suggestions})
+            suggestions_cache.set(cache_key, body)
+            return Response(content=body, media_type="application/json")
             
         except Exception as e:
             print(f"Error getting suggestions: {e}")
             # Return fallback suggestions
-            return {
-                "suggestions": [
-                    "Show me the top raiders with most successful raids",
-                    "How many points did Bengaluru Bulls score this season?",
-                    "Show me all raids by Pawan Sehrawat",
-                    "Compare raid success rates between TT and BB teams",
-                    "List all do-or-die raids in the season",
-                    "Show me super tackle opportunities by team"
-                ]
-            }
+            return Response(content=_FALLBACK_SUGGESTIONS_BODY, media_type="application/json")
 
     @app.get("/stats")
     async def get_performance_stats():
@@ -1027,17 +1394,8 @@ def setup_api_routes(app: FastAPI):
             
         except Exception as e:
             print(f"Error getting stats: {e}")
-            return {
-                "performance": {"avg_time": 0, "success_rate": 1.0},
-                "session": {"total_questions": 0},
-                "cache": {"hit_rate": 0, "total_queries": 0},
-                "uptime": time.time() - api_start_time,
-                "optimization_settings": {
-                    "max_concurrent_requests": MAX_CONCURRENT_REQUESTS,
-                    "cache_preload_enabled": CACHE_PRELOAD_ENABLED,
-                    "streaming_enabled": STREAMING_ENABLED
-                }
-            }
+            body = _STATS_FALLBACK_HEAD + orjson.dumps(time.time() - api_start_time) + b"}"
+            return Response(content=body, media_type="application/json")
 
     @app.post("/summary", response_model=SummaryResponse)
     async def get_summary(request: SummaryRequest):
@@ -1068,39 +1426,27 @@ def setup_api_routes(app: FastAPI):
             
             # Generate summary using LLM with better error handling
             try:
-                summary_prompt = PromptTemplate.from_template("""
-                    You are a helpful assistant that summarizes conversations.
-                    Please summarize the following conversation history and session statistics.
-                    Conversation History:
-                    {conversation_history}
-                    Session Statistics:
-                    {session_stats}
-                    Provide a concise summary of the key points discussed and the overall context.
-                """)
-                
-                summary_llm = get_llm()
-                summary_response = summary_llm.invoke(summary_prompt.format(
-                    conversation_history=conversation_history,
-                    session_stats=json.dumps(session_stats, indent=2)
-                ))
-                
-                # Extract summary text
-                summary_text = summary_response.content if hasattr(summary_response, 'content') else str(summary_response)
+                summary_llm = get_summary_llm()
                 
-                # Generate conversation highlights
-                highlights_prompt = PromptTemplate.from_template("""
-                    Based on the conversation history below, provide 3-5 key highlights or insights:
-                    {conversation_history}
-                    
-                    Return only the highlights, one per line, without numbering or bullet points.
-                """)
+                async def invoke_llm(prompt):
+                    async with work_semaphore:
+                        return await asyncio.to_thread(summary_llm.invoke, prompt)
                 
-                highlights_response = summary_llm.invoke(highlights_prompt.format(
-                    conversation_history=conversation_history
-                ))
+                # Summary and highlights are independent, so request both at once
+                summary_response, highlights_response = await asyncio.gather(
+                    invoke_llm(_SUMMARY_PROMPT.format(
+                        conversation_history=conversation_history,
+                        session_stats=json.dumps(session_stats, indent=2)
+                    )),
+                    invoke_llm(_HIGHLIGHTS_PROMPT.format(
+                        conversation_history=conversation_history
+                    ))
+                )
                 
+                # Extract summary and highlights text
+                summary_text = summary_response.content if hasattr(summary_response, 'content') else str(summary_response)
                 highlights_text = highlights_response.content if hasattr(highlights_response, 'content') else str(highlights_response)
-                conversation_highlights = [line.strip() for line in highlights_text.split('\n') if line.strip()]
+                conversation_highlights = [stripped for line in highlights_text.splitlines() if (stripped := line.strip())]
                 
                 return SummaryResponse(
                     summary=summary_text,
@@ -1154,6 +1500,39 @@ def setup_api_routes(app: FastAPI):
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+def select_chat_metric_recorder():
+    """Pick how /chat records its metric once at startup.
+
+    The enhanced monitor takes values directly (written straight into its ring buffer); a simple
+    monitor only exposes a list of dicts. Returns a callable(duration, tokens).
+    """
+    if hasattr(performance_monitor, 'record_values'):
+        return lambda duration, tokens: performance_monitor.record_values("chat_query", duration, tokens)
+    
+    def append_simple_metric(duration, tokens):
+        performance_monitor.metrics.append({
+            'duration': duration,
+            'tokens': tokens,
+            'success': True,
+            'timestamp': time.time()
+        })
+    return append_simple_metric
+
+@functools.lru_cache(maxsize=1)
+def get_allowed_origins() -> frozenset:
+    """CORS origins for non-debug mode (built once; duplicates collapse)"""
+    allowed_origins = {
+        "http://localhost:3000",
+        "http://127.0.0.1:3000",
+        "http://localhost:3001",
+        "http://192.168.1.107:3000",
+        "http://192.168.1.107:3001"
+    }
+    configured_origin = os.getenv("FRONTEND_ORIGIN")
+    if configured_origin:
+        allowed_origins.add(configured_origin)
+    return frozenset(allowed_origins)
+
 # Create FastAPI app at module level for uvicorn
 def create_app():
     """Create and configure FastAPI application"""
@@ -1161,38 +1540,42 @@ def create_app():
     @asynccontextmanager
     async def lifespan(app: FastAPI):
         # Startup
-        global enhanced_agent, session_manager
+        global enhanced_agent, session_manager, chat_write_queue
         enhanced_agent = EnhancedKabaddiAgent()
         enhanced_agent.initialize()
+        # Capabilities are fixed after startup, so probe them once instead of per request
+        app.state.caps = SimpleNamespace(
+            has_ai_suggester=bool(getattr(enhanced_agent, 'ai_question_suggester', None)),
+            record_chat_metric=select_chat_metric_recorder()
+        )
         session_manager = SessionManager()  # Ensure session manager is initialized
+        start_record_worker()
+        chat_write_queue = asyncio.Queue()
+        chat_writer_task = asyncio.create_task(_chat_writer_loop())
         
         yield
+        
+        # Shutdown - the sentinel queues behind every pending chat turn, so awaiting the
+        # writer flushes the batch it holds and everything still in the queue
+        chat_write_queue.put_nowait(CHAT_WRITE_STOP)
+        await chat_writer_task
+        chat_write_queue = None
 
     # Create FastAPI app
     app = FastAPI(
         title="KabaddiGuru Analytics API",
         description="Enhanced Chat API for KabaddiGuru data analysis",
         version="1.0.0",
+        default_response_class=ORJSONResponse,
         lifespan=lifespan
     )
 
     # Add CORS middleware
     debug_mode = str(os.getenv("DEBUG", "False")).lower() == "true"
-    configured_origin = os.getenv("FRONTEND_ORIGIN")
-    allowed_origins = [
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-        "http://localhost:3001",
-        "http://192.168.1.107:3000",
-        "http://192.168.1.107:3001"
-    ]
-    if configured_origin:
-        allowed_origins.append(configured_origin)
-
     if debug_mode:
+        # The catch-all regex already admits every origin, so no explicit list is needed
         app.add_middleware(
             CORSMiddleware,
-            allow_origins=allowed_origins,
             allow_origin_regex=".*",
             allow_credentials=True,
             allow_methods=["*"],
@@ -1201,7 +1584,7 @@ def create_app():
     else:
         app.add_middleware(
             CORSMiddleware,
-            allow_origins=allowed_origins,
+            allow_origins=get_allowed_origins(),
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
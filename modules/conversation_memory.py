@@ -2,13 +2,15 @@
 Conversation Memory Module
 Handles chat history, context preservation, and question rephrasing
 """
-import json
+import orjson
+import re
 import time
 from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
 from collections import deque
+from itertools import islice
 
-@dataclass
+@dataclass(slots=True)
 class ConversationTurn:
     """Represents a single conversation turn"""
     timestamp: float
@@ -19,6 +21,42 @@ class ConversationTurn:
     tokens_used: int
     response_time: float
     user_feedback: Optional[str] = None
+    entities: Dict[str, List[str]] = field(default_factory=dict)  # Filled in by ConversationMemory.add_turn
+
+# Team abbreviations
+TEAM_CODES = ('BW', 'BB', 'DD', 'GG', 'HS', 'JP', 'PP', 'PU', 'TN', 'TT', 'UM', 'UP')
+
+# Common kabaddi terms
+POSITIONS = ('raider', 'defender', 'left', 'right', 'corner', 'cover', 'middle')
+ACTIONS = ('raid', 'tackle', 'bonus', 'super tackle', 'all out', 'successful', 'unsuccessful')
+
+FOLLOW_UP_INDICATORS = (
+    'what about', 'how about', 'and', 'also', 'what if', 'can you',
+    'show me', 'tell me', 'what are', 'which', 'who', 'when',
+    'they', 'them', 'that team', 'those players', 'this', 'these'
+)
+
+def _alternation(terms) -> str:
+    """Escaped regex alternation of terms, longest first so phrases win over their prefixes"""
+    return '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+
+def _word_pattern(terms) -> re.Pattern:
+    """Compile terms into one word-bounded, case-insensitive alternation"""
+    return re.compile(r'\b(' + _alternation(terms) + r')\b', re.IGNORECASE)
+
+# Teams, positions and actions in a single scan; the named group that matched gives the entity type
+ENTITY_RE = re.compile(
+    r'\b(?:(?P<teams>' + _alternation(TEAM_CODES) + r')'
+    r'|(?P<positions>' + _alternation(POSITIONS) + r')'
+    r'|(?P<actions>' + _alternation(ACTIONS) + r'))\b',
+    re.IGNORECASE
+)
+FOLLOW_UP_RE = _word_pattern(FOLLOW_UP_INDICATORS)
+
+# Pronouns substituted when rephrasing follow-ups
+TEAM_PRONOUNS = ('they', 'them', 'that team')
+PLAYER_PRONOUNS = ('he', 'him', 'that player')
+PRONOUN_RE = _word_pattern(TEAM_PRONOUNS + PLAYER_PRONOUNS)
 
 class ConversationMemory:
     def __init__(self, max_history: int = 10):
@@ -26,19 +64,34 @@ class ConversationMemory:
         self.session_start = time.time()
         self.total_questions = 0
         self.total_tokens = 0
+        self.version = 0  # Bumped on every new turn so callers can key caches on it
         
     def add_turn(self, turn: ConversationTurn):
         """Add a conversation turn to memory"""
+        # Extract entities once per turn, before the turn is visible; get_last_entities only merges the stored results
+        found = {'teams': {}, 'positions': {}, 'actions': {}}
+        for match in ENTITY_RE.finditer(turn.user_question.lower()):
+            entity_type = match.lastgroup
+            value = match.group(entity_type)
+            found[entity_type][value.upper() if entity_type == 'teams' else value] = None
+        turn.entities = {entity_type: list(values) for entity_type, values in found.items()}
         self.history.append(turn)
         self.total_questions += 1
         self.total_tokens += turn.tokens_used
+        self.version += 1
+        
+    def get_recent_turns(self, num_turns: int) -> List[ConversationTurn]:
+        """Last num_turns turns, oldest first - walks only those turns instead of copying the deque"""
+        recent_turns = list(islice(reversed(self.history), num_turns))
+        recent_turns.reverse()
+        return recent_turns
         
     def get_recent_context(self, num_turns: int = 3) -> str:
         """Get recent conversation context for follow-up questions"""
         if not self.history:
             return ""
             
-        recent_turns = list(self.history)[-num_turns:]
+        recent_turns = self.get_recent_turns(num_turns)
         context_parts = []
         
         for turn in recent_turns:
@@ -59,29 +112,11 @@ class ConversationMemory:
         if not self.history:
             return entities
             
-        # Team abbreviations
-        team_codes = ['BW', 'BB', 'DD', 'GG', 'HS', 'JP', 'PP', 'PU', 'TN', 'TT', 'UM', 'UP']
-        
-        # Common kabaddi terms
-        positions = ['raider', 'defender', 'left', 'right', 'corner', 'cover', 'middle']
-        actions = ['raid', 'tackle', 'bonus', 'super tackle', 'all out', 'successful', 'unsuccessful']
-        
-        recent_text = " ".join([turn.user_question.lower() for turn in list(self.history)[-3:]])
-        
-        # Extract teams
-        for team in team_codes:
-            if team.lower() in recent_text:
-                entities['teams'].append(team)
-                
-        # Extract positions
-        for pos in positions:
-            if pos in recent_text:
-                entities['positions'].append(pos)
-                
-        # Extract actions
-        for action in actions:
-            if action in recent_text:
-                entities['actions'].append(action)
+        # Merge the entities stored on the last 3 turns, keeping first-seen order without duplicates
+        recent_turns = self.get_recent_turns(3)
+        for entity_type in ('teams', 'positions', 'actions'):
+            merged = dict.fromkeys(value for turn in recent_turns for value in turn.entities.get(entity_type, ()))
+            entities[entity_type] = list(merged)
                 
         return entities
     
@@ -90,14 +125,7 @@ class ConversationMemory:
         if not self.history:
             return False
             
-        follow_up_indicators = [
-            'what about', 'how about', 'and', 'also', 'what if', 'can you',
-            'show me', 'tell me', 'what are', 'which', 'who', 'when',
-            'they', 'them', 'that team', 'those players', 'this', 'these'
-        ]
-        
-        question_lower = question.lower()
-        return any(indicator in question_lower for indicator in follow_up_indicators)
+        return FOLLOW_UP_RE.search(question.lower()) is not None
     
     def rephrase_follow_up(self, question: str) -> str:
         """Rephrase follow-up questions into standalone questions"""
@@ -107,23 +135,21 @@ class ConversationMemory:
         context = self.get_recent_context(2)
         entities = self.get_last_entities()
         
-        # Simple rephrasing logic
-        rephrased = question
-        
         # Replace pronouns with entities from context
+        replacements = {}
         if entities['teams']:
-            latest_team = entities['teams'][-1]
-            rephrased = rephrased.replace('they', f'team {latest_team}')
-            rephrased = rephrased.replace('them', f'team {latest_team}')
-            rephrased = rephrased.replace('that team', f'team {latest_team}')
+            latest_team = f"team {entities['teams'][-1]}"
+            replacements.update(dict.fromkeys(TEAM_PRONOUNS, latest_team))
             
         if entities['players']:
             latest_player = entities['players'][-1]
-            rephrased = rephrased.replace('he', latest_player)
-            rephrased = rephrased.replace('him', latest_player)
-            rephrased = rephrased.replace('that player', latest_player)
-            
-        return rephrased
+            replacements.update(dict.fromkeys(PLAYER_PRONOUNS, latest_player))
+        
+        if not replacements:
+            return question
+        
+        # Single word-bounded pass, so e.g. 'the' or 'theyre' are left alone
+        return PRONOUN_RE.sub(lambda m: replacements.get(m.group(1).lower(), m.group(0)), question)
     
     def get_session_stats(self) -> Dict[str, Any]:
         """Get session statistics"""
@@ -137,8 +163,19 @@ class ConversationMemory:
     
     def export_history(self) -> str:
         """Export conversation history as JSON"""
-        history_data = [asdict(turn) for turn in self.history]
-        return json.dumps(history_data, indent=2)
+        # Flat dicts built directly - asdict() deep-copies recursively, and the derived
+        # entities field isn't part of the exported history
+        history_data = [{
+            'timestamp': turn.timestamp,
+            'user_question': turn.user_question,
+            'sql_query': turn.sql_query,
+            'sql_result': turn.sql_result,
+            'ai_response': turn.ai_response,
+            'tokens_used': turn.tokens_used,
+            'response_time': turn.response_time,
+            'user_feedback': turn.user_feedback
+        } for turn in self.history]
+        return orjson.dumps(history_data, option=orjson.OPT_INDENT_2).decode()
     
     def add_feedback(self, feedback: str):
         """Add feedback to the last conversation turn"""
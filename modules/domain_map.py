@@ -0,0 +1,65 @@
+"""
+Domain Map Module
+Resolves simple count questions straight from the domain-aware mappings, without the LLM
+"""
+import re
+from typing import Dict, Optional
+
+# Natural-language filters from the prompt's Domain-Aware Mappings and the SQL condition each one means
+DOMAIN_MAPPINGS: Dict[str, str] = {
+    "defense of 3 or less": '"Super_Tackle_Opportunity" = 1',
+    "less than 4 defenders": '"Super_Tackle_Opportunity" = 1',
+    "super tackle chance": '"Super_Tackle_Opportunity" = 1',
+    "super tackle opportunity": '"Super_Tackle_Opportunity" = 1',
+    "regular defense": '"Super_Tackle_Opportunity" = 0',
+    # Underscores are LIKE wildcards, so escape them or '_LIN_' also matches '_RLIN_'
+    "left raider": '"Attacking_Player_Name" ILIKE \'%\\_LIN\\_%\' ESCAPE \'\\\'',
+    "right raider": '"Attacking_Player_Name" ILIKE \'%\\_RIN\\_%\' ESCAPE \'\\\'',
+    "successful raid": '"Attack_Result_Status" ILIKE \'Successful\'',
+    "unsuccessful raid": '"Attack_Result_Status" ILIKE \'Failed/Unsuccessful\'',
+    "failed raid": '"Attack_Result_Status" ILIKE \'Failed/Unsuccessful\'',
+    "bonus point available": '"Bonus_Point_Available" = 1',
+    "do-or-die raid": '"Do_Or_Die_Mandatory_Raid" = 1',
+    "successful defense": '"Defense_Result_Status" ILIKE \'Successful\'',
+    "unsuccessful defense": '"Defense_Result_Status" ILIKE \'Failed/Unsuccessful\'',
+    # Missing values in S_RBR are '' rather than NULL
+    "all out": '"Team_That_Eliminated_All_Opponents" <> \'\'',
+    "first half": '"Game_Half_Period" ILIKE \'FirstHalf\'',
+    "second half": '"Game_Half_Period" ILIKE \'SecondHalf\'',
+}
+
+QUANTITATIVE_RE = re.compile(r'\bhow many\b')
+# Every row is a raid, so COUNT(*) only answers questions that count raids or tackle chances
+COUNTED_NOUN_RE = re.compile(r'\b(raids?|tackles?)\b')
+# Longest phrase first, so e.g. 'unsuccessful raid' wins over 'successful raid'; plurals allowed
+MAPPING_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(phrase) for phrase in sorted(DOMAIN_MAPPINGS, key=len, reverse=True)) + r')(?:s|es)?\b'
+)
+# Everything else a templated question may contain; any other word (a player, team, metric...)
+# means the question needs the LLM
+TEMPLATE_FILLER_WORDS = frozenset((
+    'how', 'many', 'count', 'total', 'number', 'of', 'the', 'a', 'an', 'were', 'was', 'are',
+    'is', 'there', 'in', 'did', 'have', 'has', 'been', 'all', 'raid', 'raids', 'what', 'me',
+    'show', 'tell', 'give', 'please', 'by'
+))
+WORD_RE = re.compile(r"[a-z0-9'-]+")
+
+def try_template_sql(question: str) -> Optional[str]:
+    """
+    COUNT(*) query for questions like "how many super tackle chances were there" that are a
+    "how many ... raids/tackles" count over exactly one mapped filter. Returns None when the
+    LLM is needed (e.g. "how many left raiders are there" counts players, not raids).
+    """
+    text = question.lower()
+    if not QUANTITATIVE_RE.search(text) or not COUNTED_NOUN_RE.search(text):
+        return None
+
+    matches = MAPPING_RE.findall(text)
+    if len(matches) != 1:
+        return None
+
+    residual = MAPPING_RE.sub(' ', text)
+    if any(word not in TEMPLATE_FILLER_WORDS for word in WORD_RE.findall(residual)):
+        return None
+
+    return f'SELECT COUNT(*) FROM "S_RBR" WHERE {DOMAIN_MAPPINGS[matches[0]]};'
@@ -3,6 +3,7 @@ Enhanced Query caching module with advanced performance optimizations
 """
 import hashlib
 import json
+import re
 import pickle
 import gzip
 from functools import lru_cache
@@ -11,16 +12,123 @@ import time
 import threading
 from collections import OrderedDict
 
+# xxh3 is several times faster than BLAKE2b for short keys; fall back when it isn't installed
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Below this many characters gzip+pickle costs more CPU than the memory it saves
+COMPRESSION_MIN_SIZE = 2048
+
+# Cache timestamps are integer monotonic nanoseconds - immune to wall-clock jumps, no float churn
+NS_PER_SECOND = 1_000_000_000
+CACHE_ENTRY_TTL_NS = 1800 * NS_PER_SECOND  # 30 minutes (reduced from 1 hour)
+
+# Words ignored when tracking query patterns
+PATTERN_STOPWORDS = frozenset(('the', 'and', 'for', 'are', 'can', 'with', 'from', 'that'))
+
+@lru_cache(maxsize=1024)
+def generate_cache_key(query: str) -> int:
+    """Normalize and hash a question or SQL string into a 64-bit cache key.
+
+    Memoized on the raw string, so repeated lookups of the same text skip both the
+    normalization and the hash. Callers that do a get followed by a set can compute
+    the key once and use the *_by_key methods.
+    """
+    data = query.lower().strip().encode()
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(data)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+class CacheStore(OrderedDict):
+    """Size-bounded OrderedDict with counter-based (LFU) eviction.
+
+    Each entry carries a small hit counter (saturating at COUNTER_MAX, all counters halved
+    when one saturates so old popularity decays). When full, the entry with the fewest hits
+    is evicted, ties going to the least recently used - popular questions survive bursts of
+    one-off queries. Order is kept by recency for evict_oldest(); evict_expired() checks the
+    insertion time of every entry, since recency order says nothing about age.
+    Values are (inserted_at_ns, data) entries; nbytes tracks the total len() of their data.
+    """
+    COUNTER_MAX = 255
+    
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+        self.nbytes = 0
+        self.counters = {}
+    
+    def lookup(self, key):
+        """Return the entry for key (or None), counting the hit and marking it most recently used"""
+        entry = self.get(key)
+        if entry is not None:
+            self.move_to_end(key)
+            count = self.counters[key] + 1
+            if count >= self.COUNTER_MAX:
+                for counter_key in self.counters:
+                    self.counters[counter_key] >>= 1
+                count = self.COUNTER_MAX >> 1
+            self.counters[key] = count
+        return entry
+    
+    def store(self, key, value):
+        """Insert or replace an entry, evicting the least frequently used other entry if over capacity"""
+        previous = self.get(key)
+        if previous is not None:
+            self.nbytes -= len(previous[1])
+        self[key] = value
+        self.nbytes += len(value[1])
+        self.move_to_end(key)
+        self.counters.setdefault(key, 0)
+        if len(self) > self.max_size:
+            # Iteration runs least to most recently used, so min() breaks ties by recency
+            victim = min((k for k in self if k != key), key=self.counters.__getitem__)
+            self._drop(victim)
+    
+    def evict_oldest(self):
+        """Drop the least recently used entry"""
+        self._drop(next(iter(self)))
+    
+    def evict_expired(self, inserted_before_ns: int):
+        """Drop every entry inserted before the given monotonic timestamp"""
+        for key in [key for key, entry in self.items() if entry[0] < inserted_before_ns]:
+            self._drop(key)
+    
+    def _drop(self, key):
+        entry = self.pop(key)
+        self.counters.pop(key, None)
+        self.nbytes -= len(entry[1])
+    
+    def clear(self):
+        super().clear()
+        self.counters.clear()
+        self.nbytes = 0
+
+class CacheShard:
+    """One stripe of the query cache - its own SQL/result stores, counters and lock"""
+    __slots__ = ('lock', 'sql', 'result', 'hits', 'misses')
+    
+    def __init__(self, max_size: int):
+        self.lock = threading.Lock()
+        self.sql = CacheStore(max_size)
+        self.result = CacheStore(max_size)
+        self.hits = 0
+        self.misses = 0
+
 class EnhancedQueryCache:
+    # Power of two so a shard is picked with a mask of the key's low bits
+    SHARD_COUNT = 16
+    
     def __init__(self, max_size: int = 500, compression: bool = True):
-        self.sql_cache = OrderedDict()     # For SQL queries with LRU ordering
-        self.result_cache = OrderedDict()  # For query results with LRU ordering
+        # Keys are striped across shards so lookups on different keys don't contend for one lock.
+        # Values are (inserted_at_ns, data); OrderedDict order tracks recency, counters track popularity.
+        shard_size = max(1, -(-max_size // self.SHARD_COUNT))
+        self._shards = [CacheShard(shard_size) for _ in range(self.SHARD_COUNT)]
+        self._shard_mask = self.SHARD_COUNT - 1
         self.max_size = max_size
-        self.access_times = {}
         self.compression = compression
-        self.hit_count = 0
-        self.miss_count = 0
-        self.cache_lock = threading.RLock()  # Thread-safe operations
+        self.cache_lock = threading.RLock()  # Guards pattern tracking and cleanup bookkeeping
         
         # Advanced caching features
         self.frequent_patterns = {}  # Track frequent query patterns
@@ -32,17 +140,49 @@ class EnhancedQueryCache:
         
         # Performance optimizations
         self._cache_stats = {
-            'last_cleanup': time.time(),
-            'cleanup_interval': 300,  # 5 minutes
+            'last_cleanup': time.monotonic_ns(),
+            'cleanup_interval': 300 * NS_PER_SECOND,  # 5 minutes
             'max_memory_mb': 100      # Max memory usage in MB
         }
     
-    def _generate_key(self, query: str) -> str:
-        """Generate cache key from query"""
-        return hashlib.md5(query.lower().strip().encode()).hexdigest()
+    def _shard(self, key: int) -> CacheShard:
+        """Shard owning a key"""
+        return self._shards[key & self._shard_mask]
+    
+    @property
+    def sql_cache(self) -> Dict[int, Tuple[int, Any]]:
+        """Snapshot of all cached SQL entries across shards"""
+        merged = {}
+        for shard in self._shards:
+            with shard.lock:
+                merged.update(shard.sql)
+        return merged
+    
+    @property
+    def result_cache(self) -> Dict[int, Tuple[int, Any]]:
+        """Snapshot of all cached result entries across shards"""
+        merged = {}
+        for shard in self._shards:
+            with shard.lock:
+                merged.update(shard.result)
+        return merged
+    
+    @property
+    def hit_count(self) -> int:
+        return sum(shard.hits for shard in self._shards)
     
-    def _compress_data(self, data: Any) -> bytes:
-        """Compress data for storage efficiency"""
+    @property
+    def miss_count(self) -> int:
+        return sum(shard.misses for shard in self._shards)
+    
+    def _generate_key(self, query: str) -> int:
+        """Generate a 64-bit fingerprint cache key from query (stable across processes)"""
+        return generate_cache_key(query)
+    
+    def _compress_data(self, data: Any) -> Any:
+        """Compress data for storage efficiency (short strings are stored as-is)"""
+        if isinstance(data, str) and len(data) < COMPRESSION_MIN_SIZE:
+            return data
         if not self.compression:
             return pickle.dumps(data)
         return gzip.compress(pickle.dumps(data))
@@ -55,98 +195,90 @@ class EnhancedQueryCache:
     
     def _track_query_pattern(self, question: str):
         """Track query patterns for intelligent caching"""
-        # Extract pattern keywords
-        keywords = [word.lower() for word in question.split() 
-                   if len(word) > 2 and word.lower() not in ['the', 'and', 'for', 'are', 'can']]
-        pattern = "_".join(sorted(set(keywords))[:3])  # Top 3 unique keywords
+        # Extract pattern keywords - lowercase once, dedupe while filtering
+        keywords = sorted({word for word in question.lower().split()
+                           if len(word) > 2 and word not in PATTERN_STOPWORDS})
+        pattern = "_".join(keywords[:3])  # Top 3 unique keywords
         
-        self.frequent_patterns[pattern] = self.frequent_patterns.get(pattern, 0) + 1
+        with self.cache_lock:
+            self.frequent_patterns[pattern] = self.frequent_patterns.get(pattern, 0) + 1
     
     def _update_cache_analytics(self):
         """Update cache performance analytics"""
-        total_requests = self.hit_count + self.miss_count
+        hit_count = self.hit_count
+        total_requests = hit_count + self.miss_count
         if total_requests > 0:
-            self.query_analytics['cache_hit_rate'] = self.hit_count / total_requests
+            self.query_analytics['cache_hit_rate'] = hit_count / total_requests
             self.query_analytics['total_queries'] = total_requests
     
-    def _evict_lru(self, cache_type: str = 'sql'):
-        """Evict least recently used item using OrderedDict"""
-        target_cache = self.sql_cache if cache_type == 'sql' else self.result_cache
-        
-        if target_cache:
-            # OrderedDict FIFO - remove first (oldest) item
-            oldest_key, _ = target_cache.popitem(last=False)
-            
-            # Clean up access times if not in any cache
-            if oldest_key not in self.sql_cache and oldest_key not in self.result_cache:
-                self.access_times.pop(oldest_key, None)
-    
     def get_sql(self, question: str) -> Optional[str]:
         """Get cached SQL query for natural language question with analytics"""
-        with self.cache_lock:
-            # Periodic cleanup for memory management
-            self._periodic_cleanup()
-            
-            key = self._generate_key(question)
-            if key in self.sql_cache:
-                # Move to end (most recently used)
-                self.sql_cache.move_to_end(key)
-                self.access_times[key] = time.time()
-                self.hit_count += 1
-                self._update_cache_analytics()
-                
-                # Decompress if needed
-                cached_data = self.sql_cache[key]
-                if isinstance(cached_data, bytes):
-                    return self._decompress_data(cached_data)
-                return cached_data
-            
-            self.miss_count += 1
-            self._update_cache_analytics()
-            return None
+        return self.get_sql_by_key(self._generate_key(question))
+    
+    def get_sql_by_key(self, key: int) -> Optional[str]:
+        """Get cached SQL query for a key from generate_cache_key()"""
+        # Periodic cleanup for memory management
+        self._periodic_cleanup()
+        
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.sql.lookup(key)
+            if entry is None:
+                shard.misses += 1
+                return None
+            shard.hits += 1
+        
+        # Decompress if needed (outside the lock)
+        cached_data = entry[1]
+        if isinstance(cached_data, bytes):
+            return self._decompress_data(cached_data)
+        return cached_data
     
     def set_sql(self, question: str, sql_query: str) -> None:
         """Cache SQL query for natural language question with compression"""
-        with self.cache_lock:
-            if len(self.sql_cache) >= self.max_size:
-                self._evict_lru('sql')
-            
-            key = self._generate_key(question)
-            # Compress data if enabled
-            data_to_store = self._compress_data(sql_query) if self.compression else sql_query
-            self.sql_cache[key] = data_to_store
-            self.access_times[key] = time.time()
-            
-            # Track query patterns
+        self.set_sql_by_key(self._generate_key(question), sql_query, question)
+    
+    def set_sql_by_key(self, key: int, sql_query: str, question: Optional[str] = None) -> None:
+        """Cache SQL query under a key from generate_cache_key(); question is only used for pattern tracking"""
+        # Compress data if enabled
+        data_to_store = self._compress_data(sql_query) if self.compression else sql_query
+        shard = self._shard(key)
+        with shard.lock:
+            shard.sql.store(key, (time.monotonic_ns(), data_to_store))
+        
+        # Track query patterns
+        if question:
             self._track_query_pattern(question)
     
     def get_result(self, sql_query: str) -> Optional[str]:
-        """Get cached result for SQL query with LRU management"""
-        with self.cache_lock:
-            key = self._generate_key(sql_query)
-            if key in self.result_cache:
-                # Move to end (most recently used)
-                self.result_cache.move_to_end(key)
-                self.access_times[key] = time.time()
-                
-                # Decompress if needed
-                cached_data = self.result_cache[key]
-                if isinstance(cached_data, bytes):
-                    return self._decompress_data(cached_data)
-                return cached_data
+        """Get cached result for SQL query with hit counting"""
+        return self.get_result_by_key(self._generate_key(sql_query))
+    
+    def get_result_by_key(self, key: int) -> Optional[str]:
+        """Get cached result for a key from generate_cache_key()"""
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.result.lookup(key)
+        if entry is None:
             return None
+        
+        # Decompress if needed
+        cached_data = entry[1]
+        if isinstance(cached_data, bytes):
+            return self._decompress_data(cached_data)
+        return cached_data
     
     def set_result(self, sql_query: str, result: str) -> None:
         """Cache SQL query result with compression"""
-        with self.cache_lock:
-            if len(self.result_cache) >= self.max_size:
-                self._evict_lru('result')
-            
-            key = self._generate_key(sql_query)
-            # Compress large results
-            data_to_store = self._compress_data(result) if self.compression else result
-            self.result_cache[key] = data_to_store
-            self.access_times[key] = time.time()
+        self.set_result_by_key(self._generate_key(sql_query), result)
+    
+    def set_result_by_key(self, key: int, result: str) -> None:
+        """Cache SQL query result under a key from generate_cache_key()"""
+        # Compress large results
+        data_to_store = self._compress_data(result) if self.compression else result
+        shard = self._shard(key)
+        with shard.lock:
+            shard.result.store(key, (time.monotonic_ns(), data_to_store))
     
     def intelligent_preload(self, common_questions: list):
         """Preload cache with common questions and patterns"""
@@ -154,69 +286,69 @@ class EnhancedQueryCache:
             # This would need to be integrated with your SQL generation logic
             pass
     
+    def _total_size(self) -> int:
+        """Approximate size of all cached values across shards (tracked incrementally)"""
+        return sum(shard.sql.nbytes + shard.result.nbytes for shard in self._shards)
+    
     def get_cache_statistics(self) -> Dict[str, Any]:
         """Get detailed cache performance statistics"""
+        self._update_cache_analytics()
         with self.cache_lock:
-            total_size = sum(len(str(v)) for v in self.sql_cache.values()) + \
-                        sum(len(str(v)) for v in self.result_cache.values())
-            
-            return {
-                'sql_cache_size': len(self.sql_cache),
-                'result_cache_size': len(self.result_cache),
-                'hit_count': self.hit_count,
-                'miss_count': self.miss_count,
-                'hit_rate': self.query_analytics['cache_hit_rate'],
-                'total_memory_usage': total_size,
-                'frequent_patterns': dict(sorted(self.frequent_patterns.items(), 
-                                                key=lambda x: x[1], reverse=True)[:10]),
-                'compression_enabled': self.compression
-            }
+            frequent_patterns = dict(sorted(self.frequent_patterns.items(), 
+                                            key=lambda x: x[1], reverse=True)[:10])
+        
+        return {
+            'sql_cache_size': sum(len(shard.sql) for shard in self._shards),
+            'result_cache_size': sum(len(shard.result) for shard in self._shards),
+            'hit_count': self.hit_count,
+            'miss_count': self.miss_count,
+            'hit_rate': self.query_analytics['cache_hit_rate'],
+            'total_memory_usage': self._total_size(),
+            'frequent_patterns': frequent_patterns,
+            'compression_enabled': self.compression
+        }
     
     def clear_cache(self):
         """Clear all caches"""
-        with self.cache_lock:
-            self.sql_cache.clear()
-            self.result_cache.clear()
-            self.access_times.clear()
-            self.hit_count = 0
-            self.miss_count = 0
+        for shard in self._shards:
+            with shard.lock:
+                shard.sql.clear()
+                shard.result.clear()
+                shard.hits = 0
+                shard.misses = 0
     
     def _periodic_cleanup(self):
         """Periodic cleanup for memory management"""
-        current_time = time.time()
+        current_time = time.monotonic_ns()
         if current_time - self._cache_stats['last_cleanup'] > self._cache_stats['cleanup_interval']:
-            self.optimize_cache()
             self._cache_stats['last_cleanup'] = current_time
+            self.optimize_cache()
     
     def optimize_cache(self):
         """Optimize cache by removing old or infrequently accessed items"""
-        with self.cache_lock:
-            current_time = time.time()
-            old_threshold = current_time - 1800  # 30 minutes (reduced from 1 hour)
-            
-            # Remove old entries
-            old_keys = [key for key, access_time in self.access_times.items() 
-                       if access_time < old_threshold]
-            
-            for key in old_keys:
-                self.sql_cache.pop(key, None)
-                self.result_cache.pop(key, None)
-                self.access_times.pop(key, None)
-            
-            # Memory-based cleanup
-            total_size = sum(len(str(v)) for v in self.sql_cache.values()) + \
-                        sum(len(str(v)) for v in self.result_cache.values())
-            
-            if total_size > self._cache_stats['max_memory_mb'] * 1024 * 1024:  # Convert MB to bytes
-                # Remove least recently used items
-                while total_size > self._cache_stats['max_memory_mb'] * 1024 * 1024 * 0.8:  # Keep 80%
-                    if self.sql_cache:
-                        self.sql_cache.popitem(last=False)
-                    if self.result_cache:
-                        self.result_cache.popitem(last=False)
-                    
-                    total_size = sum(len(str(v)) for v in self.sql_cache.values()) + \
-                                sum(len(str(v)) for v in self.result_cache.values())
+        old_threshold = time.monotonic_ns() - CACHE_ENTRY_TTL_NS
+        
+        # Remove old entries - every entry is checked, because a recently used entry can be
+        # old and a stale one can sit behind it in recency order
+        for shard in self._shards:
+            with shard.lock:
+                shard.sql.evict_expired(old_threshold)
+                shard.result.evict_expired(old_threshold)
+        
+        # Memory-based cleanup
+        total_size = self._total_size()
+        
+        if total_size > self._cache_stats['max_memory_mb'] * 1024 * 1024:  # Convert MB to bytes
+            # Remove least recently used items, one from each shard per pass
+            while total_size > self._cache_stats['max_memory_mb'] * 1024 * 1024 * 0.8:  # Keep 80%
+                for shard in self._shards:
+                    with shard.lock:
+                        if shard.sql:
+                            shard.sql.evict_oldest()
+                        if shard.result:
+                            shard.result.evict_oldest()
+                
+                total_size = self._total_size()
 
 # Legacy support - keep the old class name working
 QueryCache = EnhancedQueryCache
@@ -224,34 +356,40 @@ QueryCache = EnhancedQueryCache
 # Enhanced cache instance with better defaults
 query_cache = EnhancedQueryCache(max_size=300, compression=True)
 
-@lru_cache(maxsize=20)
+# Structural schema lines that are always kept in the condensed summary
+SCHEMA_ESSENTIAL_RE = re.compile(r'Table:|CREATE TABLE|Column:|PRIMARY KEY|FOREIGN KEY')
+SCHEMA_SUMMARY_MAX_LINES = 40
+
+@lru_cache(maxsize=128)
 def get_table_schema_summary(full_schema: str) -> str:
     """
     Generate a condensed version of table schema to reduce token usage
     Enhanced with better summarization
     """
-    lines = full_schema.split('\n')
     summary_lines = []
     
-    essential_keywords = ['Table:', 'CREATE TABLE', 'Column:', 'PRIMARY KEY', 'FOREIGN KEY']
-    
-    for line in lines:
+    for line in full_schema.split('\n'):
         line = line.strip()
         
         # Keep essential structural information
-        if any(keyword in line for keyword in essential_keywords):
+        if SCHEMA_ESSENTIAL_RE.search(line):
             summary_lines.append(line)
         # Keep column definitions but make them concise
-        elif 'Column:' in line or line.startswith('Column'):
+        elif line.startswith('Column'):
             # Simplify column info - keep only name and type
             simplified = ' '.join(line.split()[:3])  
             summary_lines.append(simplified)
         # Keep short important lines
         elif line and not line.startswith(('/*', '--', '#')) and len(line) < 80:
             summary_lines.append(line)
+        else:
+            continue
+        
+        # Limit to most important lines - nothing past this point is used
+        if len(summary_lines) == SCHEMA_SUMMARY_MAX_LINES:
+            break
     
-    # Limit to most important lines
-    return '\n'.join(summary_lines[:40])
+    return '\n'.join(summary_lines)
 
 def optimize_prompt_tokens(prompt: str, table_info: str, max_tokens: int = 3000) -> str:
     """
@@ -281,7 +419,36 @@ def optimize_prompt_tokens(prompt: str, table_info: str, max_tokens: int = 3000)
         if current_section:
             important_sections.append('\n'.join(current_section))
         
-        # Keep most critical sections
-        optimized_prompt = '\n\n'.join(important_sections[:8])
+        # Keep most critical sections, rejoined with the newline they were split on so a prompt
+        # with no more than 8 sections (the versioned SQL prompt prefix) comes back byte-identical
+        optimized_prompt = '\n'.join(important_sections[:8])
     
     return optimized_prompt
+
+@lru_cache(maxsize=8)
+def get_prompt_skeleton(template: str, table_info: str, slots: Tuple[str, ...],
+                        max_tokens: int = 3000) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Render and optimize a prompt template once, leaving the per-request slots open.
+    Returns (literal_parts, slot_order) for render_prompt_skeleton; slots trimmed away
+    by optimize_prompt_tokens simply don't appear in slot_order.
+    """
+    markers = {slot: f"\x00{slot}\x00" for slot in slots}
+    # Plain replacement rather than str.format, so literal braces (JSON examples) can stay unescaped
+    rendered = template.replace("{table_info}", table_info)
+    for slot, marker in markers.items():
+        rendered = rendered.replace("{" + slot + "}", marker)
+    rendered = optimize_prompt_tokens(rendered, table_info, max_tokens)
+    
+    marker_slots = {marker: slot for slot, marker in markers.items()}
+    pieces = re.split('(' + '|'.join(re.escape(marker) for marker in markers.values()) + ')', rendered)
+    return tuple(pieces[0::2]), tuple(marker_slots[marker] for marker in pieces[1::2])
+
+def render_prompt_skeleton(skeleton: Tuple[Tuple[str, ...], Tuple[str, ...]], **values: str) -> str:
+    """Fill the open slots of a prompt skeleton from get_prompt_skeleton()"""
+    literal_parts, slot_order = skeleton
+    parts = [literal_parts[0]]
+    for slot, literal in zip(slot_order, literal_parts[1:]):
+        parts.append(values[slot])
+        parts.append(literal)
+    return "".join(parts)
@@ -2,13 +2,49 @@
 Feedback System Module
 Collects user feedback and learns from interactions to improve responses
 """
-import json
+import orjson
 import time
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass, asdict
 from collections import defaultdict, Counter
 import sqlite3
 import os
+import queue
+import threading
+import atexit
+
+# Feedback writes are queued and flushed by a background thread in batches
+FEEDBACK_BATCH_SIZE = 50
+FEEDBACK_FLUSH_INTERVAL = 0.1  # seconds
+FEEDBACK_SHUTDOWN_TIMEOUT = 5.0  # seconds the exit hook waits for the writer's last batch
+_STOP = object()  # queue sentinel - the writer writes what it holds and exits
+
+# Write statements are kept as constants so every call passes identical SQL text and
+# hits the connection's prepared-statement cache instead of being re-parsed
+FEEDBACK_INSERT_SQL = '''
+    INSERT INTO feedback (timestamp, user_question, ai_response, sql_query, 
+                        feedback_type, feedback_text, response_time, tokens_used)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+PATTERN_EXISTS_SQL = 'SELECT 1 FROM question_patterns WHERE pattern = ?'
+PATTERN_SUCCESS_SQL = '''
+    UPDATE question_patterns 
+    SET success_count = success_count + 1, 
+        avg_response_time = (avg_response_time + ?) / 2,
+        last_updated = ?
+    WHERE pattern = ?
+'''
+PATTERN_FAILURE_SQL = '''
+    UPDATE question_patterns 
+    SET failure_count = failure_count + 1,
+        last_updated = ?
+    WHERE pattern = ?
+'''
+PATTERN_INSERT_SQL = '''
+    INSERT INTO question_patterns (pattern, success_count, failure_count, 
+                                 avg_response_time, last_updated)
+    VALUES (?, ?, ?, ?, ?)
+'''
 
 @dataclass
 class FeedbackEntry:
@@ -24,12 +60,42 @@ class FeedbackEntry:
 class FeedbackSystem:
     def __init__(self, db_path: str = "feedback.db"):
         self.db_path = db_path
-        self.init_database()
+        # The connection and writer thread are created on first use, so importing the module
+        # opens no database and starts no thread
+        self._connection = None
+        self._conn_lock = threading.Lock()
+        self._start_lock = threading.Lock()
         self.feedback_cache = []
         
-    def init_database(self):
+        self._queue = queue.Queue()
+        self._writer = None
+    
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """One long-lived connection in WAL mode, opened (and the schema created) on first use"""
+        if self._connection is None:
+            with self._start_lock:
+                if self._connection is None:
+                    conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                    conn.execute('PRAGMA journal_mode=WAL')  # commits no longer fsync the whole journal
+                    conn.execute('PRAGMA synchronous=NORMAL')
+                    conn.execute('PRAGMA temp_store=MEMORY')
+                    conn.execute('PRAGMA cache_size=-10000')  # ~10 MB page cache
+                    self.init_database(conn)
+                    self._connection = conn
+        return self._connection
+    
+    def _ensure_writer(self):
+        """Start the background writer on the first queued entry"""
+        if self._writer is None:
+            with self._start_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._writer_loop, name="feedback-writer", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)
+        
+    def init_database(self, conn: sqlite3.Connection):
         """Initialize SQLite database for storing feedback"""
-        conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -58,79 +124,100 @@ class FeedbackSystem:
         ''')
         
         conn.commit()
-        conn.close()
     
     def collect_feedback(self, feedback_entry: FeedbackEntry):
-        """Collect user feedback and store it"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO feedback (timestamp, user_question, ai_response, sql_query, 
-                                feedback_type, feedback_text, response_time, tokens_used)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            feedback_entry.timestamp,
-            feedback_entry.user_question,
-            feedback_entry.ai_response,
-            feedback_entry.sql_query,
-            feedback_entry.feedback_type,
-            feedback_entry.feedback_text,
-            feedback_entry.response_time,
-            feedback_entry.tokens_used
-        ))
-        
-        conn.commit()
-        conn.close()
-        
-        # Update question patterns
-        self._update_question_patterns(feedback_entry)
-        
+        """Collect user feedback - queued and written by the background writer"""
+        self._ensure_writer()
+        self._queue.put(feedback_entry)
         print(f"✅ Feedback collected: {feedback_entry.feedback_type}")
     
-    def _update_question_patterns(self, feedback_entry: FeedbackEntry):
-        """Update question patterns based on feedback"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+    def _writer_loop(self):
+        """Drain queued feedback, writing up to FEEDBACK_BATCH_SIZE entries per flush"""
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is _STOP:
+                return
+            batch = [entry]
+            deadline = time.monotonic() + FEEDBACK_FLUSH_INTERVAL
+            while len(batch) < FEEDBACK_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print(f"⚠️ Could not store feedback: {e}")
+    
+    def flush(self):
+        """
+        Stop the writer and write everything it has not stored yet (used at shutdown). The sentinel
+        queues behind pending entries, so joining the writer also flushes the batch it holds
+        """
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(FEEDBACK_SHUTDOWN_TIMEOUT)
+        batch = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not _STOP:
+                batch.append(entry)
+        if batch:
+            self._write_batch(batch)
+    
+    def _write_batch(self, batch: List[FeedbackEntry]):
+        """Insert a batch of feedback rows and update their question patterns in one transaction"""
+        with self._conn_lock, self._conn:
+            cursor = self._conn.cursor()
+            cursor.executemany(FEEDBACK_INSERT_SQL, [(
+                entry.timestamp,
+                entry.user_question,
+                entry.ai_response,
+                entry.sql_query,
+                entry.feedback_type,
+                entry.feedback_text,
+                entry.response_time,
+                entry.tokens_used
+            ) for entry in batch])
+            
+            # Update question patterns (one wall-clock read for the whole batch)
+            now = time.time()
+            for entry in batch:
+                self._update_question_patterns(cursor, entry, now)
+    
+    def _update_question_patterns(self, cursor: sqlite3.Cursor, feedback_entry: FeedbackEntry, now: float):
+        """Update question patterns based on feedback (runs inside the caller's transaction)"""
         # Extract pattern from question (simplified)
         pattern = self._extract_question_pattern(feedback_entry.user_question)
         
         # Check if pattern exists
-        cursor.execute('SELECT * FROM question_patterns WHERE pattern = ?', (pattern,))
+        cursor.execute(PATTERN_EXISTS_SQL, (pattern,))
         existing = cursor.fetchone()
         
         if existing:
             # Update existing pattern
             if feedback_entry.feedback_type in ['thumbs_up', 'helpful']:
-                cursor.execute('''
-                    UPDATE question_patterns 
-                    SET success_count = success_count + 1, 
-                        avg_response_time = (avg_response_time + ?) / 2,
-                        last_updated = ?
-                    WHERE pattern = ?
-                ''', (feedback_entry.response_time, time.time(), pattern))
+                cursor.execute(PATTERN_SUCCESS_SQL, (feedback_entry.response_time, now, pattern))
             else:
-                cursor.execute('''
-                    UPDATE question_patterns 
-                    SET failure_count = failure_count + 1,
-                        last_updated = ?
-                    WHERE pattern = ?
-                ''', (time.time(), pattern))
+                cursor.execute(PATTERN_FAILURE_SQL, (now, pattern))
         else:
             # Create new pattern
             success_count = 1 if feedback_entry.feedback_type in ['thumbs_up', 'helpful'] else 0
             failure_count = 1 if feedback_entry.feedback_type in ['thumbs_down', 'unhelpful'] else 0
             
-            cursor.execute('''
-                INSERT INTO question_patterns (pattern, success_count, failure_count, 
-                                             avg_response_time, last_updated)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (pattern, success_count, failure_count, 
-                  feedback_entry.response_time, time.time()))
-        
-        conn.commit()
-        conn.close()
+            cursor.execute(PATTERN_INSERT_SQL, (pattern, success_count, failure_count, 
+                                                feedback_entry.response_time, now))
     
     def _extract_question_pattern(self, question: str) -> str:
         """Extract pattern from user question for learning"""
@@ -155,30 +242,28 @@ class FeedbackSystem:
     
     def get_feedback_analytics(self) -> Dict[str, Any]:
         """Get analytics from collected feedback"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Overall feedback stats
-        cursor.execute('SELECT feedback_type, COUNT(*) FROM feedback GROUP BY feedback_type')
-        feedback_counts = dict(cursor.fetchall())
-        
-        # Average response times
-        cursor.execute('SELECT AVG(response_time) FROM feedback WHERE response_time > 0')
-        avg_response_time = cursor.fetchone()[0] or 0
-        
-        # Token usage stats
-        cursor.execute('SELECT AVG(tokens_used), MAX(tokens_used), MIN(tokens_used) FROM feedback WHERE tokens_used > 0')
-        token_stats = cursor.fetchone()
-        
-        # Question pattern success rates
-        cursor.execute('''
-            SELECT pattern, success_count, failure_count, avg_response_time 
-            FROM question_patterns 
-            ORDER BY (success_count * 1.0 / (success_count + failure_count + 1)) DESC
-        ''')
-        pattern_stats = cursor.fetchall()
-        
-        conn.close()
+        with self._conn_lock:
+            cursor = self._conn.cursor()
+            
+            # Overall feedback stats
+            cursor.execute('SELECT feedback_type, COUNT(*) FROM feedback GROUP BY feedback_type')
+            feedback_counts = dict(cursor.fetchall())
+            
+            # Average response times
+            cursor.execute('SELECT AVG(response_time) FROM feedback WHERE response_time > 0')
+            avg_response_time = cursor.fetchone()[0] or 0
+            
+            # Token usage stats
+            cursor.execute('SELECT AVG(tokens_used), MAX(tokens_used), MIN(tokens_used) FROM feedback WHERE tokens_used > 0')
+            token_stats = cursor.fetchone()
+            
+            # Question pattern success rates
+            cursor.execute('''
+                SELECT pattern, success_count, failure_count, avg_response_time 
+                FROM question_patterns 
+                ORDER BY (success_count * 1.0 / (success_count + failure_count + 1)) DESC
+            ''')
+            pattern_stats = cursor.fetchall()
         
         return {
             'feedback_counts': feedback_counts,
@@ -233,16 +318,14 @@ class FeedbackSystem:
     
     def export_feedback_data(self) -> str:
         """Export all feedback data as JSON"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM feedback ORDER BY timestamp DESC')
-        feedback_data = cursor.fetchall()
-        
-        cursor.execute('SELECT * FROM question_patterns ORDER BY last_updated DESC')
-        pattern_data = cursor.fetchall()
-        
-        conn.close()
+        with self._conn_lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute('SELECT * FROM feedback ORDER BY timestamp DESC')
+            feedback_data = cursor.fetchall()
+            
+            cursor.execute('SELECT * FROM question_patterns ORDER BY last_updated DESC')
+            pattern_data = cursor.fetchall()
         
         export_data = {
             'feedback_entries': feedback_data,
@@ -250,7 +333,7 @@ class FeedbackSystem:
             'export_timestamp': time.time()
         }
         
-        return json.dumps(export_data, indent=2)
+        return orjson.dumps(export_data, option=orjson.OPT_INDENT_2).decode()
 
 # Global feedback system instance
 feedback_system = FeedbackSystem()
@@ -3,25 +3,382 @@ LLM Model Optimization Module
 Optimizes model configuration and prompt engineering for better performance
 """
 import os
+import re
+import asyncio
+import hashlib
+import math
 import time
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator, Iterator
+from dataclasses import dataclass, replace
+from langchain_core.runnables import Runnable, RunnableConfig
 from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
+import numpy as np
+from modules.performance_monitor import performance_monitor
+
+# Real BPE token counts when tiktoken is available; otherwise the 4-chars-per-token heuristic
+try:
+    import tiktoken
+    _ENC = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _ENC = None
 
 # Load environment variables from config.env
 load_dotenv('config.env')
 
-@dataclass
+def count_tokens(text: str) -> int:
+    """Token count of text (4 chars = 1 token average without tiktoken)"""
+    if _ENC is not None:
+        return len(_ENC.encode(text))
+    return len(text) // 4
+
+@lru_cache(maxsize=4096)
+def count_line_tokens(line: str) -> int:
+    """Memoized count for single prompt lines, which repeat across requests (schema, rules)"""
+    return count_tokens(line)
+
+# Token budget for the SCHEMA section of SQL prompts; instructions and output markers are never compressed
+SCHEMA_BUDGET_TOKENS = 1500
+
+# Schema lines that define structure always survive compression
+SCHEMA_STRUCTURE_RE = re.compile(r'Table:|CREATE TABLE|PRIMARY KEY|FOREIGN KEY|Column:', re.IGNORECASE)
+SCHEMA_WORD_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|\d+(?:\.\d+)?')
+LOW_INFO_WORDS = frozenset((
+    'the', 'a', 'an', 'of', 'and', 'or', 'to', 'in', 'is', 'are', 'for', 'on', 'with',
+    'this', 'that', 'by', 'as', 'be', 'it', 'from', 'at', 'each', 'all', 'which'
+))
+
+def score_schema_line(line: str) -> float:
+    """Cheap information score for a schema line (higher = keep).
+
+    Heuristic stand-in for perplexity scoring: identifiers (snake_case / capitalised),
+    numbers and non-stopwords carry the content; filler prose scores low.
+    """
+    if SCHEMA_STRUCTURE_RE.search(line):
+        return float('inf')
+    words = SCHEMA_WORD_RE.findall(line)
+    if not words:
+        return 0.0
+    informative = 0
+    for word in words:
+        if word[0].isdigit():
+            informative += 2
+        elif '_' in word or not word.islower():
+            informative += 1.5
+        elif word.lower() not in LOW_INFO_WORDS:
+            informative += 1
+    return informative / len(words)
+
+def compress_section(text: str, budget: int) -> str:
+    """Keep the highest-scoring lines of text that fit in budget tokens, in their original order"""
+    lines = text.split('\n')
+    line_tokens = [count_line_tokens(line) + 1 for line in lines]
+    if sum(line_tokens) <= budget:
+        return text
+    
+    ranked = sorted(range(len(lines)), key=lambda i: score_schema_line(lines[i]), reverse=True)
+    keep = set()
+    used_tokens = 0
+    for i in ranked:
+        if used_tokens + line_tokens[i] <= budget:
+            keep.add(i)
+            used_tokens += line_tokens[i]
+    return '\n'.join(line for i, line in enumerate(lines) if i in keep)
+
+# BM25 parameters for ranking schema lines against the user's question
+BM25_K1 = 1.5
+BM25_B = 0.75
+SCHEMA_TABLE_RE = re.compile(r'CREATE TABLE\s+"?(\w+)"?', re.IGNORECASE)
+
+def _bm25_terms(text: str) -> List[str]:
+    """Lowercased terms for BM25; snake_case identifiers also contribute their parts"""
+    terms = []
+    for word in SCHEMA_WORD_RE.findall(text.lower()):
+        if word in LOW_INFO_WORDS:
+            continue
+        terms.append(word)
+        if '_' in word:
+            terms.extend(part for part in word.split('_') if part)
+    return terms
+
+def bm25_scores(documents: List[List[str]], query: List[str]) -> List[float]:
+    """Okapi BM25 score of each tokenized document against the query terms"""
+    n_docs = len(documents)
+    if not n_docs or not query:
+        return [0.0] * n_docs
+    avg_len = sum(len(doc) for doc in documents) / n_docs or 1.0
+    doc_freq = Counter(term for doc in documents for term in set(doc))
+    query_terms = set(query)
+    idf = {term: math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+           for term in query_terms}
+    
+    scores = []
+    for doc in documents:
+        term_freq = Counter(doc)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avg_len)
+        score = 0.0
+        for term in query_terms:
+            tf = term_freq.get(term)
+            if tf:
+                score += idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+def rank_schema_lines(schema: str, question: str, budget_tokens: int) -> str:
+    """Keep the schema lines most relevant to the question within budget_tokens.
+
+    Lines are BM25-ranked against the question (structural lines first) and kept in
+    their original order; each table's dropped lines collapse into a single
+    '-- <table>: N lines omitted' pointer so the model knows what exists.
+    """
+    lines = schema.split('\n')
+    line_tokens = [count_line_tokens(line) + 1 for line in lines]
+    if sum(line_tokens) <= budget_tokens:
+        return schema
+    
+    scores = bm25_scores([_bm25_terms(line) for line in lines], _bm25_terms(question))
+    structural = [bool(SCHEMA_STRUCTURE_RE.search(line)) for line in lines]
+    ranked = sorted(range(len(lines)), key=lambda i: (structural[i], scores[i]), reverse=True)
+    
+    keep = set()
+    used_tokens = 0
+    for i in ranked:
+        if used_tokens + line_tokens[i] <= budget_tokens:
+            keep.add(i)
+            used_tokens += line_tokens[i]
+    
+    kept_lines = []
+    table = 'schema'
+    omitted = 0
+    for i, line in enumerate(lines):
+        table_match = SCHEMA_TABLE_RE.search(line)
+        if table_match:
+            # Close out the previous table with a single pointer for everything dropped from it
+            if omitted:
+                kept_lines.append(f"-- {table}: {omitted} lines omitted")
+                omitted = 0
+            table = table_match.group(1)
+        if i in keep:
+            kept_lines.append(line)
+        elif line.strip():
+            omitted += 1
+    if omitted:
+        kept_lines.append(f"-- {table}: {omitted} lines omitted")
+    return '\n'.join(kept_lines)
+
+@dataclass(slots=True, frozen=True)
 class ModelConfig:
     model_name: str
     temperature: float
     max_tokens: Optional[int]
     top_p: Optional[float]
+
+def build_model_params(config: ModelConfig) -> Dict[str, Any]:
+    """ChatGoogleGenerativeAI keyword arguments for a config (API key excluded)"""
+    model_params = {
+        'model': config.model_name,
+        'temperature': config.temperature
+    }
+    
+    # Add optional parameters if specified
+    if config.max_tokens:
+        model_params['max_output_tokens'] = config.max_tokens
+    if config.top_p:
+        model_params['top_p'] = config.top_p
+    return model_params
+    
+# Static head of every SQL-generation prompt. It must stay byte-identical across calls
+# (nothing per-request in it) so provider-side prefix caching can reuse it
+SQL_PROMPT_PREFIX = """
+TASK: Generate PostgreSQL query only. No explanations.
+
+CONSTRAINTS:
+- Use only provided table schema
+- Apply case-insensitive matching with COLLATE NOCASE
+- Return all results unless user specifies a limit
+- Return only the SQL query
+
+SCHEMA:
+"""
+SQL_PROMPT_SUFFIX = "\n\nOUTPUT: SQL query only"
+QUESTION_MARKER = 'Question:'
+
+# Answer-formatting prompt scaffolding around the caller's content
+ANSWER_PROMPT_PREFIX = """
+TASK: Format SQL results into clear, readable response.
+
+RULES:
+- Use table format for multiple results
+- Use natural language for single values
+- Do not add information not in the data
+- Be concise but complete
+
+"""
+ANSWER_PROMPT_SUFFIX = "\n\nOUTPUT: Formatted response"
+
+def split_prompt_question(prompt: str) -> Tuple[str, str]:
+    """Split a prompt into (static part, dynamic question part) at its last 'Question:' line"""
+    marker_at = prompt.rfind('\n' + QUESTION_MARKER)
+    if marker_at == -1:
+        if prompt.startswith(QUESTION_MARKER):
+            return '', prompt
+        return prompt, ''
+    return prompt[:marker_at], prompt[marker_at + 1:]
+
+# Row-marshaling: several small questions answered in one call ([i]-numbered answers)
+ROW_MARSHAL_BATCH_SIZE = 8  # gains flatten out beyond this, and long batches risk truncation
+ROW_MARSHAL_MAX_TOKENS = 8000
+ROW_MARSHAL_ANSWER_RE = re.compile(r'^\[(\d+)\]:?\s*(.*?)(?=^\[\d+\]|\Z)', re.MULTILINE | re.DOTALL)
+
+# Responses are cached only for effectively deterministic configs (temperature at or below this)
+DETERMINISTIC_TEMPERATURE = 0.1
+LLM_RESPONSE_CACHE_TTL = 3600  # seconds
+LLM_RESPONSE_CACHE_SIZE = 512
+
+class LLMResponseCache:
+    """In-memory TTL store for LLM responses.
+
+    get/set/delete/clear is the whole backend interface, so a shared store
+    (e.g. Redis) can be dropped in for multi-process deployments.
+    """
+    def __init__(self, maxsize: int = LLM_RESPONSE_CACHE_SIZE, ttl: float = LLM_RESPONSE_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = {}  # key -> (expires_at, response), insertion-ordered
+        self._lock = threading.Lock()
+    
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                return None
+            return entry[1]
+    
+    def set(self, key: str, response: Any):
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._data) >= self.maxsize:
+                del self._data[next(iter(self._data))]
+            self._data[key] = (time.monotonic() + self.ttl, response)
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+llm_response_cache = LLMResponseCache()
+
+class CachedLLM(Runnable):
+    """Runnable wrapper around a chat model that answers repeated prompts from llm_response_cache.
+
+    Being a Runnable it composes with | (prompt | llm | parser) and its batch/abatch run through
+    invoke/ainvoke, so chains hit the cache too. stream/astream replay a cached response as one
+    chunk and cache a stream that ran to completion. Other attributes go to the wrapped model.
+    """
+    def __init__(self, llm: ChatGoogleGenerativeAI, config: ModelConfig,
+                 cache: LLMResponseCache = llm_response_cache):
+        self.llm = llm
+        self.config = config
+        self.cache = cache
+    
+    def __getattr__(self, name):
+        if name == 'llm':  # Not set yet (e.g. mid-copy) - don't recurse into __getattr__
+            raise AttributeError(name)
+        return getattr(self.llm, name)
     
+    def _cache_key(self, prompt: Any) -> Optional[str]:
+        """Key for cacheable prompts, None when the config isn't deterministic"""
+        if self.config.temperature > DETERMINISTIC_TEMPERATURE:
+            return None
+        if isinstance(prompt, str):
+            text = prompt
+        elif hasattr(prompt, 'to_string'):
+            text = prompt.to_string()
+        else:
+            text = repr(prompt)
+        raw = f"{self.config.model_name}\0{self.config.temperature}\0{self.config.max_tokens}\0{text}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+    
+    def _cached(self, key: Optional[str]):
+        """Cached response for key (recorded as a cache hit), or None"""
+        if key is None:
+            return None
+        start_time = time.time()
+        response = self.cache.get(key)
+        if response is not None:
+            performance_monitor.record_values('llm_invoke', time.time() - start_time, cache_hit=True)
+        return response
+    
+    # Extra call kwargs (e.g. stop sequences) change the output, so those calls skip the cache;
+    # the RunnableConfig only carries callbacks and tags and is passed through untouched
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs):
+        key = None if kwargs else self._cache_key(input)
+        response = self._cached(key)
+        if response is not None:
+            return response
+        response = self.llm.invoke(input, config, **kwargs)
+        if key is not None:
+            self.cache.set(key, response)
+        return response
+    
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs):
+        key = None if kwargs else self._cache_key(input)
+        response = self._cached(key)
+        if response is not None:
+            return response
+        response = await self.llm.ainvoke(input, config, **kwargs)
+        if key is not None:
+            self.cache.set(key, response)
+        return response
+    
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> Iterator[Any]:
+        key = None if kwargs else self._cache_key(input)
+        response = self._cached(key)
+        if response is not None:
+            yield response
+            return
+        full = None
+        for chunk in self.llm.stream(input, config, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if key is not None and full is not None:
+            self.cache.set(key, full)
+    
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> AsyncIterator[Any]:
+        key = None if kwargs else self._cache_key(input)
+        response = self._cached(key)
+        if response is not None:
+            yield response
+            return
+        full = None
+        async for chunk in self.llm.astream(input, config, **kwargs):
+            full = chunk if full is None else full + chunk
+            yield chunk
+        if key is not None and full is not None:
+            self.cache.set(key, full)
+
+# Built LLM clients kept at once; the least recently used one is dropped past this
+LLM_CLIENT_CACHE_SIZE = 32
+# max_tokens overrides are rounded up to a multiple of this, so near-identical limits share a client
+MAX_TOKENS_BUCKET = 500
+
 class ModelOptimizer:
     def __init__(self):
         self.performance_history = []
+        # Built LLM clients, keyed on task, API key hash and the config values they were built with;
+        # LRU-ordered and capped at LLM_CLIENT_CACHE_SIZE
+        self._llm_cache: 'OrderedDict[tuple, CachedLLM]' = OrderedDict()
+        self._llm_cache_lock = threading.Lock()
         # Get model name from environment variable
         model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-preview-05-20")
         
@@ -45,64 +402,148 @@ class ModelOptimizer:
                 top_p=0.7
             )
         }
+        # Client kwargs per task, rebuilt only when a task's config is replaced
+        self._model_params = {task_type: build_model_params(config)
+                              for task_type, config in self.optimal_configs.items()}
+    
+    def _set_config(self, task_type: str, config: ModelConfig):
+        """Swap in a new (immutable) config for a task and refresh its client kwargs"""
+        self.optimal_configs[task_type] = config
+        self._model_params[task_type] = build_model_params(config)
     
-    def get_optimized_llm(self, task_type: str = 'sql_generation', api_key: str = None) -> ChatGoogleGenerativeAI:
-        """Get optimized LLM configuration for specific task"""
+    def get_optimized_llm(self, task_type: str = 'sql_generation', api_key: str = None,
+                          max_tokens: Optional[int] = None) -> CachedLLM:
+        """Get optimized LLM configuration for specific task (max_tokens overrides the task's limit)"""
         if api_key is None:
             api_key = os.getenv("GOOGLE_API_KEY")  # Get API key from environment variable
             if not api_key:
                 raise ValueError("Google API key not set. Please set GOOGLE_API_KEY in config.env file.")
             
-        config = self.optimal_configs.get(task_type, self.optimal_configs['sql_generation'])
+        if task_type not in self.optimal_configs:
+            task_type = 'sql_generation'
+        config = self.optimal_configs[task_type]
+        if max_tokens:
+            max_tokens = -(-max_tokens // MAX_TOKENS_BUCKET) * MAX_TOKENS_BUCKET
+            config = replace(config, max_tokens=max_tokens)
         
-        # Create optimized model instance
-        model_params = {
-            'model': config.model_name,
-            'temperature': config.temperature,
-            'google_api_key': api_key
-        }
+        # Reuse the client built for this exact configuration; performance_based_optimization
+        # swaps in a new config, which changes the key and builds a fresh client
+        cache_key = (task_type, hashlib.sha256(api_key.encode()).hexdigest(), config)
+        with self._llm_cache_lock:
+            llm = self._llm_cache.get(cache_key)
+            if llm is not None:
+                self._llm_cache.move_to_end(cache_key)
+                return llm
+        
+        # Create optimized model instance from the precomputed kwargs
+        model_params = build_model_params(config) if max_tokens else self._model_params[task_type]
+        llm = CachedLLM(ChatGoogleGenerativeAI(**model_params, google_api_key=api_key), config)
+        with self._llm_cache_lock:
+            self._llm_cache[cache_key] = llm
+            if len(self._llm_cache) > LLM_CLIENT_CACHE_SIZE:
+                self._llm_cache.popitem(last=False)
+        return llm
+    
+    async def batch_invoke(self, prompts: List[str], task_type: str = 'sql_generation',
+                           max_concurrency: int = 10) -> List[Any]:
+        """Run many prompts concurrently; failures come back as exceptions in their slot"""
+        llm = self.get_optimized_llm(task_type)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def invoke_one(prompt: str):
+            async with semaphore:
+                return await llm.ainvoke(prompt)
         
-        # Add optional parameters if specified
-        if config.max_tokens:
-            model_params['max_output_tokens'] = config.max_tokens
-        if config.top_p:
-            model_params['top_p'] = config.top_p
+        return await asyncio.gather(*(invoke_one(prompt) for prompt in prompts), return_exceptions=True)
+    
+    def batch_invoke_sync(self, prompts: List[str], task_type: str = 'sql_generation',
+                          max_concurrency: int = 10) -> List[Any]:
+        """Thread-pool counterpart of batch_invoke for synchronous callers"""
+        llm = self.get_optimized_llm(task_type)
+        
+        def invoke_one(prompt: str):
+            try:
+                return llm.invoke(prompt)
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return list(executor.map(invoke_one, prompts))
+    
+    async def stream_generate(self, prompt: str, task_type: str = 'answer_formatting') -> AsyncIterator[str]:
+        """Yield the response text chunk by chunk as Gemini produces it"""
+        llm = self.get_optimized_llm(task_type)
+        start_time = time.time()
+        first_token_latency = None
+        error = None
+        try:
+            async for chunk in llm.astream(prompt):
+                if first_token_latency is None:
+                    first_token_latency = time.time() - start_time
+                if chunk.content:
+                    yield chunk.content
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            performance_monitor.record_values('llm_stream', time.time() - start_time, error=error,
+                                              first_token_latency=first_token_latency)
+    
+    def row_marshal_invoke(self, questions: List[str], task_type: str = 'question_rephrasing',
+                           batch_size: int = ROW_MARSHAL_BATCH_SIZE) -> List[Optional[str]]:
+        """Answer several small questions with one LLM call per batch of batch_size.
+
+        Returns one answer per question, in order; None where the reply had no [i] entry for it.
+        """
+        answers: List[Optional[str]] = []
+        config = self.optimal_configs.get(task_type, self.optimal_configs['sql_generation'])
+        
+        for offset in range(0, len(questions), batch_size):
+            batch = questions[offset:offset + batch_size]
+            prompt = "Answer each question separately, prefixing each answer with its [i] number:\n"
+            prompt += '\n'.join(f"[{i}] {question}" for i, question in enumerate(batch, 1))
+            
+            max_tokens = min(len(batch) * (config.max_tokens or 0), ROW_MARSHAL_MAX_TOKENS) or None
+            llm = self.get_optimized_llm(task_type, max_tokens=max_tokens)
+            
+            start_time = time.time()
+            response = llm.invoke(prompt)
+            performance_monitor.record_values('row_marshal_batch', time.time() - start_time)
             
-        return ChatGoogleGenerativeAI(**model_params)
+            text = getattr(response, 'content', response)
+            parsed = {int(match.group(1)): match.group(2).strip()
+                      for match in ROW_MARSHAL_ANSWER_RE.finditer(str(text))}
+            answers.extend(parsed.get(i) for i in range(1, len(batch) + 1))
+        
+        return answers
     
-    def optimize_prompt_structure(self, base_prompt: str, task_type: str) -> str:
+    def optimize_prompt_structure(self, base_prompt: str, task_type: str,
+                                  schema_budget: int = SCHEMA_BUDGET_TOKENS,
+                                  question: Optional[str] = None) -> str:
         """Optimize prompt structure for better token efficiency"""
         
         if task_type == 'sql_generation':
-            # For SQL generation, emphasize structure and constraints
-            optimized_prompt = f"""
-TASK: Generate PostgreSQL query only. No explanations.
-
-CONSTRAINTS:
-- Use only provided table schema
-- Apply case-insensitive matching with COLLATE NOCASE
-- Return all results unless user specifies a limit
-- Return only the SQL query
-
-SCHEMA:
-{base_prompt}
-
-OUTPUT: SQL query only"""
+            # Static instructions and schema first, the per-request question last, so the
+            # prompt shares the longest possible prefix with earlier calls
+            schema, question_part = split_prompt_question(base_prompt)
+            if not question_part and question:
+                question_part = f"{QUESTION_MARKER} {question}"
+            
+            # The schema gets the aggressive pruning; the scaffolding around it is kept verbatim.
+            # Ranking against the question keeps fewer lines but makes the schema per-request
+            if question:
+                schema = rank_schema_lines(schema, question, schema_budget)
+            else:
+                schema = compress_section(schema, schema_budget)
+            
+            if question_part:
+                optimized_prompt = ''.join((SQL_PROMPT_PREFIX, schema, "\n\n", question_part, SQL_PROMPT_SUFFIX))
+            else:
+                optimized_prompt = ''.join((SQL_PROMPT_PREFIX, schema, SQL_PROMPT_SUFFIX))
             
         elif task_type == 'answer_formatting':
             # For answer formatting, emphasize clarity and structure
-            optimized_prompt = f"""
-TASK: Format SQL results into clear, readable response.
-
-RULES:
-- Use table format for multiple results
-- Use natural language for single values
-- Do not add information not in the data
-- Be concise but complete
-
-{base_prompt}
-
-OUTPUT: Formatted response"""
+            optimized_prompt = ''.join((ANSWER_PROMPT_PREFIX, base_prompt, ANSWER_PROMPT_SUFFIX))
             
         else:
             # Default optimization
@@ -113,10 +554,7 @@ OUTPUT: Formatted response"""
     def adaptive_token_management(self, prompt: str, max_tokens: int = 2000) -> str:
         """Adaptively manage token usage based on prompt length"""
         
-        # Rough token estimation (4 chars = 1 token average)
-        estimated_tokens = len(prompt) // 4
-        
-        if estimated_tokens <= max_tokens:
+        if count_tokens(prompt) <= max_tokens:
             return prompt
             
         # If too long, progressively reduce content
@@ -133,18 +571,20 @@ OUTPUT: Formatted response"""
             elif line.strip() and not line.startswith(('---', '||', '#')):
                 optional_lines.append(line)
                 
-        # Start with essential content
-        reduced_prompt = '\n'.join(priority_lines)
-        
-        # Add optional content until token limit
-        for line in optional_lines:
-            test_prompt = reduced_prompt + '\n' + line
-            if len(test_prompt) // 4 < max_tokens:
-                reduced_prompt = test_prompt
-            else:
-                break
-                
-        return reduced_prompt
+        # Count every kept line once (+1 for its joining newline), then drop optional lines
+        # from the front until the total fits: the cut point is a binary search over the
+        # running sum of dropped tokens, not a Python loop
+        optional_tokens = np.fromiter((count_line_tokens(line) + 1 for line in optional_lines),
+                                      dtype=np.int64, count=len(optional_lines))
+        used_tokens = sum(count_line_tokens(line) for line in priority_lines) + max(0, len(priority_lines) - 1)
+        excess = used_tokens + int(optional_tokens.sum()) - max_tokens
+        
+        first_kept = 0
+        if excess > 0:
+            first_kept = int(np.searchsorted(np.cumsum(optional_tokens), excess)) + 1
+        
+        kept_lines = priority_lines + optional_lines[first_kept:]
+        return '\n'.join(kept_lines)
     
     def performance_based_optimization(self, task_type: str, response_time: float, 
                                      tokens_used: int, success: bool):
@@ -165,11 +605,13 @@ OUTPUT: Formatted response"""
             
             # Reduce max_tokens to speed up generation
             if current_config.max_tokens and current_config.max_tokens > 200:
-                current_config.max_tokens = int(current_config.max_tokens * 0.8)
+                current_config = replace(current_config, max_tokens=int(current_config.max_tokens * 0.8))
                 
             # Adjust temperature for better consistency
             if not success and current_config.temperature > 0.1:
-                current_config.temperature = max(0.0, current_config.temperature - 0.1)
+                current_config = replace(current_config, temperature=max(0.0, current_config.temperature - 0.1))
+            
+            self._set_config(task_type, current_config)
                 
         # If performance is excellent, we can potentially increase quality
         elif response_time < 2.0 and success and tokens_used < 1000:
@@ -177,7 +619,7 @@ OUTPUT: Formatted response"""
             
             # Slightly increase max_tokens for richer responses
             if current_config.max_tokens and current_config.max_tokens < 1500:
-                current_config.max_tokens = int(current_config.max_tokens * 1.1)
+                self._set_config(task_type, replace(current_config, max_tokens=int(current_config.max_tokens * 1.1)))
     
     def get_performance_insights(self) -> Dict[str, Any]:
         """Get insights from performance history"""
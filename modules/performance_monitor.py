@@ -4,13 +4,15 @@ Tracks system performance, response times, and provides analytics
 """
 import time
 import json
+import math
 import threading
-from typing import Dict, List, Any, Optional
+import itertools
+from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
 from collections import deque, defaultdict
-import statistics
+import numpy as np
 
-@dataclass
+@dataclass(slots=True)
 class PerformanceMetric:
     timestamp: float
     operation: str
@@ -19,25 +21,193 @@ class PerformanceMetric:
     cache_hit: bool
     error: Optional[str] = None
     metadata: Optional[Dict] = None
+    first_token_latency: Optional[float] = None  # Streaming calls only; duration is the full stream
+
+class P2Quantile:
+    """Streaming quantile estimate (Jain & Chlamtac's P-squared algorithm).
+
+    Keeps five markers whose heights track the min, q/2, q, (1+q)/2 and max quantiles;
+    each update is O(1) and nothing is stored per sample.
+    """
+    def __init__(self, q: float = 0.95):
+        self.q = q
+        self.count = 0
+        self._heights: List[float] = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self._increments = [0, q / 2, q, (1 + q) / 2, 1]
+    
+    def update(self, x: float):
+        self.count += 1
+        heights = self._heights
+        if self.count <= 5:
+            heights.append(x)
+            heights.sort()
+            return
+        
+        positions = self._positions
+        # Find the cell x falls in, widening the extreme markers if needed
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+        
+        # Nudge the middle markers toward their desired positions
+        for i in (1, 2, 3):
+            d = self._desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = heights[i] + d / (positions[i + 1] - positions[i - 1]) * (
+                    (positions[i] - positions[i - 1] + d) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+                    + (positions[i + 1] - positions[i] - d) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+                )
+                if not heights[i - 1] < height < heights[i + 1]:
+                    # Parabolic step overshot a neighbour - fall back to linear interpolation
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+    
+    def value(self) -> float:
+        if not self.count:
+            return 0.0
+        if self.count <= 5:
+            return self._heights[round(self.q * (self.count - 1))]
+        return self._heights[2]
+
+# Metrics live in a preallocated ring buffer, one row per metric. Operation names are
+# interned to op_id; error text and metadata (rare, variable-size) sit in parallel slot lists
+METRIC_DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('op_id', 'i4'),
+    ('duration', 'f8'),
+    ('tokens', 'i8'),
+    ('cache_hit', '?'),
+    ('has_error', '?'),
+    ('first_token', 'f8'),  # NaN when not a streamed operation
+])
 
 class PerformanceMonitor:
-    def __init__(self, max_metrics: int = 1000):
-        self.metrics = deque(maxlen=max_metrics)
-        self.operation_stats = defaultdict(list)
-        self.lock = threading.RLock()
+    def __init__(self, max_metrics: int = 1000, exact_quantiles: bool = False):
+        self.max_metrics = max_metrics
+        # p95 of successful durations, one estimator per pass over the ring (max_metrics slots) so it
+        # covers the same window as the buffer; exact_quantiles recomputes from the buffer instead (debugging)
+        self.exact_quantiles = exact_quantiles
+        self._p95_window = 0
+        self._p95 = P2Quantile(0.95)
+        self._p95_previous: Optional[P2Quantile] = None
+        self._p95_lock = threading.Lock()
+        self._ring = np.zeros(max_metrics, dtype=METRIC_DTYPE)
+        self._ring['op_id'] = -1  # -1 marks a slot that was never written
+        self._errors: List[Optional[str]] = [None] * max_metrics
+        self._metadata: List[Optional[Dict]] = [None] * max_metrics
+        # next() on itertools.count is atomic under the GIL, so every writer claims its own slot
+        self._slots = itertools.count()
+        self._op_ids: Dict[str, int] = {}
+        self._op_names: List[str] = []
+        # Recent durations per operation, capped so long-running servers don't grow without bound
+        self.operation_stats = defaultdict(lambda: deque(maxlen=max_metrics))
+        self.lock = threading.RLock()  # Only taken to intern new operation names and to clear
         self.start_time = time.time()
+    
+    def _op_id(self, operation: str) -> int:
+        """Interned id for an operation name"""
+        op_id = self._op_ids.get(operation)
+        if op_id is None:
+            with self.lock:
+                op_id = self._op_ids.get(operation)
+                if op_id is None:
+                    op_id = len(self._op_names)
+                    self._op_names.append(operation)
+                    self._op_ids[operation] = op_id
+        return op_id
+    
+    def _record_raw(self, timestamp: float, op_id: int, duration: float, tokens_used: int,
+                    cache_hit: bool, error: Optional[str], first_token_latency: Optional[float],
+                    metadata: Optional[Dict]):
+        """Write one metric into its own ring slot; only the O(1) p95 update is serialized"""
+        seq = next(self._slots)
+        slot = seq % self.max_metrics
+        self._errors[slot] = error
+        self._metadata[slot] = metadata
+        self._ring[slot] = (
+            timestamp, op_id, duration, tokens_used, cache_hit,
+            error is not None, math.nan if first_token_latency is None else first_token_latency
+        )
+        if error is None:
+            self._update_p95(seq // self.max_metrics, duration)
+        self.operation_stats[self._op_names[op_id]].append(duration)
+    
+    def _update_p95(self, window: int, duration: float):
+        """Feed the current window's estimator, starting a fresh one each time the ring wraps"""
+        with self._p95_lock:
+            if window > self._p95_window:  # A writer that claimed its slot before the wrap feeds the new window
+                self._p95_window = window
+                self._p95_previous = self._p95
+                self._p95 = P2Quantile(0.95)
+            self._p95.update(duration)
+    
+    def _p95_value(self) -> float:
+        """Current window's estimate, or the last full window's while the new one has few samples"""
+        with self._p95_lock:
+            if self._p95.count <= 20 and self._p95_previous is not None and self._p95_previous.count:
+                return self._p95_previous.value()
+            return self._p95.value()
         
     def record_metric(self, metric: PerformanceMetric):
         """Record a performance metric"""
-        with self.lock:
-            self.metrics.append(metric)
-            self.operation_stats[metric.operation].append(metric.duration)
+        self._record_raw(metric.timestamp, self._op_id(metric.operation), metric.duration, metric.tokens_used,
+                         metric.cache_hit, metric.error, metric.first_token_latency, metric.metadata)
+    
+    def record_values(self, operation: str, duration: float, tokens_used: int = 0,
+                      cache_hit: bool = False, error: Optional[str] = None,
+                      first_token_latency: Optional[float] = None):
+        """Record a metric from raw values, without building a PerformanceMetric"""
+        self._record_raw(time.time(), self._op_id(operation), duration, tokens_used, cache_hit, error,
+                         first_token_latency, None)
+    
+    def _snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy of the written ring rows in recording order, with the slot each came from"""
+        ring = self._ring.copy()
+        slots = np.flatnonzero(ring['op_id'] >= 0)
+        slots = slots[np.argsort(ring['timestamp'][slots], kind='stable')]
+        return ring[slots], slots
+    
+    @property
+    def metrics(self) -> List[PerformanceMetric]:
+        """Recorded metrics, oldest first, materialized from the ring buffer"""
+        rows, slots = self._snapshot()
+        return [
+            PerformanceMetric(
+                timestamp=float(row['timestamp']),
+                operation=self._op_names[row['op_id']],
+                duration=float(row['duration']),
+                tokens_used=int(row['tokens']),
+                cache_hit=bool(row['cache_hit']),
+                error=self._errors[slot],
+                metadata=self._metadata[slot],
+                first_token_latency=None if math.isnan(row['first_token']) else float(row['first_token'])
+            )
+            for row, slot in zip(rows, slots)
+        ]
     
     def track_operation(self, operation_name: str):
         """Decorator to track operation performance"""
+        op_id = self._op_id(operation_name)  # Interned once per decorated function
+        
         def decorator(func):
             def wrapper(*args, **kwargs):
-                start_time = time.time()
+                # Monotonic integer clock for the duration; no PerformanceMetric is built per call
+                start_ns = time.perf_counter_ns()
                 error = None
                 
                 try:
@@ -47,168 +217,185 @@ class PerformanceMonitor:
                     error = str(e)
                     raise
                 finally:
-                    duration = time.time() - start_time
-                    metric = PerformanceMetric(
-                        timestamp=time.time(),
-                        operation=operation_name,
-                        duration=duration,
-                        tokens_used=0,  # To be updated if available
-                        cache_hit=False,  # To be updated if available
-                        error=error
-                    )
-                    self.record_metric(metric)
+                    duration = (time.perf_counter_ns() - start_ns) * 1e-9
+                    self._record_raw(time.time(), op_id, duration, 0, False, error, None, None)
             
             return wrapper
         return decorator
     
     def get_performance_summary(self) -> Dict[str, Any]:
         """Get comprehensive performance summary"""
-        with self.lock:
-            if not self.metrics:
-                return {"status": "No metrics available"}
-            
-            # Overall statistics
-            total_operations = len(self.metrics)
-            successful_operations = sum(1 for m in self.metrics if m.error is None)
-            error_rate = (total_operations - successful_operations) / total_operations
-            
-            # Response time statistics
-            response_times = [m.duration for m in self.metrics if m.error is None]
-            
-            if response_times:
-                avg_response_time = statistics.mean(response_times)
-                median_response_time = statistics.median(response_times)
-                p95_response_time = statistics.quantiles(response_times, n=20)[18] if len(response_times) > 20 else max(response_times)
+        rows, _ = self._snapshot()
+        total_operations = len(rows)
+        if not total_operations:
+            return {"status": "No metrics available"}
+        
+        # Overall statistics
+        succeeded = ~rows['has_error']
+        successful_operations = int(np.count_nonzero(succeeded))
+        error_rate = (total_operations - successful_operations) / total_operations
+        
+        # Response time statistics
+        response_times = rows['duration'][succeeded]
+        
+        if response_times.size:
+            avg_response_time = float(response_times.mean())
+            median_response_time = float(np.median(response_times))
+            if response_times.size <= 20:
+                p95_response_time = float(response_times.max())
+            elif self.exact_quantiles:
+                # 'weibull' is the same exclusive method statistics.quantiles uses
+                p95_response_time = float(np.percentile(response_times, 95, method='weibull'))
             else:
-                avg_response_time = median_response_time = p95_response_time = 0
-            
-            # Token usage statistics
-            token_usage = [m.tokens_used for m in self.metrics if m.tokens_used > 0]
-            avg_tokens = statistics.mean(token_usage) if token_usage else 0
-            total_tokens = sum(token_usage)
-            
-            # Cache performance
-            cache_hits = sum(1 for m in self.metrics if m.cache_hit)
-            cache_hit_rate = cache_hits / total_operations if total_operations > 0 else 0
-            
-            # Operation breakdown
-            operation_breakdown = {}
-            for operation, durations in self.operation_stats.items():
-                if durations:
-                    operation_breakdown[operation] = {
-                        'count': len(durations),
-                        'avg_duration': statistics.mean(durations),
-                        'min_duration': min(durations),
-                        'max_duration': max(durations)
-                    }
-            
-            return {
-                'summary': {
-                    'total_operations': total_operations,
-                    'successful_operations': successful_operations,
-                    'error_rate': error_rate,
-                    'uptime_hours': (time.time() - self.start_time) / 3600
-                },
-                'response_times': {
-                    'average_seconds': avg_response_time,
-                    'median_seconds': median_response_time,
-                    'p95_seconds': p95_response_time
-                },
-                'token_usage': {
-                    'average_per_query': avg_tokens,
-                    'total_consumed': total_tokens
-                },
-                'cache_performance': {
-                    'hit_rate': cache_hit_rate,
-                    'hits': cache_hits,
-                    'misses': total_operations - cache_hits
-                },
-                'operation_breakdown': operation_breakdown
+                p95_response_time = self._p95_value()
+        else:
+            avg_response_time = median_response_time = p95_response_time = 0
+        
+        # Time to first token for streamed operations
+        first_token_latencies = rows['first_token'][~np.isnan(rows['first_token'])]
+        avg_first_token = float(first_token_latencies.mean()) if first_token_latencies.size else 0
+        
+        # Token usage statistics
+        token_usage = rows['tokens'][rows['tokens'] > 0]
+        avg_tokens = float(token_usage.mean()) if token_usage.size else 0
+        total_tokens = int(token_usage.sum())
+        
+        # Cache performance
+        cache_hits = int(np.count_nonzero(rows['cache_hit']))
+        cache_hit_rate = cache_hits / total_operations
+        
+        # Operation breakdown - per-op count/sum/min/max in one pass each over the buffer
+        op_ids = rows['op_id']
+        durations = rows['duration']
+        n_ops = int(op_ids.max()) + 1
+        counts = np.bincount(op_ids, minlength=n_ops)
+        sums = np.bincount(op_ids, weights=durations, minlength=n_ops)
+        mins = np.full(n_ops, np.inf)
+        maxs = np.full(n_ops, -np.inf)
+        np.minimum.at(mins, op_ids, durations)
+        np.maximum.at(maxs, op_ids, durations)
+        operation_breakdown = {
+            self._op_names[op_id]: {
+                'count': int(counts[op_id]),
+                'avg_duration': float(sums[op_id] / counts[op_id]),
+                'min_duration': float(mins[op_id]),
+                'max_duration': float(maxs[op_id])
             }
+            for op_id in np.flatnonzero(counts)
+        }
+        
+        return {
+            'summary': {
+                'total_operations': total_operations,
+                'successful_operations': successful_operations,
+                'error_rate': error_rate,
+                'uptime_hours': (time.time() - self.start_time) / 3600
+            },
+            'response_times': {
+                'average_seconds': avg_response_time,
+                'median_seconds': median_response_time,
+                'p95_seconds': p95_response_time,
+                'avg_first_token_seconds': avg_first_token
+            },
+            'token_usage': {
+                'average_per_query': avg_tokens,
+                'total_consumed': total_tokens
+            },
+            'cache_performance': {
+                'hit_rate': cache_hit_rate,
+                'hits': cache_hits,
+                'misses': total_operations - cache_hits
+            },
+            'operation_breakdown': operation_breakdown
+        }
     
     def get_slow_operations(self, threshold_seconds: float = 3.0) -> List[Dict]:
         """Get operations that took longer than threshold"""
-        with self.lock:
-            slow_ops = []
-            for metric in self.metrics:
-                if metric.duration > threshold_seconds:
-                    slow_ops.append({
-                        'timestamp': metric.timestamp,
-                        'operation': metric.operation,
-                        'duration': metric.duration,
-                        'error': metric.error,
-                        'metadata': metric.metadata
-                    })
-            
-            return sorted(slow_ops, key=lambda x: x['duration'], reverse=True)
+        rows, slots = self._snapshot()
+        slow = np.flatnonzero(rows['duration'] > threshold_seconds)
+        # Slowest first; only the matching rows are turned into dicts
+        slow = slow[np.argsort(-rows['duration'][slow], kind='stable')]
+        return [
+            {
+                'timestamp': float(rows['timestamp'][i]),
+                'operation': self._op_names[rows['op_id'][i]],
+                'duration': float(rows['duration'][i]),
+                'error': self._errors[slots[i]],
+                'metadata': self._metadata[slots[i]]
+            }
+            for i in slow
+        ]
     
     def get_error_analysis(self) -> Dict[str, Any]:
         """Analyze errors and failure patterns"""
-        with self.lock:
-            errors = [m for m in self.metrics if m.error]
-            
-            if not errors:
-                return {"error_count": 0, "error_types": {}}
-            
-            # Group errors by type
-            error_types = defaultdict(list)
-            for error_metric in errors:
-                error_type = error_metric.error.split(':')[0] if error_metric.error else 'Unknown'
-                error_types[error_type].append(error_metric)
-            
-            error_summary = {}
-            for error_type, error_list in error_types.items():
-                error_summary[error_type] = {
-                    'count': len(error_list),
-                    'recent_example': error_list[-1].error,
-                    'operations_affected': list(set(e.operation for e in error_list))
-                }
-            
-            return {
-                'error_count': len(errors),
-                'error_rate': len(errors) / len(self.metrics),
-                'error_types': error_summary
-            }
+        rows, slots = self._snapshot()
+        failed = np.flatnonzero(rows['has_error'])
+        
+        if not failed.size:
+            return {"error_count": 0, "error_types": {}}
+        
+        # Group errors by type - only the failed rows are visited
+        error_summary = {}
+        for i in failed:
+            error = self._errors[slots[i]] or 'Unknown'
+            error_type = error.split(':')[0]
+            entry = error_summary.setdefault(error_type, {'count': 0, 'recent_example': None, 'operations_affected': set()})
+            entry['count'] += 1
+            entry['recent_example'] = error
+            entry['operations_affected'].add(self._op_names[rows['op_id'][i]])
+        for entry in error_summary.values():
+            entry['operations_affected'] = list(entry['operations_affected'])
+        
+        return {
+            'error_count': int(failed.size),
+            'error_rate': failed.size / len(rows),
+            'error_types': error_summary
+        }
     
     def get_real_time_stats(self) -> Dict[str, Any]:
         """Get real-time performance statistics"""
-        with self.lock:
-            recent_metrics = [m for m in self.metrics if time.time() - m.timestamp < 300]  # Last 5 minutes
-            
-            if not recent_metrics:
-                return {"status": "No recent activity"}
-            
-            recent_response_times = [m.duration for m in recent_metrics if m.error is None]
-            recent_errors = [m for m in recent_metrics if m.error]
-            
-            return {
-                'recent_activity': {
-                    'operations_last_5min': len(recent_metrics),
-                    'avg_response_time': statistics.mean(recent_response_times) if recent_response_times else 0,
-                    'error_count': len(recent_errors),
-                    'active_operations': list(set(m.operation for m in recent_metrics))
-                },
-                'current_status': 'healthy' if len(recent_errors) / len(recent_metrics) < 0.1 else 'degraded'
-            }
+        rows, _ = self._snapshot()
+        recent = rows[rows['timestamp'] > time.time() - 300]  # Last 5 minutes
+        
+        if not recent.size:
+            return {"status": "No recent activity"}
+        
+        recent_response_times = recent['duration'][~recent['has_error']]
+        recent_errors = int(np.count_nonzero(recent['has_error']))
+        
+        return {
+            'recent_activity': {
+                'operations_last_5min': int(recent.size),
+                'avg_response_time': float(recent_response_times.mean()) if recent_response_times.size else 0,
+                'error_count': recent_errors,
+                'active_operations': [self._op_names[op_id] for op_id in np.unique(recent['op_id'])]
+            },
+            'current_status': 'healthy' if recent_errors / recent.size < 0.1 else 'degraded'
+        }
     
     def export_metrics(self, format_type: str = 'json') -> str:
         """Export metrics data"""
-        with self.lock:
-            if format_type == 'json':
-                metrics_data = [asdict(m) for m in self.metrics]
-                return json.dumps(metrics_data, indent=2)
-            else:
-                # CSV format
-                lines = ['timestamp,operation,duration,tokens_used,cache_hit,error']
-                for m in self.metrics:
-                    lines.append(f"{m.timestamp},{m.operation},{m.duration},{m.tokens_used},{m.cache_hit},{m.error or ''}")
-                return '\n'.join(lines)
+        metrics = self.metrics
+        if format_type == 'json':
+            metrics_data = [asdict(m) for m in metrics]
+            return json.dumps(metrics_data, indent=2)
+        else:
+            # CSV format
+            lines = ['timestamp,operation,duration,tokens_used,cache_hit,error']
+            for m in metrics:
+                lines.append(f"{m.timestamp},{m.operation},{m.duration},{m.tokens_used},{m.cache_hit},{m.error or ''}")
+            return '\n'.join(lines)
     
     def clear_metrics(self):
         """Clear all stored metrics"""
         with self.lock:
-            self.metrics.clear()
+            self._ring['op_id'] = -1
+            self._errors = [None] * self.max_metrics
+            self._metadata = [None] * self.max_metrics
             self.operation_stats.clear()
+            with self._p95_lock:
+                self._p95 = P2Quantile(0.95)
+                self._p95_previous = None
     
     def set_alert_thresholds(self, thresholds: Dict[str, float]):
         """Set performance alert thresholds"""
@@ -1,6 +1,10 @@
 import pandas as pd
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import create_engine, event, text
 import os
+import csv
+import io
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from modules.sheet_loader import load_sheets
@@ -21,6 +25,14 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "Skd6397@@")
 DB_NAME = os.getenv("DB_NAME", "kabaddi_data")
 
+# Connection pool sizing, derived from the API's MAX_CONCURRENT_REQUESTS (same env var and default
+# as main.py). Each admitted request holds at most one connection, so the pool keeps that many
+# open and overflow leaves headroom for startup loads and endpoints outside the request semaphore
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "10"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(MAX_CONCURRENT_REQUESTS)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", str(2 * MAX_CONCURRENT_REQUESTS)))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
 # Determine connection string based on environment
 import urllib.parse
 
@@ -80,53 +92,199 @@ def check_and_create_database():
         print("3. Password is correct")
         return False
 
+# Server-side prepared statements created on every new pooled connection, so fixed-shape
+# queries are parsed and planned once per connection and the LLM only emits the parameters.
+# recent_raids(player, minutes, opponent_code): a player's last ~3 raids per minute, optionally
+# against one opponent ('' for any), newest picked first and returned in chronological order
+RECENT_RAIDS_PREPARE_SQL = """
+PREPARE recent_raids(text, int, text) AS
+WITH recent AS (
+  SELECT
+    s."Unique_Raid_Identifier",
+    s."Attacking_Player_Name",
+    s."Attack_Result_Status",
+    s."Points_Scored_By_Attacker",
+    s."Raid_Video_URL"
+  FROM "S_RBR" s
+  WHERE s."Attacking_Player_Name" ILIKE '%' || $1 || '%'
+    AND ($3 = '' OR s."Defending_Team_Code" ILIKE $3)
+  ORDER BY s."Unique_Raid_Identifier" DESC
+  LIMIT ROUND($2 * 3)::int
+)
+SELECT
+  r."Unique_Raid_Identifier",
+  r."Attacking_Player_Name",
+  r."Attack_Result_Status",
+  r."Points_Scored_By_Attacker",
+  r."Raid_Video_URL"
+FROM recent r
+ORDER BY r."Unique_Raid_Identifier" ASC
+"""
+PREPARED_STATEMENTS = (RECENT_RAIDS_PREPARE_SQL,)
+
+def register_prepared_statements(dbapi_connection, connection_record):
+    """
+    Engine connect hook: PREPARE the statements in PREPARED_STATEMENTS on a new connection
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for statement in PREPARED_STATEMENTS:
+            cursor.execute(statement)
+        dbapi_connection.commit()
+    except psycopg2.Error:
+        # S_RBR isn't loaded yet - the pool is disposed after loading, so later connections prepare it
+        dbapi_connection.rollback()
+    finally:
+        cursor.close()
+
+# Technique lists normalized once at load time instead of in every skills query: split on commas,
+# strip trailing context ('RunningHandTouchOnRCV' -> 'RunningHandTouch') and drop 'LobbyOut%' entries.
+# Generated columns can't contain subqueries, so the normalization lives in an IMMUTABLE function.
+NORMALIZE_TECHNIQUES_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION normalize_techniques(techniques text) RETURNS text[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT ARRAY(
+    SELECT regexp_replace(TRIM(x), '(On|Under|By|With)[A-Z].*$', '', 'g')
+    FROM unnest(string_to_array(techniques, ',')) AS x
+    WHERE TRIM(x) <> '' AND TRIM(x) NOT ILIKE 'LobbyOut%'
+  )
+$$
+"""
+# raids_after_event(player, status, n): the n raids that follow, in the same match, each raid by
+# the player with that result status - e.g. the 5 raids after every time Aslam was caught
+RAIDS_AFTER_EVENT_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION raids_after_event(event_player text, event_status text, n_raids int)
+RETURNS TABLE (
+  "Unique_Raid_Identifier" bigint,
+  "Match_Number" bigint,
+  "Attacking_Player_Name" text,
+  "Attack_Result_Status" text,
+  "Points_Scored_By_Attacker" bigint,
+  "Raid_Video_URL" text
+)
+LANGUAGE sql STABLE AS $$
+  WITH numbered AS (
+    SELECT
+      r."Unique_Raid_Identifier", r."Match_Number", r."Attacking_Player_Name", r."Attack_Result_Status",
+      r."Points_Scored_By_Attacker", r."Raid_Video_URL",
+      ROW_NUMBER() OVER (PARTITION BY r."Match_Number" ORDER BY r."Unique_Raid_Identifier") AS raid_no
+    FROM "S_RBR" r
+  ),
+  events AS (
+    SELECT e."Match_Number", e.raid_no
+    FROM numbered e
+    WHERE e."Attacking_Player_Name" ILIKE '%' || event_player || '%'
+      AND e."Attack_Result_Status" ILIKE event_status
+  )
+  SELECT DISTINCT
+    nx."Unique_Raid_Identifier", nx."Match_Number", nx."Attacking_Player_Name", nx."Attack_Result_Status",
+    nx."Points_Scored_By_Attacker", nx."Raid_Video_URL"
+  FROM numbered nx
+  JOIN events ev
+    ON nx."Match_Number" = ev."Match_Number"
+    AND nx.raid_no > ev.raid_no
+    AND nx.raid_no <= ev.raid_no + n_raids
+  ORDER BY nx."Unique_Raid_Identifier"
+$$
+"""
+DERIVED_OBJECTS_SQL = (
+    NORMALIZE_TECHNIQUES_FUNCTION_SQL,
+    'ALTER TABLE "S_RBR" ADD COLUMN IF NOT EXISTS "Attack_Techniques_Clean" text[] '
+    'GENERATED ALWAYS AS (normalize_techniques("Attack_Techniques_Used")) STORED',
+    'ALTER TABLE "S_RBR" ADD COLUMN IF NOT EXISTS "Defense_Techniques_Clean" text[] '
+    'GENERATED ALWAYS AS (normalize_techniques("Defense_Techniques_Used")) STORED',
+    'CREATE INDEX IF NOT EXISTS "S_RBR_Attack_Techniques_Clean_gin" ON "S_RBR" USING GIN ("Attack_Techniques_Clean")',
+    'CREATE INDEX IF NOT EXISTS "S_RBR_Defense_Techniques_Clean_gin" ON "S_RBR" USING GIN ("Defense_Techniques_Clean")',
+    RAIDS_AFTER_EVENT_FUNCTION_SQL,
+)
+
+def ensure_derived_objects(engine):
+    """
+    Add the generated *_Techniques_Clean columns, their GIN indexes and the S_RBR query
+    functions if missing. Reloading replaces the table, so this runs after every load
+    """
+    with engine.begin() as conn:
+        for statement in DERIVED_OBJECTS_SQL:
+            conn.exec_driver_sql(statement)
+    print("✅ Normalized technique columns and query functions ready on 'S_RBR'")
+
+def check_pool_sizing() -> bool:
+    """Warn when an explicit DB_POOL_SIZE/DB_MAX_OVERFLOW can't serve MAX_CONCURRENT_REQUESTS at once"""
+    if DB_POOL_SIZE + DB_MAX_OVERFLOW >= MAX_CONCURRENT_REQUESTS:
+        return True
+    print(f"⚠️ DB_POOL_SIZE ({DB_POOL_SIZE}) + DB_MAX_OVERFLOW ({DB_MAX_OVERFLOW}) is below "
+          f"MAX_CONCURRENT_REQUESTS ({MAX_CONCURRENT_REQUESTS}) - concurrent requests will queue for a connection")
+    return False
+
 def get_database_engine():
     """
     Get PostgreSQL database engine with optimized connection pooling for better performance
     """
+    check_pool_sizing()
     try:
         engine = create_engine(
             POSTGRES_CONNECTION_STRING,
             pool_pre_ping=True,
-            pool_size=10,          # Increased pool size for better concurrency
-            max_overflow=20,       # Increased overflow for peak loads
-            pool_recycle=1800,     # Recycle connections after 30 minutes
+            pool_size=DB_POOL_SIZE,          # Sized to request concurrency (DB_POOL_SIZE)
+            max_overflow=DB_MAX_OVERFLOW,    # Extra connections for peak loads (DB_MAX_OVERFLOW)
+            pool_recycle=DB_POOL_RECYCLE,    # Recycle connections after 30 minutes by default
             # pool_timeout=30,       # REMOVED TO PREVENT TIMEOUT ISSUES
             echo=False,            # Set to True for SQL query logging
+            # Batched executemany: multi-row VALUES for INSERTs, execute_batch pages for UPDATE/DELETE
+            executemany_mode="values_plus_batch",
+            insertmanyvalues_page_size=10000,
+            executemany_batch_page_size=500,
             # Additional optimizations
             connect_args={
                 # "connect_timeout": 10,  # REMOVED TO PREVENT TIMEOUT ISSUES
                 "application_name": "kabaddi_analytics"
             }
         )
+        event.listen(engine, "connect", register_prepared_statements)
         return engine
     except Exception as e:
         print(f"❌ Error connecting to PostgreSQL: {e}")
         print(f"Please ensure PostgreSQL is running and the database '{DB_NAME}' exists")
         raise e
 
+@lru_cache(maxsize=1)
+def get_table_row_estimates(engine):
+    """
+    Planner row estimates for every table in the public schema, from one catalog query.
+    Cached per engine; call get_table_row_estimates.cache_clear() after (re)loading tables
+    """
+    with engine.connect() as conn:
+        result = conn.execute(text(
+            "SELECT relname, reltuples FROM pg_class "
+            "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+        ))
+        return {name: reltuples for name, reltuples in result}
+
 def check_tables_exist(engine):
     """
     Check if required tables exist in PostgreSQL
     """
     try:
-        inspector = inspect(engine)
-        existing_tables = inspector.get_table_names()
+        row_estimates = get_table_row_estimates(engine)
         required_tables = ["S_RBR"]  # Based on sheet_loader.py
         
         for table in required_tables:
-            if table not in existing_tables:
+            if table not in row_estimates:
                 return False
                 
-        # Check if tables have data
+        # Check if tables have data - the estimate is 0/-1 until the table is analyzed,
+        # so only then probe for a single row (never a full COUNT(*) scan)
         with engine.connect() as conn:
             for table in required_tables:
-                result = conn.execute(text(f'SELECT COUNT(*) as count FROM "{table}"'))
-                count = result.fetchone()[0]
-                if count == 0:
-                    print(f"⚠️  Table '{table}' exists but is empty")
-                    return False
-                print(f"✅ Table '{table}' has {count} rows")
+                estimate = row_estimates[table]
+                if estimate <= 0:
+                    has_rows = conn.execute(text(f'SELECT EXISTS (SELECT 1 FROM "{table}")')).scalar()
+                    if not has_rows:
+                        print(f"⚠️  Table '{table}' exists but is empty")
+                        return False
+                    print(f"✅ Table '{table}' has data")
+                else:
+                    print(f"✅ Table '{table}' has ~{int(estimate)} rows")
         
         return True
         
@@ -134,6 +292,50 @@ def check_tables_exist(engine):
         print(f"❌ Error checking tables: {e}")
         return False
 
+# Rows per COPY batch when bulk-loading DataFrames
+COPY_CHUNK_SIZE = 10_000
+
+def psql_insert_copy(table, conn, keys, data_iter):
+    """
+    pandas to_sql insertion method that streams rows through PostgreSQL COPY
+    instead of issuing INSERT statements
+    """
+    dbapi_conn = conn.connection
+    with dbapi_conn.cursor() as cur:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(data_iter)
+        buffer.seek(0)
+        
+        columns = ', '.join(f'"{k}"' for k in keys)
+        table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+        cur.copy_expert(sql=f'COPY {table_name} ({columns}) FROM STDIN WITH CSV', file=buffer)
+
+def write_table(engine, name, data, verb="Loaded"):
+    """
+    Replace one table with its rows using COPY, in its own transaction
+    """
+    # Sheets arrive as DataFrames; plain row data (records/dict of columns) is still accepted
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    with engine.begin() as conn:
+        # Bulk loads can be replayed from Excel, so skip waiting on the WAL flush (this transaction only)
+        conn.execute(text("SET LOCAL synchronous_commit = off"))
+        df.to_sql(name, conn, index=False, if_exists='replace',
+                  method=psql_insert_copy, chunksize=COPY_CHUNK_SIZE)
+    print(f"✅ {verb} table '{name}' with {len(df)} rows")
+
+def write_tables(engine, tables, verb="Loaded"):
+    """
+    Load tables concurrently - each worker takes its own pooled connection
+    """
+    workers = max(1, min(len(tables), engine.pool.size()))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_table, engine, name, data, verb) for name, data in tables.items()]
+        try:
+            for future in futures:
+                future.result()  # Re-raise the first failure
+        finally:
+            get_table_row_estimates.cache_clear()
+
 def load_into_postgresql(tables=None):
     """
     Load data into PostgreSQL database only if tables don't exist or are empty
@@ -149,6 +351,8 @@ def load_into_postgresql(tables=None):
         # Check if data already exists
         if check_tables_exist(engine):
             print("✅ Data already exists in PostgreSQL, skipping Excel load")
+            # Databases loaded before the derived objects existed get them now
+            ensure_derived_objects(engine)
             return engine
         
         print("🔄 Loading data from Excel into PostgreSQL...")
@@ -158,10 +362,10 @@ def load_into_postgresql(tables=None):
             tables = load_sheets()
         
         # Load each table into PostgreSQL
-        for name, data in tables.items():
-            df = pd.DataFrame(data)
-            df.to_sql(name, engine, index=False, if_exists='replace')
-            print(f"✅ Loaded table '{name}' with {len(df)} rows")
+        write_tables(engine, tables)
+        ensure_derived_objects(engine)
+        # Connections opened before S_RBR existed couldn't prepare statements against it
+        engine.dispose()
         
         return engine
         
@@ -184,9 +388,8 @@ def force_reload_from_excel():
     tables = load_sheets()
     engine = get_database_engine()
     
-    for name, data in tables.items():
-        df = pd.DataFrame(data)
-        df.to_sql(name, engine, index=False, if_exists='replace')
-        print(f"✅ Reloaded table '{name}' with {len(df)} rows")
+    write_tables(engine, tables, verb="Reloaded")
+    ensure_derived_objects(engine)
+    engine.dispose()
     
     return engine
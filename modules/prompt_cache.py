@@ -0,0 +1,166 @@
+"""
+Semantic Prompt Cache Module
+Reuses generated SQL for rephrasings of questions that were already answered
+"""
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from modules.prompts import KB_CACHE_KEY, TEAM_ALIASES, TEAM_ALIAS_RE
+
+PROMPT_CACHE_THRESHOLD = 0.88  # cosine similarity needed for a near match
+PROMPT_CACHE_TTL = 24 * 3600  # seconds
+PROMPT_CACHE_CONTEXT_WINDOW = 2  # previous questions that key a follow-up
+PROMPT_CACHE_MAX_ENTRIES = 5000  # per context
+
+# Words that change the phrasing but not the query. Two questions only count as the same
+# when every word they don't share is one of these, so a different player, team, number or
+# metric can never be served another question's SQL however similar the rest is.
+FILLER_WORDS = frozenset((
+    'show', 'me', 'us', 'list', 'all', 'the', 'a', 'an', 'give', 'tell', 'display', 'please',
+    'find', 'get', 'what', 'which', 'are', 'is', 'were', 'was', 'can', 'could', 'would',
+    'you', 'i', 'want', 'see', 'just', 'some'
+))
+
+NON_WORD_RE = re.compile(r'[^\w\s-]+')
+SQL_QUERY_RE = re.compile(r'^\s*(WITH|SELECT|EXECUTE)\b', re.IGNORECASE)
+
+def normalize_question(question: str) -> str:
+    """Lowercase, replace team names with their codes and strip punctuation"""
+    text = TEAM_ALIAS_RE.sub(lambda m: TEAM_ALIASES[m.group(1).lower()].lower(), question).lower()
+    return ' '.join(NON_WORD_RE.sub(' ', text).split())
+
+@dataclass(slots=True)
+class PromptCacheEntry:
+    sql: str
+    created: float
+    words: frozenset
+    terms: Counter
+    norm: float
+
+def _make_entry(normalized: str, sql: str, created: float) -> PromptCacheEntry:
+    """Entry with the unigram + bigram vector of its non-filler words precomputed"""
+    words = normalized.split()
+    content = [word for word in words if word not in FILLER_WORDS]
+    terms = Counter(content)
+    terms.update(zip(content, content[1:]))
+    norm = math.sqrt(sum(count * count for count in terms.values()))
+    return PromptCacheEntry(sql, created, frozenset(words), terms, norm)
+
+def _cosine(a: PromptCacheEntry, b: PromptCacheEntry) -> float:
+    if not a.norm or not b.norm:
+        return 0.0
+    if len(a.terms) > len(b.terms):
+        a, b = b, a
+    dot = sum(count * b.terms.get(term, 0) for term, count in a.terms.items())
+    return dot / (a.norm * b.norm)
+
+class SemanticPromptCache:
+    def __init__(self, db_path: str = "prompt_cache.db", threshold: float = PROMPT_CACHE_THRESHOLD,
+                 ttl: float = PROMPT_CACHE_TTL):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # context key -> normalized question -> entry
+        self._entries: Dict[str, Dict[str, PromptCacheEntry]] = {}
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self.init_database()
+        self._load()
+
+    def init_database(self):
+        """Initialize SQLite table holding cached SQL"""
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS prompt_cache (
+                    context TEXT,
+                    question TEXT,
+                    sql_query TEXT,
+                    kb_key TEXT,
+                    created REAL,
+                    PRIMARY KEY (context, question)
+                )
+            ''')
+
+    def _load(self):
+        """Drop entries that are expired or were generated against another KB version, index the rest"""
+        with self._conn:
+            self._conn.execute('DELETE FROM prompt_cache WHERE kb_key != ? OR created < ?',
+                               (KB_CACHE_KEY, time.time() - self.ttl))
+            rows = self._conn.execute('SELECT context, question, sql_query, created FROM prompt_cache').fetchall()
+        for context, question, sql_query, created in rows:
+            self._entries.setdefault(context, {})[question] = _make_entry(question, sql_query, created)
+
+    @staticmethod
+    def context_key(previous_questions: List[str]) -> str:
+        """Key a follow-up on the questions asked just before it"""
+        return '\n'.join(normalize_question(q) for q in previous_questions[-PROMPT_CACHE_CONTEXT_WINDOW:])
+
+    def get(self, question: str, context: str = "") -> Optional[str]:
+        """Cached SQL for this question or a rephrasing of it, if any"""
+        normalized = normalize_question(question)
+        expires_before = time.time() - self.ttl
+        with self._lock:
+            bucket = self._entries.get(context)
+            entry = bucket.get(normalized) if bucket else None
+            if bucket and entry is None:
+                probe = _make_entry(normalized, "", 0.0)
+                best_score = self.threshold
+                for candidate in bucket.values():
+                    if (candidate.words ^ probe.words) <= FILLER_WORDS:
+                        score = _cosine(probe, candidate)
+                        if score >= best_score:
+                            entry, best_score = candidate, score
+            if entry is not None and entry.created >= expires_before:
+                self.hits += 1
+                return entry.sql
+            self.misses += 1
+            return None
+
+    def set(self, question: str, sql_query: str, context: str = "") -> None:
+        """Cache SQL for a question; refusals and other non-queries are not stored"""
+        if not SQL_QUERY_RE.match(sql_query):
+            return
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            bucket = self._entries.setdefault(context, {})
+            if normalized not in bucket and len(bucket) >= PROMPT_CACHE_MAX_ENTRIES:
+                oldest = min(bucket, key=lambda q: bucket[q].created)
+                del bucket[oldest]
+            bucket[normalized] = _make_entry(normalized, sql_query, now)
+            try:
+                with self._conn:
+                    self._conn.execute('INSERT OR REPLACE INTO prompt_cache VALUES (?, ?, ?, ?, ?)',
+                                       (context, normalized, sql_query, KB_CACHE_KEY, now))
+            except sqlite3.Error as e:
+                print(f"⚠️ Could not persist prompt cache entry: {e}")
+
+    def clear(self):
+        """Remove all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            with self._conn:
+                self._conn.execute('DELETE FROM prompt_cache')
+
+    def get_stats(self) -> Dict[str, float]:
+        """Hit/miss counters and size"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': sum(len(bucket) for bucket in self._entries.values())
+        }
+
+# Global semantic prompt cache instance
+prompt_cache = SemanticPromptCache()
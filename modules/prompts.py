@@ -1,71 +1,136 @@
-SYSTEM_PROMPT_TEMPLATE = """
-You are a world-class, stateful PostgreSQL expert and a specialized Kabaddi domain analyst. Your sole purpose is to convert a user's natural language question into a precise and executable PostgreSQL query. You MUST remember the context of previous questions to answer follow-ups. You will follow the instructions below with absolute precision.
-
-Step-by-Step Thought Process:
-Analyze User Intent & Context: Carefully read the user's current question and consider any prior conversational context. Identify key entities, actions, and desired metrics.
-Review the Raw Data Preview: Analyze the raw query output below to see the exact format of the data, especially how comma-separated lists and empty strings ('') are stored. This is your ground truth.
-Determine the Required Output Type: Analyze the user's phrasing to decide the query's final output format.
-Is it QUANTITATIVE? (Keywords: "how many", "what is the total", "count", "sum"). The goal is a single aggregated value.
-Is it QUALITATIVE? (Keywords: "show me", "list", "find", "what are", "which raids"). The goal is a list of specific, detailed records.
-Identify Query Logic Pattern: Determine the complexity of the request.
-Simple Filter/Count: Use the expanded 📖 Domain-Aware Mappings.
-Calculation/Parsing: Use 💡 Advanced Functions & Approved Logic.
-Sequential/State-Tracking: You MUST use 📈 Sequential & State-Tracking Logic.
-Complex Aggregation/Subquery: You MUST use 🧠 Complex Aggregation & Subquery Patterns.
-Construct the PostgreSQL Query: Build a single, syntactically correct, and readable query. Use Common Table Expressions (CTEs) (WITH) for any query that is not a simple SELECT ... FROM ... WHERE.
-Apply Final Output Rules: Ensure all mandatory formatting and content rules are met.
-
-⚙️ EXACT TABLE SCHEMA - USE THESE COLUMN NAMES ONLY:
-CRITICAL: You MUST use ONLY the exact, case-sensitive, quoted column names defined below.
-   Table "public.S_RBR"
-                Column                |  Type
---------------------------------------+--------
- Season                               | text
- Unique_Raid_Identifier               | bigint
- Match_Number                         | bigint
- Team_A_Name                          | text
- Team_B_Name                          | text
- Game_Half_Period                     | text
- Attacking_Player_Name                | text
- Attacking_Team_Code                  | text
- Defending_Team_Code                  | text
- Defending_Team_Players_At_Raid_Start | text
- Attacking_Team_Players_At_Raid_Start | text
- Primary_Defender_Name                | text
- Secondary_Defender_Name              | text
- Do_Or_Die_Mandatory_Raid             | bigint
- Bonus_Point_Available                | bigint
- Super_Tackle_Opportunity             | bigint
- Defending_Team_Players_At_Raid_End   | text
- Attacking_Team_Players_At_Raid_End   | text
- Defending_Players_Eliminated_Names   | text
- Attacking_Players_Eliminated_Names   | text
- Attack_Result_Status                 | text
- Defense_Result_Status                | text
- Team_That_Eliminated_All_Opponents   | text
- Points_Scored_By_Attacker            | bigint
- Points_Scored_By_Defenders           | bigint
- Attack_Techniques_Used               | text
- Defense_Techniques_Used              | text
- Raid_Video_URL                       | text
- Empty_Raid_Penalty_Sequence          | text
- Match_City_Venue                     | text
- Match_Winner_Team                    | text
- Final_Team_A_Score                   | bigint
- Final_Team_B_Score                   | bigint
- 
+import base64
+import gzip
+import hashlib
+import re
+
+from modules.sql_examples import example_block
+
+# Prompt fragments. Each appears once and the templates below are composed from them with
+# _join_sections, so the SQL prompts share a byte-identical prefix up to where they diverge.
+
+def _join_sections(*sections: str) -> str:
+    """Sections in the given order, stripped and separated by one blank line, so stray
+    whitespace edits in a fragment don't change the rendered prompt"""
+    return "\n\n".join(section.strip() for section in sections) + "\n\n"
+
+# Column -> type for "S_RBR"; the schema fragment is rendered from it and the JSON query
+# compiler (modules/sql_compile.py) validates column names against it
+S_RBR_COLUMNS = {
+    "Season": "text",
+    "Unique_Raid_Identifier": "bigint",
+    "Match_Number": "bigint",
+    "Team_A_Name": "text",
+    "Team_B_Name": "text",
+    "Game_Half_Period": "text",
+    "Attacking_Player_Name": "text",
+    "Attacking_Team_Code": "text",
+    "Defending_Team_Code": "text",
+    "Defending_Team_Players_At_Raid_Start": "text",
+    "Attacking_Team_Players_At_Raid_Start": "text",
+    "Primary_Defender_Name": "text",
+    "Secondary_Defender_Name": "text",
+    "Do_Or_Die_Mandatory_Raid": "bigint",
+    "Bonus_Point_Available": "bigint",
+    "Super_Tackle_Opportunity": "bigint",
+    "Defending_Team_Players_At_Raid_End": "text",
+    "Attacking_Team_Players_At_Raid_End": "text",
+    "Defending_Players_Eliminated_Names": "text",
+    "Attacking_Players_Eliminated_Names": "text",
+    "Attack_Result_Status": "text",
+    "Defense_Result_Status": "text",
+    "Team_That_Eliminated_All_Opponents": "text",
+    "Points_Scored_By_Attacker": "bigint",
+    "Points_Scored_By_Defenders": "bigint",
+    "Attack_Techniques_Used": "text",
+    "Defense_Techniques_Used": "text",
+    "Raid_Video_URL": "text",
+    "Empty_Raid_Penalty_Sequence": "text",
+    "Match_City_Venue": "text",
+    "Match_Winner_Team": "text",
+    "Final_Team_A_Score": "bigint",
+    "Final_Team_B_Score": "bigint",
+    "Attack_Techniques_Clean": "text[]",
+    "Defense_Techniques_Clean": "text[]",
+}
+
+_SCHEMA = (
+    "\n⚙️ EXACT TABLE SCHEMA - USE THESE COLUMN NAMES ONLY:\n"
+    "CRITICAL: You MUST use ONLY the exact, case-sensitive, quoted column names defined below.\n"
+    '   Table "public.S_RBR"\n'
+    "                Column                |  Type\n"
+    "--------------------------------------+--------\n"
+    + "".join(f" {name:<36} | {type_}\n" for name, type_ in S_RBR_COLUMNS.items())
+    + " \n"
+)
 
+_RAW_PREVIEW = """
 📊 RAW DATA PREVIEW - GROUND TRUTH FROM POSTGRESQL:
 This is the exact format of the data in the database. Base all your assumptions about data values on this sample.
 
-   kabaddi_data=# select * from "S_RBR" limit 3;
- Season | Unique_Raid_Identifier | Match_Number | Team_A_Name | Team_B_Name | Game_Half_Period |  Attacking_Player_Name  | Attacking_Team_Code | Defending_Team_Code |                                                                  Defending_Team_Players_At_Raid_Start                                                                  |                                                                Attacking_Team_Players_At_Raid_Start                                                                 |     Primary_Defender_Name     | Secondary_Defender_Name | Do_Or_Die_Mandatory_Raid | Bonus_Point_Available | Super_Tackle_Opportunity |                                                                   Defending_Team_Players_At_Raid_End                                                                   |                                                                   Attacking_Team_Players_At_Raid_End                                                                   | Defending_Players_Eliminated_Names | Attacking_Players_Eliminated_Names | Attack_Result_Status | Defense_Result_Status | Team_That_Eliminated_All_Opponents | Points_Scored_By_Attacker | Points_Scored_By_Defenders |           Attack_Techniques_Used            | Defense_Techniques_Used |                                     Raid_Video_URL                                     | Empty_Raid_Penalty_Sequence | Match_City_Venue | Match_Winner_Team | Final_Team_A_Score | Final_Team_B_Score
---------+------------------------+--------------+-------------+-------------+------------------+-------------------------+---------------------+---------------------+------------------------------------------------------------------------------------------------------------------------------------------------------------------------+---------------------------------------------------------------------------------------------------------------------------------------------------------------------+-------------------------------+-------------------------+--------------------------+-----------------------+--------------------------+------------------------------------------------------------------------------------------------------------------------------------------------------------------------+------------------------------------------------------------------------------------------------------------------------------------------------------------------------+------------------------------------+------------------------------------+----------------------+-----------------------+------------------------------------+---------------------------+----------------------------+---------------------------------------------+-------------------------+----------------------------------------------------------------------------------------+-----------------------------+------------------+-------------------+--------------------+--------------------
- PKL11  |              892001001 |       892001 | TT          | BB          | FirstHalf        | Pawan Sherawat_RIN_TT17 | TT                  | BB                  | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Surinder Dehal_RCV_BB55, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22 | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Ajit Pandurang Pawar_LCV_TT12, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1 | Surinder Dehal_RCV_BB55       |                         |                        0 |                     1 |                        0 | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22                          | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Ajit Pandurang Pawar_LCV_TT12, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1    | Surinder Dehal_RCV_BB55            |                                    | Successful           | Failed/Unsuccessful   |                                    |                         2 |                          0 | StandingBonusUnderLIN,RunningHandTouchOnRCV |                         | https://vod.cricket-21.com/volume1/Kabaddi%20Videos/4231/TT%20Vs%20BB%2018-10-24_1.MP4 | First                       | 13_PlayOffs      | TT                |                  2 |                  0
- PKL11  |              892001002 |       892001 | TT          | BB          | FirstHalf        | Pradeep Narwal_LIN_BB9  | BB                  | TT                  | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Ajit Pandurang Pawar_LCV_TT12, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1    | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22                       | Ajit Pandurang Pawar_LCV_TT12 |                         |                        0 |                     0 |                        0 | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1                                   | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Surinder Dehal_RCV_BB55, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22 | Ajit Pandurang Pawar_LCV_TT12      |                                    | Successful           | Failed/Unsuccessful   |                                    |                         1 |                          0 |                                             | ThighHoldByLCV          | https://vod.cricket-21.com/volume1/Kabaddi%20Videos/4231/TT%20Vs%20BB%2018-10-24_2.MP4 | First                       | 13_PlayOffs      | TT                |                  2 |                  1
- PKL11  |              892001003 |       892001 | TT          | BB          | FirstHalf        | Pawan Sherawat_RIN_TT17 | TT                  | BB                  | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Surinder Dehal_RCV_BB55, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22 | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1                                |                               |                         |                        0 |                     1 |                        0 | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Surinder Dehal_RCV_BB55, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22 | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1                                   |                                    |                                    | Successful           | Failed/Unsuccessful   |                                    |                         1 |                          0 | StandingBonusUnderLIN                       |                         | https://vod.cricket-21.com/volume1/Kabaddi%20Videos/4231/TT%20Vs%20BB%2018-10-24_3.MP4 | First                       | 13_PlayOffs      | TT                |                  3 |                  1
- 
+Example row (column: value):
+ Season: PKL11
+ Unique_Raid_Identifier: 892001001
+ Match_Number: 892001
+ Team_A_Name: TT
+ Team_B_Name: BB
+ Game_Half_Period: FirstHalf
+ Attacking_Player_Name: Pawan Sherawat_RIN_TT17
+ Attacking_Team_Code: TT
+ Defending_Team_Code: BB
+ Defending_Team_Players_At_Raid_Start: Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Surinder Dehal_RCV_BB55, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22
+ Attacking_Team_Players_At_Raid_Start: Ankit_LCNR_TT2, Krishan_RCNR_TT4, Ajit Pandurang Pawar_LCV_TT12, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1
+ Primary_Defender_Name: Surinder Dehal_RCV_BB55
+ Secondary_Defender_Name: ''
+ Do_Or_Die_Mandatory_Raid: 0
+ Bonus_Point_Available: 1
+ Super_Tackle_Opportunity: 0
+ Defending_Team_Players_At_Raid_End: Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22
+ Attacking_Team_Players_At_Raid_End: Ankit_LCNR_TT2, Krishan_RCNR_TT4, Ajit Pandurang Pawar_LCV_TT12, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1
+ Defending_Players_Eliminated_Names: Surinder Dehal_RCV_BB55
+ Attacking_Players_Eliminated_Names: ''
+ Attack_Result_Status: Successful
+ Defense_Result_Status: Failed/Unsuccessful
+ Team_That_Eliminated_All_Opponents: ''
+ Points_Scored_By_Attacker: 2
+ Points_Scored_By_Defenders: 0
+ Attack_Techniques_Used: StandingBonusUnderLIN,RunningHandTouchOnRCV
+ Defense_Techniques_Used: ''
+ Raid_Video_URL: https://vod.cricket-21.com/volume1/Kabaddi%20Videos/4231/TT%20Vs%20BB%2018-10-24_1.MP4
+ Empty_Raid_Penalty_Sequence: First
+ Match_City_Venue: 13_PlayOffs
+ Match_Winner_Team: TT
+ Final_Team_A_Score: 2
+ Final_Team_B_Score: 0
+
+Format rules:
+- Defending_Team_Players_At_Raid_Start/End, Attacking_Team_Players_At_Raid_Start/End and the *_Eliminated_Names columns are COMMA+SPACE separated lists of player-name tokens; empty strings ('') mean absent.
+- Attack_Techniques_Used and Defense_Techniques_Used are comma-separated lists without spaces; empty strings ('') mean no technique was recorded.
+"""
 
+# The full three-row preview (the psql output in the reference comment at the end of this file),
+# for debugging and ad-hoc prompts. Stored gzip+base64 and decompressed on first use, see
+# __getattr__ below
+_RAW_PREVIEW_FULL_GZ = (
+    "H4sIAAAAAAACA+1Y3XLiNhS+5yk02+lNgYAN2+5upxc4IT9NAtQ2yaVGsUWsIEtUktMykyfobR+gr9hH6LEc8gsmCZAm7XoY"
+    "g76j86Nz5M9HVP7+688/kN85RTudsIMGfvfkoHuK6mjP7w97Oyj0h+E+2vX7x2jQD8I9vxv8cvSlEiZMI/iYhCL6O4kMGkmV"
+    "EoPkyGIxMQQxcfP7jGi6hTy4I8I5mspMIaJ1lk4Mk0IjciYzU2hdEp5RjWSuDB40SSecblUqCKEx2IljhvN5P32DNOUUPH+H"
+    "Rkqm6EOAfc//gDhLmUGtHysooESDmSs0FOzXjGKfsBgfxFQYNmJUgeCYmCjBvSw9s8OQkhR3cI+kdDbyZqM9+ML7hI/wgCom"
+    "Y4BQxxgSjZk4xwNOplQVc0FyK7BGtmWcm9ihIyrih+jK1wOzRSgad0yx4MAQZVb3snKgD3KymTCLKAeKpURNcZGZm7pYeUAj"
+    "KeLHUiiPxH2FdxjFxwRmGAlz8tBA5EmRaTyQTBjcuSSMkzOeqwTZBPRDWBenuD+ZSGUywcx0HWVdVteuiNEbKOvyyq4r0Nt8"
+    "zDx082ddEENjW0N978lbOgn7VGfc5DvPZHrmQNNHuF1VmBBz11aHc1txAXSST7KbQ+Mgkgqk3hQXTiyvPJLNtp6+l//rsEIa"
+    "JZawNB5qGs9JAsT4cNLT6mjrccJiKvHQP3pi3rtA0sWTANQnCIdBQMGziOgNhW7DpscnVGS30CkTIn84IHmA7ULaOL4mWJuI"
+    "+6BXgJX69VWtL7iqZcOyUbnZBZLnoG/wqv4noqy+RLO6PpWvZd1ooKtMqm7KcXV9+a++fh2rz5VWn2pkLlhBg8Mjx3nUTXz6"
+    "7DabDnxuBAWSv1PDu68Yz7s72mVKm7zVvoUG5DciUJBQBT+grzjo4TB0fnhgaL7BW7THDJxJfDDB8dF2z8ee57Rr6GfCkJeQ"
+    "c3CB/SMw7Xnf16CJJDGlE9Qjys63+GfAoU+ldAwGTnJ9pwZdoGL52xxezgnM9K3g48ca6lwwMZ4S1NGJHNs1qGs7DhgKSKbI"
+    "WQIOoNvM1WxArps3KGLMTBFiGLo1dKiYTvLoCqRtTRuwKGKwIc5ntsEzpMWtLcpX7vScKGiCTTIh/DoVvlUDIfS9F5Qa0CNw"
+    "mJtpNWvohF2QKYg5G9sFAGq737nrXtpZLpQ0F4iccpUNlfWF1StZ9nsoa3FIKq3s0w8OuaUoolqPMn4P3oUzFI0bQ6Hvyq9W"
+    "O7G4ZQbyjQIdvT1A2OPcMF8grLrmZ0IAuA+yUGZR0hew3tLtmxgz0V8ajUsZb0WKQZdv6q6zFckUIJ6l1GkcFn9VfOs2bbut"
+    "G2235TTCMAc03DwPbs6nutOsu23sbB0P2jPmW+jWadlDTX800jPoMftdPTEvzWWk7a5O2nMftcX0PJ/K381D8x5o6Ko8Wesk"
+    "7Wa5yvKyvk7dlrLN+2kaSiv7VknbWUbaz/uTKEzYebIveexNYekbJW339UnbWUbara+d9ro77X+fhq5eLH8nnfb/s6yrc+fb"
+    "Je25nfYLtu/aSbu1UdJuLSDtyj/9hv0rZx0AAA=="
+)
+
+_DOMAIN_MAPPINGS = """
 📖 Domain-Aware Mappings
 Natural Language Term	→ SQL Logic or Transformation (Use EXACT Column Names)
 raid sequence in a match	→ ("Unique_Raid_Identifier" % 1000)
@@ -73,8 +138,8 @@ defense of 3 or less	→ "Super_Tackle_Opportunity" = 1
 less than 4 defenders	→ "Super_Tackle_Opportunity" = 1
 super tackle chance	→ "Super_Tackle_Opportunity" = 1
 regular defense (4+)	→ "Super_Tackle_Opportunity" = 0
-left raider	→ "Attacking_Player_Name" ILIKE '%_LIN_%'
-right raider	→ "Attacking_Player_Name" ILIKE '%_RIN_%'
+left raider	→ "Attacking_Player_Name" ILIKE '%\\_LIN\\_%' ESCAPE '\\'
+right raider	→ "Attacking_Player_Name" ILIKE '%\\_RIN\\_%' ESCAPE '\\'
 attacking player / raider	→ "Attacking_Player_Name"
 primary defender	→ "Primary_Defender_Name"
 secondary defender	→ "Secondary_Defender_Name"
@@ -87,7 +152,7 @@ bonus point available	→ "Bonus_Point_Available" = 1
 do-or-die raid (DOD)	→ "Do_Or_Die_Mandatory_Raid" = 1
 successful defense	→ "Defense_Result_Status" ILIKE 'Successful'
 unsuccessful defense	→ "Defense_Result_Status" ILIKE 'Failed/Unsuccessful'
-all out inflicted	→ "Team_That_Eliminated_All_Opponents" IS NOT NULL
+all out inflicted	→ "Team_That_Eliminated_All_Opponents" <> ''
 period 1 / first half	→ "Game_Half_Period" ILIKE 'FirstHalf'
 period 2 / second half	→ "Game_Half_Period" ILIKE 'SecondHalf'
 attacking team	→ "Attacking_Team_Code"
@@ -95,165 +160,160 @@ defending team	→ "Defending_Team_Code"
 match winner	→ "Match_Winner_Team"
 raider name	→ "Attacking_Player_Name"
 defender name	→ "Primary_Defender_Name"
-raider skill / attacking skill / raider skills	→ Use "Attack_Techniques_Used" (see Skill Normalization Rules below)
-defender skill / defense skill / tackle techniques	→ Use "Defense_Techniques_Used" (see Skill Normalization Rules below)
- 
+raider skill / attacking skill / raider skills	→ Use "Attack_Techniques_Clean" (see Skill Normalization Rules below)
+defender skill / defense skill / tackle techniques	→ Use "Defense_Techniques_Clean" (see Skill Normalization Rules below)
+ """
+_GRAMMAR_LEGEND = """
+🔤 Query Grammar Notation
+Patterns below are grammars: fill every <placeholder>, drop or keep [optional] parts, pick one of [a | b].
+<default_cols> = "Unique_Raid_Identifier", "Attacking_Player_Name", "Attack_Result_Status", "Points_Scored_By_Attacker", "Raid_Video_URL"
+<player_filter> = "Attacking_Player_Name" ILIKE '%<player name>%'
+"""
+
+_SKILL_NORMALIZATION = """
 🧩 Skill Normalization Rules (for Skills/Techniques requests)
-- Techniques strings may include context suffixes like 'OnRCV', 'UnderLIN', 'ByRCNR', 'WithLCV'. When answering, normalize to the base skill:
-  - Strip any trailing context beginning with 'On', 'Under', 'By', or 'With' followed by uppercase letters.
-  - Example: 'RunningHandTouchOnRCV' → 'RunningHandTouch'; 'StandingBonusUnderLIN' → 'StandingBonus'.
-- Exclude non-skills: any value starting with 'LobbyOut' must NOT be counted or shown.
-- Recommended SQL pattern (raider skills):
-  WITH raw AS (
-    SELECT TRIM(x) AS raw_skill
-    FROM "S_RBR", LATERAL string_to_array("Attack_Techniques_Used", ',') AS x
-    WHERE "Attack_Techniques_Used" IS NOT NULL AND TRIM("Attack_Techniques_Used") <> ''
-  )
-  SELECT regexp_replace(raw_skill, '(On|Under|By|With)[A-Z].*$', '', 'g') AS skill, COUNT(*)
-  FROM raw
-  WHERE raw_skill NOT ILIKE 'LobbyOut%'
-  GROUP BY skill
-  ORDER BY COUNT(*) DESC;
-- Use the same pattern for defender skills by replacing "Attack_Techniques_Used" with "Defense_Techniques_Used".
+- "Attack_Techniques_Clean" and "Defense_Techniques_Clean" are text[] arrays of ALREADY NORMALIZED skills: context suffixes ('OnRCV', 'UnderLIN', 'ByRCNR', 'WithLCV') are stripped and 'LobbyOut' entries removed (e.g., 'RunningHandTouchOnRCV' → 'RunningHandTouch').
+- Never split or regexp_replace "Attack_Techniques_Used"/"Defense_Techniques_Used" for skills; use unnest() on the clean columns instead.
+- Skills grammar: SELECT skill, COUNT(*) FROM "S_RBR", unnest(<skills_col>) AS skill [WHERE <filters>] GROUP BY skill ORDER BY COUNT(*) DESC [LIMIT <k>];
+- To filter raids by a skill, use array containment: WHERE "Attack_Techniques_Clean" @> ARRAY['RunningHandTouch'].
+- <skills_col> is "Attack_Techniques_Clean" for raider skills and "Defense_Techniques_Clean" for defender skills.
+"""
 
+_NAME_LOGIC = """
  🧬 Player and Team Name Logic:
 Player Name Format: PlayerFullName_MainPlayingPosition_TeamShortCodeJerseyNumber (e.g., Pawan Sherawat_RIN_TT17).
 To Find a Player's Raids: Use ILIKE on the "Attacking_Player_Name" column (e.g., WHERE "Attacking_Player_Name" ILIKE '%Pawan Sherawat%').
 To Find a Player's Tackles: Use ILIKE on the "Primary_Defender_Name" column or search within "Defending_Players_Eliminated_Names".
+Team Names: Teams in the question are already resolved to "Full Name (CODE)", e.g. "Puneri Paltan (PU)". The data stores only the CODE, so filter team columns with it (e.g., "Defending_Team_Code" ILIKE 'PU').
+"""
 
-| Code | → | Team Name               |
-|------|---|-------------------------|
-| TT   | → | Telugu Titans           |
-| BB   | → | Bengaluru Bulls         |
-| BW   | → | Bengal Warriors         |
-| DD   | → | Dabang Delhi            |
-| GG   | → | Gujarat Giants          |
-| HS   | → | Haryana Steelers        |
-| JP   | → | Jaipur Pink Panthers    |
-| PP   | → | Patna Pirates           |
-| PU   | → | Puneri Paltan           |
-| TN   | → | Tamil Thalaivas         |
-| UM   | → | U Mumba                 |
-| UP   | → | U.P. Yoddhas            |
+# Team codes used in the data, and the casual names users type for each team
+TEAM_CODES = {
+    "TT": "Telugu Titans",
+    "BB": "Bengaluru Bulls",
+    "BW": "Bengal Warriors",
+    "DD": "Dabang Delhi",
+    "GG": "Gujarat Giants",
+    "HS": "Haryana Steelers",
+    "JP": "Jaipur Pink Panthers",
+    "PP": "Patna Pirates",
+    "PU": "Puneri Paltan",
+    "TN": "Tamil Thalaivas",
+    "UM": "U Mumba",
+    "UP": "U.P. Yoddhas",
+}
+TEAM_ALIASES = {
+    **{name.lower(): code for code, name in TEAM_CODES.items()},
+    "telugu": "TT", "titans": "TT",
+    "bengaluru": "BB", "bangalore": "BB", "bulls": "BB",
+    "bengal": "BW", "warriors": "BW",
+    "delhi": "DD", "dabang": "DD",
+    "gujarat": "GG", "giants": "GG",
+    "haryana": "HS", "steelers": "HS",
+    "jaipur": "JP", "pink panthers": "JP", "panthers": "JP",
+    "patna": "PP", "pirates": "PP",
+    "pune": "PU", "puneri": "PU", "paltan": "PU",
+    "tamil": "TN", "thalaivas": "TN",
+    "mumbai": "UM", "mumba": "UM",
+    "up yoddhas": "UP", "yoddhas": "UP",
+}
+# Longest alias first; an already-expanded "Name (CODE)" is matched whole and left as is
+TEAM_ALIAS_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(alias) for alias in sorted(TEAM_ALIASES, key=len, reverse=True)) + r')\b(\s*\([A-Z]{2}\))?',
+    re.IGNORECASE
+)
 
+# Aliases that are also host cities; after "in"/"at"/"venue" they name the venue
+# ("Match_City_Venue"), not the team, and stay as typed
+CITY_ALIASES = frozenset(("bengaluru", "bangalore", "delhi", "jaipur", "patna", "pune", "mumbai"))
+VENUE_CONTEXT_RE = re.compile(r'\b(?:in|at|venue:?)\s+$', re.IGNORECASE)
+
+def expand_team_aliases(text: str) -> str:
+    """Rewrite team names and nicknames in user input as "Full Name (CODE)" before the LLM sees them"""
+    def expand(match):
+        if match.group(2):
+            return match.group(0)
+        alias = match.group(1).lower()
+        if alias in CITY_ALIASES and VENUE_CONTEXT_RE.search(match.string, 0, match.start()):
+            return match.group(0)
+        code = TEAM_ALIASES[alias]
+        return f"{TEAM_CODES[code]} ({code})"
+    return TEAM_ALIAS_RE.sub(expand, text)
+
+_TIME_WINDOW = """
 ⏱️ Time-Window Approximation (No Timestamps in Data)
 Goal	How to interpret queries like "last 5 minutes" without raid timestamps
-Principle	There are ~3 raids per minute (1 raid ≈ 20 seconds). Convert minutes to an approximate number of raids.
-Conversion	N_raids ≈ ROUND(minutes × 3). Examples: 1 min → 3 raids, 5 min → 15 raids, 10 min → 30 raids.
-Default Scope	If no match is specified, interpret "last" globally by chronology (highest "Unique_Raid_Identifier" first). If a match is specified, interpret within that match (order by "Unique_Raid_Identifier" within the match).
-Opponent Alias Mapping	Map casual city names to official team names/codes for filtering: "pune" → Team 'Puneri Paltan' (code 'PU'). Use ILIKE on team names and/or codes.
-SQL Pattern	To fetch the last N raids for a player (optionally vs opponent), first select newest raids by ordering DESC and LIMIT N, then re-order ASC for readability.
+Principle	There are ~3 raids per minute (1 raid ≈ 20 seconds). The server converts minutes to raids (N_raids = ROUND(minutes × 3)), newest raids first by "Unique_Raid_Identifier", returned in chronological order.
+Prepared Statement	recent_raids(player_name, minutes, opponent_team_code) is already prepared on the database. Pass the opponent's team code (e.g., 'PU' for Pune), or '' for any opponent. Pass '' as player_name for the last raids of the whole season.
 Example Goal	"Pawan last 5 minutes raids against Pune"
-Mandatory Query Structure:
-```sql
-WITH params AS (
-  SELECT 5::int AS minutes, ROUND(5 * 3)::int AS n_raids
-), recent AS (
-  SELECT
-    s."Unique_Raid_Identifier",
-    s."Match_Number",
-    s."Attacking_Player_Name",
-    s."Defending_Team_Code",
-    s."Team_B_Name",
-    s."Attack_Result_Status",
-    s."Points_Scored_By_Attacker",
-    s."Raid_Video_URL"
-  FROM "S_RBR" s, params p
-  WHERE s."Attacking_Player_Name" ILIKE '%Pawan%'
-    AND (
-      s."Defending_Team_Code" ILIKE 'PU'
-      OR s."Team_A_Name" ILIKE '%Puner%'
-      OR s."Team_B_Name" ILIKE '%Puner%'
-      OR s."Team_A_Name" ILIKE '%Puneri Paltan%'
-      OR s."Team_B_Name" ILIKE '%Puneri Paltan%'
-    )
-  ORDER BY s."Unique_Raid_Identifier" DESC
-  LIMIT (SELECT n_raids FROM params)
-)
-SELECT
-  r."Unique_Raid_Identifier",
-  r."Attacking_Player_Name",
-  r."Attack_Result_Status",
-  r."Points_Scored_By_Attacker",
-  r."Raid_Video_URL"
-FROM recent r
-ORDER BY r."Unique_Raid_Identifier" ASC;
-```
-Notes	When user specifies minutes (e.g., 5), you MUST convert to raids using the conversion above and apply the DESC/LIMIT pattern. Prefer code + official team name filters to catch aliases.
+Mandatory Query: For minute-window queries, emit ONLY the EXECUTE statement, nothing else:
+EXECUTE recent_raids('Pawan', 5, 'PU');
+Match Scope	If a specific match is named, write the query yourself: WITH recent AS (SELECT <default_cols> FROM "S_RBR" WHERE "Match_Number" = <match> AND <player_filter> ORDER BY "Unique_Raid_Identifier" DESC LIMIT <N_raids>) SELECT <default_cols> FROM recent ORDER BY "Unique_Raid_Identifier" ASC;
+"""
 
+_ADVANCED = """
 💡 Advanced Functions & Approved Logic (For Parsing & Calculations)
 Goal	Approved Pattern / Function & Example
 Calculate Rate/Percentage	(COUNT(*) FILTER (WHERE <condition>) * 100.0) / COUNT(*)
 Count Items in a List	cardinality(string_to_array("Column_Name", ','))
 Extract Clean Player Name	split_part("Player_Column_Name", '_', 1)
-Parse & Aggregate Skills	Goal: "Top 3 skills of Pawan." Use normalization: split the list, strip trailing context using regexp_replace('(On|Under|By|With)[A-Z].*$', ''), and exclude 'LobbyOut%'. Example:
-  WITH raw AS (
-    SELECT TRIM(x) AS raw_skill
-    FROM "S_RBR", LATERAL string_to_array("Attack_Techniques_Used", ',') AS x
-    WHERE "Attacking_Player_Name" ILIKE '%Pawan%'
-      AND "Attack_Techniques_Used" IS NOT NULL AND TRIM("Attack_Techniques_Used") <> ''
-  )
-  SELECT regexp_replace(raw_skill, '(On|Under|By|With)[A-Z].*$', '', 'g') AS skill, COUNT(*)
-  FROM raw
-  WHERE raw_skill NOT ILIKE 'LobbyOut%'
-  GROUP BY skill
-  ORDER BY COUNT(*) DESC
-  LIMIT 3;
-
-📈 Sequential & State-Tracking Logic (Window Functions)
-MANDATORY for queries about sequences (e.g., "next N raids after X event").
-Example Goal: "Show the next 5 raid videos each time Aslam got out raiding."
-Mandatory Query Structure:
-code
-SQL
-WITH raid_context AS (
-    SELECT
-        "Unique_Raid_Identifier",
-        "Match_Number",
-        LAG("Attacking_Player_Name", 1) OVER (PARTITION BY "Match_Number" ORDER BY "Unique_Raid_Identifier") AS prev_raider_name,
-        LAG("Attack_Result_Status", 1) OVER (PARTITION BY "Match_Number" ORDER BY "Unique_Raid_Identifier") AS prev_raid_status
-    FROM "S_RBR"
-),
-raids_after_event AS (
-  SELECT "Unique_Raid_Identifier", "Match_Number"
-  FROM raid_context
-  WHERE prev_raider_name ILIKE '%Aslam%' AND prev_raid_status ILIKE 'Failed/Unsuccessful'
-)
-SELECT
-  s."Unique_Raid_Identifier", s."Attacking_Player_Name", s."Attack_Result_Status", s."Raid_Video_URL"
-FROM "S_RBR" s
-JOIN raids_after_event rae
-  ON s."Match_Number" = rae."Match_Number"
-  AND s."Unique_Raid_Identifier" > rae."Unique_Raid_Identifier"
-  AND s."Unique_Raid_Identifier" <= rae."Unique_Raid_Identifier" + 5
-ORDER BY s."Unique_Raid_Identifier";```
-
----
-
-#### 🧠 Complex Aggregation & Subquery Patterns
-*MANDATORY for multi-step logic where a filter depends on an aggregated result.*
-**Example Goal:** "Show all successful raids by the season's top raider."
-**Mandatory Query Structure:**
-```sql
-WITH top_raider AS (
-  SELECT split_part("Attacking_Player_Name", '_', 1) as player_name
-  FROM "S_RBR"
-  WHERE "Attacking_Player_Name" IS NOT NULL AND "Attacking_Player_Name" != ''
-  GROUP BY player_name
-  ORDER BY SUM("Points_Scored_By_Attacker") DESC
-  LIMIT 1
-)
-SELECT
-  s."Unique_Raid_Identifier", s."Attacking_Player_Name", s."Points_Scored_By_Attacker", s."Raid_Video_URL"
-FROM "S_RBR" s
-WHERE
-  split_part(s."Attacking_Player_Name", '_', 1) = (SELECT player_name FROM top_raider)
-  AND s."Attack_Result_Status" ILIKE 'Successful';
+Parse & Aggregate Skills	Skills grammar above. Example ("Top 3 skills of Pawan."): SELECT skill, COUNT(*) FROM "S_RBR", unnest("Attack_Techniques_Clean") AS skill WHERE "Attacking_Player_Name" ILIKE '%Pawan%' GROUP BY skill ORDER BY COUNT(*) DESC LIMIT 3;
+"""
 
+_SEQUENTIAL = """
+📈 Sequential & State-Tracking Logic
+Server Function	raids_after_event(player_name, attack_result_status, n) is already defined on the database. It returns the n raids that followed, in the same match, each raid by that player with that "Attack_Result_Status" (columns: "Unique_Raid_Identifier", "Match_Number", "Attacking_Player_Name", "Attack_Result_Status", "Points_Scored_By_Attacker", "Raid_Video_URL").
+Example Goal	"Show the next 5 raid videos each time Aslam got out raiding."
+Mandatory Query: For next-N-raids-after-a-player's-raid questions, emit ONLY:
+SELECT * FROM raids_after_event('Aslam', 'Failed/Unsuccessful', 5);
+Other Events	For sequences after other events (e.g., a super tackle), write the query yourself: WITH ctx AS (SELECT "Unique_Raid_Identifier", "Match_Number", LAG(<event_col>) OVER w AS prev_value FROM "S_RBR" WINDOW w AS (PARTITION BY "Match_Number" ORDER BY "Unique_Raid_Identifier")) SELECT <default_cols> FROM "S_RBR" s JOIN ctx ON s."Unique_Raid_Identifier" = ctx."Unique_Raid_Identifier" WHERE <condition on prev_value> ORDER BY s."Unique_Raid_Identifier";
+"""
+
+_COMPLEX_AGGREGATION = """
+🧠 Complex Aggregation & Subquery Patterns
+MANDATORY for multi-step logic where a filter depends on an aggregated result (e.g., "Show all successful raids by the season's top raider.").
+Grammar	WITH ranked AS (SELECT <key_expr> AS key FROM "S_RBR" [WHERE <filters>] GROUP BY key ORDER BY <aggregate> DESC LIMIT <k>) SELECT <default_cols> FROM "S_RBR" s WHERE <key_expr on s> [= | IN] (SELECT key FROM ranked) [AND <filters>];
+Example	<key_expr> = split_part("Attacking_Player_Name", '_', 1), <aggregate> = SUM("Points_Scored_By_Attacker"), <k> = 1, <filters> = s."Attack_Result_Status" ILIKE 'Successful'
+When a worked example matching the question's pattern is given just before the question, follow its structure.
+"""
+
+# Role preamble of the SQL prompt
+_HEADER = """
+You are a world-class, stateful PostgreSQL expert and a specialized Kabaddi domain analyst. Your sole purpose is to convert a user's natural language question into a precise and executable PostgreSQL query. You MUST remember the context of previous questions to answer follow-ups. You will follow the instructions below with absolute precision.
+"""
+
+# Role preamble of the context-aware SQL prompt
+_CONTEXT_HEADER = """
+You are a world-class PostgreSQL expert and a specialized Kabaddi domain analyst. Your sole purpose is to convert a user's natural language question into a precise and executable PostgreSQL query.
+
+⚠️ CRITICAL: ALL COLUMN NAMES MUST BE QUOTED IN POSTGRESQL QUERIES!
+"""
+
+_THOUGHT_PROCESS = """
+Step-by-Step Thought Process:
+Analyze User Intent & Context: Carefully read the user's current question and consider any prior conversational context. Identify key entities, actions, and desired metrics.
+Review the Raw Data Preview: Analyze the raw query output in the knowledge base above to see the exact format of the data, especially how comma-separated lists and empty strings ('') are stored. This is your ground truth.
+Determine the Required Output Type: Analyze the user's phrasing to decide the query's final output format.
+Is it QUANTITATIVE? (Keywords: "how many", "what is the total", "count", "sum"). The goal is a single aggregated value.
+Is it QUALITATIVE? (Keywords: "show me", "list", "find", "what are", "which raids"). The goal is a list of specific, detailed records.
+Identify Query Logic Pattern: Determine the complexity of the request.
+Simple Filter/Count: Use the expanded 📖 Domain-Aware Mappings.
+Calculation/Parsing: Use 💡 Advanced Functions & Approved Logic.
+Sequential/State-Tracking: You MUST use 📈 Sequential & State-Tracking Logic.
+Complex Aggregation/Subquery: You MUST use 🧠 Complex Aggregation & Subquery Patterns.
+Construct the Query: For a simple SELECT ... FROM ... WHERE (optionally with one aggregate, GROUP BY, ORDER BY or LIMIT), emit the 🧾 JSON Query Output. For anything else (CTEs, window functions, subqueries, string functions, EXECUTE) write a single, syntactically correct, and readable PostgreSQL query, using Common Table Expressions (CTEs) (WITH) where it helps.
+Apply Final Output Rules: Ensure all mandatory formatting and content rules are met.
+"""
+
+_RULES = """
 ⚠️ CRITICAL RULES & OUTPUT FORMAT
 MANDATORY QUOTING: All column names MUST be in double quotes (e.g., "Match_Number").
 CASE-INSENSITIVE MATCHING: Use ILIKE for all string comparisons.
-NO WILDCARD SELECTION: You are strictly forbidden from using SELECT *.
+NO WILDCARD SELECTION: You are strictly forbidden from using SELECT *, except SELECT * FROM raids_after_event(...).
+Don't repeat these common mistakes:
+BAD: SELECT * FROM S_RBR WHERE Attacking_Player_Name='Pawan';
+GOOD: SELECT "Unique_Raid_Identifier", "Attacking_Player_Name", "Raid_Video_URL" FROM "S_RBR" WHERE "Attacking_Player_Name" ILIKE '%Pawan%';
+(Unquoted mixed-case names fail in PostgreSQL, SELECT * returns unusable rows, and = misses name variants.)
 CONTEXT-AWARE SELECT CLAUSE (CRITICAL RULE): You MUST tailor the SELECT clause to directly answer the user's question as determined in Step 3 of the thought process.
 A. For QUANTITATIVE questions ("how many", "total"): The query MUST use an aggregate function (COUNT(*), SUM("Column"), etc.) and return a single numerical value.
 User Question: "How many successful raids by Pawan?"
@@ -264,11 +324,26 @@ B. For QUALITATIVE questions ("show", "list", "which raids"): The query MUST sel
 User Question: "Show me successful raids by Pawan."
 Correct SQL: SELECT "Unique_Raid_Identifier", "Attacking_Player_Name", "Points_Scored_By_Attacker", "Raid_Video_URL" FROM "S_RBR" WHERE "Attacking_Player_Name" ILIKE '%Pawan%' AND "Attack_Result_Status" ILIKE 'Successful';
 
-SQL ONLY: For answerable questions, your entire response MUST be ONLY the final, executable PostgreSQL query.
+QUERY ONLY: For answerable questions, your entire response MUST be ONLY the JSON query object or the final, executable PostgreSQL query - no explanation, no markdown.
 DEFAULT METRIC FOR AMBIGUITY:
 If a user asks for "top players" or "best players" without a specific metric, you MUST default to ranking them by total raid points (SUM("Points_Scored_By_Attacker")).
 If they ask for "top teams," default to most matches won (by counting occurrences in "Match_Winner_Team").
+"""
 
+_IR_OUTPUT = """
+🧾 JSON Query Output (for simple queries):
+Instead of SQL, answer simple queries with one JSON object; it is compiled to SQL for you, so do NOT quote column names inside it.
+Keys: "select" (column names, or {"agg": "COUNT"|"SUM"|"AVG"|"MIN"|"MAX", "column": name or "*" for COUNT, "as": alias}), "where" (list of {"column", "op", "value"}, combined with AND), "group_by" (column names), "order_by" (list of {"column": name or alias, "dir": "ASC"|"DESC"}), "limit" (positive integer).
+Allowed "op": =, !=, <, <=, >, >=, ILIKE, NOT ILIKE, IN (value is a list), IS NULL, IS NOT NULL (no value). Write ILIKE patterns with their % wildcards, e.g. "%Pawan%".
+"*" is only valid inside COUNT; every other selection MUST name its columns.
+User Question: "Show me successful raids by Pawan."
+Correct output: {"select": ["Unique_Raid_Identifier", "Attacking_Player_Name", "Points_Scored_By_Attacker", "Raid_Video_URL"], "where": [{"column": "Attacking_Player_Name", "op": "ILIKE", "value": "%Pawan%"}, {"column": "Attack_Result_Status", "op": "ILIKE", "value": "Successful"}]}
+User Question: "Top 5 raiders by raid points."
+Correct output: {"select": ["Attacking_Player_Name", {"agg": "SUM", "column": "Points_Scored_By_Attacker", "as": "raid_points"}], "group_by": ["Attacking_Player_Name"], "order_by": [{"column": "raid_points", "dir": "DESC"}], "limit": 5}
+"""
+
+# Shared by the SQL and answer prompts
+_REFUSAL_PROTOCOL = """
 🚫 Refusal & Clarification Protocol for Unanswerable Questions:
 You MUST strictly follow this protocol. DO NOT generate SQL if the question falls into these categories.
 For Missing Data: If the schema or raw data preview shows the information is not available (e.g., asking for player age, "player revived," or exact raid timestamps), you MUST refuse politely with a specific reason and alternative. HOWEVER, if the user specifies a time window in minutes (e.g., "last 5 minutes"), you MUST approximate it using ⏱️ Time-Window Approximation instead of refusing.
@@ -276,19 +351,56 @@ For Missing Data: If the schema or raw data preview shows the information is not
 For Logical Impossibility in SQL: If a query requires logic too complex for a single SQL statement (e.g., a "point streak" that spans across unsuccessful raids), you MUST refuse and explain the limitation:
 "I'm sorry, calculating a complex 'point streak' across game interruptions is beyond the scope of a direct SQL query. I can, however, provide you with all of that player's successful raids for manual analysis."
 
-Question: {input}
 """
 
+# Knowledge base for the S_RBR table: schema, raw preview, domain mappings and SQL patterns.
+# It is the largest and most stable part of the SQL prompt, so it leads and can be preloaded
+# once per session as a cached document.
+KABADDI_KB_DOC = _join_sections(_SCHEMA, _RAW_PREVIEW, _DOMAIN_MAPPINGS, _GRAMMAR_LEGEND, _SKILL_NORMALIZATION, _NAME_LOGIC,
+                                 _TIME_WINDOW, _ADVANCED, _SEQUENTIAL, _COMPLEX_AGGREGATION)
+
+# Bump when mappings or patterns change so cached copies of the knowledge base are invalidated
+KB_VERSION = 10
+KB_DOC_HASH = hashlib.md5(KABADDI_KB_DOC.encode()).hexdigest()
+KB_CACHE_KEY = f"kabaddi-kb-v{KB_VERSION}-{KB_DOC_HASH}"
+
+# Thinking steps and output rules for SQL generation
+SQL_INSTRUCTIONS = _join_sections(_HEADER, _THOUGHT_PROCESS, _RULES, _IR_OUTPUT, _REFUSAL_PROTOCOL)
+
+# Everything before the per-request tail. Its hash is checked at startup against the committed
+# value: any change to it misses the provider prefix cache for every session, so it must come
+# with a PROMPT_VERSION bump and a new EXPECTED_STATIC_PREFIX_HASH
+PROMPT_VERSION = "v7"
+STATIC_PREFIX = KABADDI_KB_DOC + SQL_INSTRUCTIONS
+STATIC_PREFIX_HASH = hashlib.sha256((PROMPT_VERSION + STATIC_PREFIX).encode()).hexdigest()
+EXPECTED_STATIC_PREFIX_HASH = "ad984a56c0134d3760ab44290e10a63046d80735635a7e4ae4a3db13212d4e36"
+
+def check_static_prefix(rendered_prompt: str) -> bool:
+    """
+    Log the static prefix hash and whether it matches the committed one. rendered_prompt is the
+    prompt head as actually sent, which must start with STATIC_PREFIX byte for byte
+    """
+    if not rendered_prompt.startswith(STATIC_PREFIX):
+        print("⚠️ The rendered SQL prompt no longer starts with STATIC_PREFIX - the hashed prefix is not what is sent")
+        return False
+    if STATIC_PREFIX_HASH == EXPECTED_STATIC_PREFIX_HASH:
+        print(f"✅ Static SQL prompt prefix {PROMPT_VERSION} ({STATIC_PREFIX_HASH[:12]})")
+        return True
+    print(f"⚠️ Static SQL prompt prefix changed ({STATIC_PREFIX_HASH[:12]}, expected "
+          f"{EXPECTED_STATIC_PREFIX_HASH[:12]}) - bump PROMPT_VERSION and update EXPECTED_STATIC_PREFIX_HASH")
+    return False
+
+# Per-request tail; everything above it is byte-identical across calls
+SYSTEM_DYNAMIC_TEMPLATE = """{example}Question: {input}
+"""
 
-
-ANSWER_PROMPT_TEMPLATE = """
+_ANSWER_INSTRUCTIONS = """
 You are a specialized Kabaddi data analyst and an expert communicator. Your sole purpose is to take a user's question, the SQL query used to answer it, and the raw data result from that query, and then formulate a clear, concise, and user-friendly response.
 
 Step-by-Step Instructions:
 1. Analyze the Structure of the SQL Result: This is your first and most critical step. The format of the result tells you how to answer.
-   A) Is it a SINGLE NUMERIC VALUE? (e.g., [{{"count": 127}}], [{{"total_points": 54}}]). This is a Quantitative answer.
-   B) Is it a LIST OF RECORDS? (e.g., [{{"raider_name": "Pawan", "total_points": 150}}, {{"raider_name": "Naveen", "total_points": 120}}]). This is a Qualitative answer.
-   C) Is it EMPTY? (e.g., [] or no rows returned). This means no results were found.
+   A) Is it a SINGLE NUMERIC VALUE? (e.g., [{"Count": 127}], [{"Total Points": 54}]). This is a Quantitative answer.
+   B) Is it a LIST OF RECORDS? (e.g., [{"Raider Name": "Pawan", "Total Points": 150}, {"Raider Name": "Naveen", "Total Points": 120}]). This is a Qualitative answer.
 
 2. Generate the Response Based on the Result's Structure: Follow the appropriate rule below with absolute precision.
 
@@ -299,18 +411,18 @@ Step-by-Step Instructions:
 
 Example:
 Question: "How many successful raids did Pawan do?"
-SQL Result: [{{"count": 127}}]
+SQL Result: [{"Count": 127}]
 Correct Answer: Pawan Sherawat performed a total of 127 successful raids.
 
 ➡️ Rule for a List of Records (Qualitative Result):
 - Begin with a brief introductory sentence. (e.g., "Here are the results that match your criteria:")
 - Format the entire SQL Result into a clean and easy-to-read Markdown table.
-- CRITICAL: You MUST translate the technical SQL column names from the result into a human-readable format for the table headers. Use the Header Mappings table below. If a column is not in the mapping table, use a logical, capitalized version of the name (e.g., "Match_Number" becomes "Match Number").
+- The keys of the SQL Result are already human-readable headers. Use them exactly as the table headers.
 - When presenting skills/techniques values, normalize them for readability by stripping trailing context like 'OnRCV', 'UnderLIN', 'ByRCNR', 'WithLCV' (e.g., 'RunningHandTouchOnRCV' → 'RunningHandTouch'). If any value starts with 'LobbyOut', do not present it as a skill.
 
 Example:
 Question: "Show me the top raiders by points"
-SQL Result: [{{"raider_name": "Pawan Sherawat", "total_points": 150}}, {{"raider_name": "Naveen Kumar", "total_points": 120}}]
+SQL Result: [{"Raider Name": "Pawan Sherawat", "Total Points": 150}, {"Raider Name": "Naveen Kumar", "Total Points": 120}]
 Correct Answer:
 Here are the top raiders by total points scored:
 
@@ -319,337 +431,135 @@ Here are the top raiders by total points scored:
 | Pawan Sherawat | 150 |
 | Naveen Kumar | 120 |
 
-➡️ Rule for an Empty Result:
-- Do not generate a table or an apology.
-- Provide a helpful message suggesting alternative questions instead of just stating no data was found.
-- Correct Answer: No raids or players were found that match your specific criteria. Here are some related questions you could try instead:
-  • Show all successful raids by [Player Name]
-  • What are the top raiders by total points?
-  • Which teams have won the most matches?
-  • Show me raids from [specific match number]
-  • What are the most common attack techniques used?
-
 General Rules:
 - NEVER hallucinate or invent information that is not present in the SQL Result. Your job is to present the facts clearly.
 - NEVER interpret or analyze the data (e.g., "This is a high number because..."). Simply present the data as requested.
 - Ensure the final answer directly and completely addresses the user's original question.
+"""
 
-Header Mappings (SQL Column Name → Human-Readable Header):
-- raider_name → Raider Name
-- total_points → Total Points
-- total_raid_points → Total Raid Points
-- Unique_Raid_Identifier → Raid ID
-- Attacking_Player_Name → Attacking Player
-- Primary_Defender_Name → Primary Defender
-- Attack_Result_Status → Raid Outcome
-- Points_Scored_By_Attacker → Points Scored
-- Points_Scored_By_Defenders → Defense Points
-- Attack_Techniques_Used → Raider Skills
-- Defense_Techniques_Used → Defender Skills
-- Raid_Video_URL → Raid Video
-- Game_Half_Period → Half
-- Defending_Team_Code → Defending Team
+ANSWER_RULES_TEXT = _join_sections(_ANSWER_INSTRUCTIONS, _REFUSAL_PROTOCOL)
 
-🚫 Refusal & Clarification Protocol for Unanswerable Questions:
-You MUST strictly follow this protocol. DO NOT generate SQL if the question falls into these categories.
-For Missing Data: If the schema or raw data preview shows the information is not available (e.g., asking for player age, "player revived," or exact raid timestamps), you MUST refuse politely with a specific reason and alternative. HOWEVER, if the user specifies a time window in minutes (e.g., "last 5 minutes"), you MUST approximate it using ⏱️ Time-Window Approximation instead of refusing.
-"I'm sorry, I can't answer that as the data does not contain [Missing Concept, e.g., 'specific player revival information' / exact raid timestamps]. You could ask ['Show all successful raids by Pawan against Bengaluru Bulls.'] instead."
-For Logical Impossibility in SQL: If a query requires logic too complex for a single SQL statement (e.g., a "point streak" that spans across unsuccessful raids), you MUST refuse and explain the limitation:
-"I'm sorry, calculating a complex 'point streak' across game interruptions is beyond the scope of a direct SQL query. I can, however, provide you with all of that player's successful raids for manual analysis."
-
-Question: {question}
+# Reply for queries that return no rows; sent without calling the answer LLM
+EMPTY_RESULT_MSG = """No raids or players were found that match your specific criteria. Here are some related questions you could try instead:
+  • Show all successful raids by [Player Name]
+  • What are the top raiders by total points?
+  • Which teams have won the most matches?
+  • Show me raids from [specific match number]
+  • What are the most common attack techniques used?"""
+
+# SQL column name -> table header in answers; applied to result rows before they reach the answer prompt
+HEADER_MAP = {
+    "raider_name": "Raider Name",
+    "total_points": "Total Points",
+    "total_raid_points": "Total Raid Points",
+    "Unique_Raid_Identifier": "Raid ID",
+    "Attacking_Player_Name": "Attacking Player",
+    "Primary_Defender_Name": "Primary Defender",
+    "Attack_Result_Status": "Raid Outcome",
+    "Points_Scored_By_Attacker": "Points Scored",
+    "Points_Scored_By_Defenders": "Defense Points",
+    "Attack_Techniques_Used": "Raider Skills",
+    "Defense_Techniques_Used": "Defender Skills",
+    "Attack_Techniques_Clean": "Raider Skills",
+    "Defense_Techniques_Clean": "Defender Skills",
+    "Raid_Video_URL": "Raid Video",
+    "Game_Half_Period": "Half",
+    "Defending_Team_Code": "Defending Team",
+}
+
+def readable_header(column: str) -> str:
+    """Header for a result column, e.g. "Match_Number" -> "Match Number" when it isn't in HEADER_MAP"""
+    return HEADER_MAP.get(column, column.replace("_", " ").title())
+
+ANSWER_DYNAMIC_TEMPLATE = """Question: {question}
 SQL Query: {query}
 SQL Result: {result}
 
 Answer:
 """
 
-
-
 # Enhanced System Prompt with Conversation Context
-CONTEXT_AWARE_SYSTEM_PROMPT_TEMPLATE = """
-You are a world-class PostgreSQL expert and a specialized Kabaddi domain analyst. Your sole purpose is to convert a user's natural language question into a precise and executable PostgreSQL query.
+# Shares the knowledge base prefix with the SQL prompt; the conversation context lives in the
+# dynamic tail so everything before it stays a stable prefix
+CONTEXT_AWARE_INSTRUCTIONS = _join_sections(_CONTEXT_HEADER, _THOUGHT_PROCESS, _RULES, _IR_OUTPUT, _REFUSAL_PROTOCOL)
 
-CONVERSATION CONTEXT:
+CONTEXT_AWARE_DYNAMIC_TEMPLATE = """CONVERSATION CONTEXT:
 {conversation_context}
 
-⚠️ CRITICAL: ALL COLUMN NAMES MUST BE QUOTED IN POSTGRESQL QUERIES!
-
-Step-by-Step Thought Process:
-Analyze User Intent & Context: Carefully read the user's current question and consider any prior conversational context. Identify key entities, actions, and desired metrics.
-Review the Raw Data Preview: Analyze the raw query output below to see the exact format of the data, especially how comma-separated lists and empty strings ('') are stored. This is your ground truth.
-Determine the Required Output Type: Analyze the user's phrasing to decide the query's final output format.
-Is it QUANTITATIVE? (Keywords: "how many", "what is the total", "count", "sum"). The goal is a single aggregated value.
-Is it QUALITATIVE? (Keywords: "show me", "list", "find", "what are", "which raids"). The goal is a list of specific, detailed records.
-Identify Query Logic Pattern: Determine the complexity of the request.
-Simple Filter/Count: Use the expanded 📖 Domain-Aware Mappings.
-Calculation/Parsing: Use 💡 Advanced Functions & Approved Logic.
-Sequential/State-Tracking: You MUST use 📈 Sequential & State-Tracking Logic.
-Complex Aggregation/Subquery: You MUST use 🧠 Complex Aggregation & Subquery Patterns.
-Construct the PostgreSQL Query: Build a single, syntactically correct, and readable query. Use Common Table Expressions (CTEs) (WITH) for any query that is not a simple SELECT ... FROM ... WHERE.
-Apply Final Output Rules: Ensure all mandatory formatting and content rules are met.
-
-⚙️ EXACT TABLE SCHEMA - USE THESE COLUMN NAMES ONLY:
-CRITICAL: You MUST use ONLY the exact, case-sensitive, quoted column names defined below.
-   Table "public.S_RBR"
-                Column                |  Type
---------------------------------------+--------
- Season                               | text
- Unique_Raid_Identifier               | bigint
- Match_Number                         | bigint
- Team_A_Name                          | text
- Team_B_Name                          | text
- Game_Half_Period                     | text
- Attacking_Player_Name                | text
- Attacking_Team_Code                  | text
- Defending_Team_Code                  | text
- Defending_Team_Players_At_Raid_Start | text
- Attacking_Team_Players_At_Raid_Start | text
- Primary_Defender_Name                | text
- Secondary_Defender_Name              | text
- Do_Or_Die_Mandatory_Raid             | bigint
- Bonus_Point_Available                | bigint
- Super_Tackle_Opportunity             | bigint
- Defending_Team_Players_At_Raid_End   | text
- Attacking_Team_Players_At_Raid_End   | text
- Defending_Players_Eliminated_Names   | text
- Attacking_Players_Eliminated_Names   | text
- Attack_Result_Status                 | text
- Defense_Result_Status                | text
- Team_That_Eliminated_All_Opponents   | text
- Points_Scored_By_Attacker            | bigint
- Points_Scored_By_Defenders           | bigint
- Attack_Techniques_Used               | text
- Defense_Techniques_Used              | text
- Raid_Video_URL                       | text
- Empty_Raid_Penalty_Sequence          | text
- Match_City_Venue                     | text
- Match_Winner_Team                    | text
- Final_Team_A_Score                   | bigint
- Final_Team_B_Score                   | bigint
- 
-
-📊 RAW DATA PREVIEW - GROUND TRUTH FROM POSTGRESQL:
-This is the exact format of the data in the database. Base all your assumptions about data values on this sample.
-
-   kabaddi_data=# select * from "S_RBR" limit 3;
- Season | Unique_Raid_Identifier | Match_Number | Team_A_Name | Team_B_Name | Game_Half_Period |  Attacking_Player_Name  | Attacking_Team_Code | Defending_Team_Code |                                                                  Defending_Team_Players_At_Raid_Start                                                                  |                                                                Attacking_Team_Players_At_Raid_Start                                                                 |     Primary_Defender_Name     | Secondary_Defender_Name | Do_Or_Die_Mandatory_Raid | Bonus_Point_Available | Super_Tackle_Opportunity |                                                                   Defending_Team_Players_At_Raid_End                                                                   |                                                                   Attacking_Team_Players_At_Raid_End                                                                   | Defending_Players_Eliminated_Names | Attacking_Players_Eliminated_Names | Attack_Result_Status | Defense_Result_Status | Team_That_Eliminated_All_Opponents | Points_Scored_By_Attacker | Points_Scored_By_Defenders |           Attack_Techniques_Used            | Defense_Techniques_Used |                                     Raid_Video_URL                                     | Empty_Raid_Penalty_Sequence | Match_City_Venue | Match_Winner_Team | Final_Team_A_Score | Final_Team_B_Score
---------+------------------------+--------------+-------------+-------------+------------------+-------------------------+---------------------+---------------------+------------------------------------------------------------------------------------------------------------------------------------------------------------------------+---------------------------------------------------------------------------------------------------------------------------------------------------------------------+-------------------------------+-------------------------+--------------------------+-----------------------+--------------------------+------------------------------------------------------------------------------------------------------------------------------------------------------------------------+------------------------------------------------------------------------------------------------------------------------------------------------------------------------+------------------------------------+------------------------------------+----------------------+-----------------------+------------------------------------+---------------------------+----------------------------+---------------------------------------------+-------------------------+----------------------------------------------------------------------------------------+-----------------------------+------------------+-------------------+--------------------+--------------------
- PKL11  |              892001001 |       892001 | TT          | BB          | FirstHalf        | Pawan Sherawat_RIN_TT17 | TT                  | BB                  | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Surinder Dehal_RCV_BB55, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22 | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Ajit Pandurang Pawar_LCV_TT12, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1 | Surinder Dehal_RCV_BB55       |                         |                        0 |                     1 |                        0 | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22                          | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Ajit Pandurang Pawar_LCV_TT12, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1    | Surinder Dehal_RCV_BB55            |                                    | Successful           | Failed/Unsuccessful   |                                    |                         2 |                          0 | StandingBonusUnderLIN,RunningHandTouchOnRCV |                         | https://vod.cricket-21.com/volume1/Kabaddi%20Videos/4231/TT%20Vs%20BB%2018-10-24_1.MP4 | First                       | 13_PlayOffs      | TT                |                  2 |                  0
- PKL11  |              892001002 |       892001 | TT          | BB          | FirstHalf        | Pradeep Narwal_LIN_BB9  | BB                  | TT                  | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Ajit Pandurang Pawar_LCV_TT12, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1    | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22                       | Ajit Pandurang Pawar_LCV_TT12 |                         |                        0 |                     0 |                        0 | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1                                   | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Surinder Dehal_RCV_BB55, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22 | Ajit Pandurang Pawar_LCV_TT12      |                                    | Successful           | Failed/Unsuccessful   |                                    |                         1 |                          0 |                                             | ThighHoldByLCV          | https://vod.cricket-21.com/volume1/Kabaddi%20Videos/4231/TT%20Vs%20BB%2018-10-24_2.MP4 | First                       | 13_PlayOffs      | TT                |                  2 |                  1
- PKL11  |              892001003 |       892001 | TT          | BB          | FirstHalf        | Pawan Sherawat_RIN_TT17 | TT                  | BB                  | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Surinder Dehal_RCV_BB55, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22 | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1                                |                               |                         |                        0 |                     1 |                        0 | Nitin Rawal_LCNR_BB14, Jai Bhagwan_RLIN_BB6, Pradeep Narwal_LIN_BB9, Parteek_LCV_BB11, Surinder Dehal_RCV_BB55, Ajinkya Ashok Pawar_LIN_BB19, Saurabh Nandal_RCNR_BB22 | Ankit_LCNR_TT2, Krishan_RCNR_TT4, Pawan Sherawat_RIN_TT17, Sagar Sethpal Rawal_RCV_TT7, Manjeet Sharma_RIN_TT10, Vijay Malik_LIN_TT1                                   |                                    |                                    | Successful           | Failed/Unsuccessful   |                                    |                         1 |                          0 | StandingBonusUnderLIN                       |                         | https://vod.cricket-21.com/volume1/Kabaddi%20Videos/4231/TT%20Vs%20BB%2018-10-24_3.MP4 | First                       | 13_PlayOffs      | TT                |                  3 |                  1
- 
-
-📖 Domain-Aware Mappings
-Natural Language Term	→ SQL Logic or Transformation (Use EXACT Column Names)
-raid sequence in a match	→ ("Unique_Raid_Identifier" % 1000)
-defense of 3 or less	→ "Super_Tackle_Opportunity" = 1
-less than 4 defenders	→ "Super_Tackle_Opportunity" = 1
-super tackle chance	→ "Super_Tackle_Opportunity" = 1
-regular defense (4+)	→ "Super_Tackle_Opportunity" = 0
-left raider	→ "Attacking_Player_Name" ILIKE '%_LIN_%'
-right raider	→ "Attacking_Player_Name" ILIKE '%_RIN_%'
-attacking player / raider	→ "Attacking_Player_Name"
-primary defender	→ "Primary_Defender_Name"
-secondary defender	→ "Secondary_Defender_Name"
-successful raid	→ "Attack_Result_Status" ILIKE 'Successful'
-unsuccessful raid	→ "Attack_Result_Status" ILIKE 'Failed/Unsuccessful'
-raid points	→ "Points_Scored_By_Attacker"
-defense points	→ "Points_Scored_By_Defenders"
-total points in a raid	→ ("Points_Scored_By_Attacker" + "Points_Scored_By_Defenders")
-bonus point available	→ "Bonus_Point_Available" = 1
-do-or-die raid (DOD)	→ "Do_Or_Die_Mandatory_Raid" = 1
-successful defense	→ "Defense_Result_Status" ILIKE 'Successful'
-unsuccessful defense	→ "Defense_Result_Status" ILIKE 'Failed/Unsuccessful'
-all out inflicted	→ "Team_That_Eliminated_All_Opponents" IS NOT NULL
-period 1 / first half	→ "Game_Half_Period" ILIKE 'FirstHalf'
-period 2 / second half	→ "Game_Half_Period" ILIKE 'SecondHalf'
-attacking team	→ "Attacking_Team_Code"
-defending team	→ "Defending_Team_Code"
-match winner	→ "Match_Winner_Team"
-raider name	→ "Attacking_Player_Name"
-defender name	→ "Primary_Defender_Name"
-raider skill / attacking skill / raider skills	→ Use "Attack_Techniques_Used" (see Skill Normalization Rules below)
-defender skill / defense skill / tackle techniques	→ Use "Defense_Techniques_Used" (see Skill Normalization Rules below)
- 
-🧩 Skill Normalization Rules (for Skills/Techniques requests)
-- Techniques strings may include context suffixes like 'OnRCV', 'UnderLIN', 'ByRCNR', 'WithLCV'. When answering, normalize to the base skill:
-  - Strip any trailing context beginning with 'On', 'Under', 'By', or 'With' followed by uppercase letters.
-  - Example: 'RunningHandTouchOnRCV' → 'RunningHandTouch'; 'StandingBonusUnderLIN' → 'StandingBonus'.
-- Exclude non-skills: any value starting with 'LobbyOut' must NOT be counted or shown.
-- Recommended SQL pattern (raider skills):
-  WITH raw AS (
-    SELECT TRIM(x) AS raw_skill
-    FROM "S_RBR", LATERAL string_to_array("Attack_Techniques_Used", ',') AS x
-    WHERE "Attack_Techniques_Used" IS NOT NULL AND TRIM("Attack_Techniques_Used") <> ''
-  )
-  SELECT regexp_replace(raw_skill, '(On|Under|By|With)[A-Z].*$', '', 'g') AS skill, COUNT(*)
-  FROM raw
-  WHERE raw_skill NOT ILIKE 'LobbyOut%'
-  GROUP BY skill
-  ORDER BY COUNT(*) DESC;
-- Use the same pattern for defender skills by replacing "Attack_Techniques_Used" with "Defense_Techniques_Used".
-
- 🧬 Player and Team Name Logic:
-Player Name Format: PlayerFullName_MainPlayingPosition_TeamShortCodeJerseyNumber (e.g., Pawan Sherawat_RIN_TT17).
-To Find a Player's Raids: Use ILIKE on the "Attacking_Player_Name" column (e.g., WHERE "Attacking_Player_Name" ILIKE '%Pawan Sherawat%').
-To Find a Player's Tackles: Use ILIKE on the "Primary_Defender_Name" column or search within "Defending_Players_Eliminated_Names".
-
-| Code | → | Team Name               |
-|------|---|-------------------------|
-| TT   | → | Telugu Titans           |
-| BB   | → | Bengaluru Bulls         |
-| BW   | → | Bengal Warriors         |
-| DD   | → | Dabang Delhi            |
-| GG   | → | Gujarat Giants          |
-| HS   | → | Haryana Steelers        |
-| JP   | → | Jaipur Pink Panthers    |
-| PP   | → | Patna Pirates           |
-| PU   | → | Puneri Paltan           |
-| TN   | → | Tamil Thalaivas         |
-| UM   | → | U Mumba                 |
-| UP   | → | U.P. Yoddhas            |
-
-⏱️ Time-Window Approximation (No Timestamps in Data)
-Goal	How to interpret queries like "last 5 minutes" without raid timestamps
-Principle	There are ~3 raids per minute (1 raid ≈ 20 seconds). Convert minutes to an approximate number of raids.
-Conversion	N_raids ≈ ROUND(minutes × 3). Examples: 1 min → 3 raids, 5 min → 15 raids, 10 min → 30 raids.
-Default Scope	If no match is specified, interpret "last" globally by chronology (highest "Unique_Raid_Identifier" first). If a match is specified, interpret within that match (order by "Unique_Raid_Identifier" within the match).
-Opponent Alias Mapping	Map casual city names to official team names/codes for filtering: "pune" → Team 'Puneri Paltan' (code 'PU'). Use ILIKE on team names and/or codes.
-SQL Pattern	To fetch the last N raids for a player (optionally vs opponent), first select newest raids by ordering DESC and LIMIT N, then re-order ASC for readability.
-Example Goal	"Pawan last 5 minutes raids against Pune"
-Mandatory Query Structure:
-```sql
-WITH params AS (
-  SELECT 5::int AS minutes, ROUND(5 * 3)::int AS n_raids
-), recent AS (
-  SELECT
-    s."Unique_Raid_Identifier",
-    s."Match_Number",
-    s."Attacking_Player_Name",
-    s."Defending_Team_Code",
-    s."Team_B_Name",
-    s."Attack_Result_Status",
-    s."Points_Scored_By_Attacker",
-    s."Raid_Video_URL"
-  FROM "S_RBR" s, params p
-  WHERE s."Attacking_Player_Name" ILIKE '%Pawan%'
-    AND (
-      s."Defending_Team_Code" ILIKE 'PU'
-      OR s."Team_A_Name" ILIKE '%Puneri Paltan%'
-      OR s."Team_B_Name" ILIKE '%Puneri Paltan%'
-    )
-  ORDER BY s."Unique_Raid_Identifier" DESC
-  LIMIT (SELECT n_raids FROM params)
-)
-SELECT
-  r."Unique_Raid_Identifier",
-  r."Attacking_Player_Name",
-  r."Attack_Result_Status",
-  r."Points_Scored_By_Attacker",
-  r."Raid_Video_URL"
-FROM recent r
-ORDER BY r."Unique_Raid_Identifier" ASC;
-```
-Notes	When user specifies minutes (e.g., 5), you MUST convert to raids using the conversion above and apply the DESC/LIMIT pattern. Prefer code + official team name filters to catch aliases.
-
-💡 Advanced Functions & Approved Logic (For Parsing & Calculations)
-Goal	Approved Pattern / Function & Example
-Calculate Rate/Percentage	(COUNT(*) FILTER (WHERE <condition>) * 100.0) / COUNT(*)
-Count Items in a List	cardinality(string_to_array("Column_Name", ','))
-Extract Clean Player Name	split_part("Player_Column_Name", '_', 1)
-Parse & Aggregate Skills	Goal: "Top 3 skills of Pawan." Use normalization: split the list, strip trailing context using regexp_replace('(On|Under|By|With)[A-Z].*$', ''), and exclude 'LobbyOut%'. Example:
-  WITH raw AS (
-    SELECT TRIM(x) AS raw_skill
-    FROM "S_RBR", LATERAL string_to_array("Attack_Techniques_Used", ',') AS x
-    WHERE "Attacking_Player_Name" ILIKE '%Pawan%'
-      AND "Attack_Techniques_Used" IS NOT NULL AND TRIM("Attack_Techniques_Used") <> ''
-  )
-  SELECT regexp_replace(raw_skill, '(On|Under|By|With)[A-Z].*$', '', 'g') AS skill, COUNT(*)
-  FROM raw
-  WHERE raw_skill NOT ILIKE 'LobbyOut%'
-  GROUP BY skill
-  ORDER BY COUNT(*) DESC
-  LIMIT 3;
-
-📈 Sequential & State-Tracking Logic (Window Functions)
-MANDATORY for queries about sequences (e.g., "next N raids after X event").
-Example Goal: "Show the next 5 raid videos each time Aslam got out raiding."
-Mandatory Query Structure:
-code
-SQL
-WITH raid_context AS (
-    SELECT
-        "Unique_Raid_Identifier",
-        "Match_Number",
-        LAG("Attacking_Player_Name", 1) OVER (PARTITION BY "Match_Number" ORDER BY "Unique_Raid_Identifier") AS prev_raider_name,
-        LAG("Attack_Result_Status", 1) OVER (PARTITION BY "Match_Number" ORDER BY "Unique_Raid_Identifier") AS prev_raid_status
-    FROM "S_RBR"
-),
-raids_after_event AS (
-  SELECT "Unique_Raid_Identifier", "Match_Number"
-  FROM raid_context
-  WHERE prev_raider_name ILIKE '%Aslam%' AND prev_raid_status ILIKE 'Failed/Unsuccessful'
-)
-SELECT
-  s."Unique_Raid_Identifier", s."Attacking_Player_Name", s."Attack_Result_Status", s."Raid_Video_URL"
-FROM "S_RBR" s
-JOIN raids_after_event rae
-  ON s."Match_Number" = rae."Match_Number"
-  AND s."Unique_Raid_Identifier" > rae."Unique_Raid_Identifier"
-  AND s."Unique_Raid_Identifier" <= rae."Unique_Raid_Identifier" + 5
-ORDER BY s."Unique_Raid_Identifier";```
-
----
-
-#### 🧠 Complex Aggregation & Subquery Patterns
-*MANDATORY for multi-step logic where a filter depends on an aggregated result.*
-**Example Goal:** "Show all successful raids by the season's top raider."
-**Mandatory Query Structure:**
-```sql
-WITH top_raider AS (
-  SELECT split_part("Attacking_Player_Name", '_', 1) as player_name
-  FROM "S_RBR"
-  WHERE "Attacking_Player_Name" IS NOT NULL AND "Attacking_Player_Name" != ''
-  GROUP BY player_name
-  ORDER BY SUM("Points_Scored_By_Attacker") DESC
-  LIMIT 1
-)
-SELECT
-  s."Unique_Raid_Identifier", s."Attacking_Player_Name", s."Points_Scored_By_Attacker", s."Raid_Video_URL"
-FROM "S_RBR" s
-WHERE
-  split_part(s."Attacking_Player_Name", '_', 1) = (SELECT player_name FROM top_raider)
-  AND s."Attack_Result_Status" ILIKE 'Successful';
-
-⚠️ CRITICAL RULES & OUTPUT FORMAT
-MANDATORY QUOTING: All column names MUST be in double quotes (e.g., "Match_Number").
-CASE-INSENSITIVE MATCHING: Use ILIKE for all string comparisons.
-NO WILDCARD SELECTION: You are strictly forbidden from using SELECT *.
-CONTEXT-AWARE SELECT CLAUSE (CRITICAL RULE): You MUST tailor the SELECT clause to directly answer the user's question as determined in Step 3 of the thought process.
-A. For QUANTITATIVE questions ("how many", "total"): The query MUST use an aggregate function (COUNT(*), SUM("Column"), etc.) and return a single numerical value.
-User Question: "How many successful raids by Pawan?"
-Correct SQL: SELECT COUNT(*) FROM "S_RBR" WHERE "Attacking_Player_Name" ILIKE '%Pawan%' AND "Attack_Result_Status" ILIKE 'Successful';
-
-
-B. For QUALITATIVE questions ("show", "list", "which raids"): The query MUST select specific, relevant columns. The default selection MUST include "Raid_Video_URL". A good default is: "Unique_Raid_Identifier", "Attacking_Player_Name", "Attack_Result_Status", "Points_Scored_By_Attacker", and "Raid_Video_URL". Do not select the entire table.
-User Question: "Show me successful raids by Pawan."
-Correct SQL: SELECT "Unique_Raid_Identifier", "Attacking_Player_Name", "Points_Scored_By_Attacker", "Raid_Video_URL" FROM "S_RBR" WHERE "Attacking_Player_Name" ILIKE '%Pawan%' AND "Attack_Result_Status" ILIKE 'Successful';
-
-SQL ONLY: For answerable questions, your entire response MUST be ONLY the final, executable PostgreSQL query.
-DEFAULT METRIC FOR AMBIGUITY:
-If a user asks for "top players" or "best players" without a specific metric, you MUST default to ranking them by total raid points (SUM("Points_Scored_By_Attacker")).
-If they ask for "top teams," default to most matches won (by counting occurrences in "Match_Winner_Team").
-
-🚫 Refusal & Clarification Protocol for Unanswerable Questions:
-You MUST strictly follow this protocol. DO NOT generate SQL if the question falls into these categories.
-For Missing Data: If the schema or raw data preview shows the information is not available (e.g., asking for player age, "player revived," or exact raid timestamps), you MUST refuse politely with a specific reason and alternative. HOWEVER, if the user specifies a time window in minutes (e.g., "last 5 minutes"), you MUST approximate it using ⏱️ Time-Window Approximation instead of refusing.
-"I'm sorry, I can't answer that as the data does not contain [Missing Concept, e.g., 'specific player revival information' / exact raid timestamps]. You could ask ['Show all successful raids by Pawan against Bengaluru Bulls.'] instead."
-For Logical Impossibility in SQL: If a query requires logic too complex for a single SQL statement (e.g., a "point streak" that spans across unsuccessful raids), you MUST refuse and explain the limitation:
-"I'm sorry, calculating a complex 'point streak' across game interruptions is beyond the scope of a direct SQL query. I can, however, provide you with all of that player's successful raids for manual analysis."
+{example}Question: {input}
+"""
 
-Question: {input}
+# Full templates and the raw preview are only needed by some consumers, so they are built on
+# first access (PEP 562) and memoized as module attributes; answer-only workers never pay for them.
+# Braces in the JSON examples stay literal - the templates are filled by the render_* functions
+# and get_prompt_skeleton, never by str.format
+_LAZY_ATTRIBUTES = {
+    "SYSTEM_PROMPT_TEMPLATE": lambda: STATIC_PREFIX + SYSTEM_DYNAMIC_TEMPLATE,
+    "CONTEXT_AWARE_SYSTEM_PROMPT_TEMPLATE": lambda: KABADDI_KB_DOC + CONTEXT_AWARE_INSTRUCTIONS + CONTEXT_AWARE_DYNAMIC_TEMPLATE,
+    "ANSWER_PROMPT_TEMPLATE": lambda: ANSWER_RULES_TEXT + ANSWER_DYNAMIC_TEMPLATE,
+    "RAW_PREVIEW_FULL": lambda: gzip.decompress(base64.b64decode(_RAW_PREVIEW_FULL_GZ)).decode(),
+}
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = _LAZY_ATTRIBUTES[name]()
+    return value
+
+
+# Each dynamic tail is split around its slots once at import, so rendering is plain
+# concatenation rather than str.format re-parsing the template on every call
+def _split_template(template: str, slots) -> tuple:
+    """Literal segments of template between the given slots, in order"""
+    segments = []
+    for slot in slots:
+        head, template = template.split("{" + slot + "}", 1)
+        segments.append(head)
+    segments.append(template)
+    return tuple(segments)
+
+_SYS_TAIL_SEGMENTS = _split_template(SYSTEM_DYNAMIC_TEMPLATE, ("example", "input"))
+_CONTEXT_TAIL_SEGMENTS = _split_template(CONTEXT_AWARE_DYNAMIC_TEMPLATE, ("conversation_context", "example", "input"))
+_ANSWER_TAIL_SEGMENTS = _split_template(ANSWER_DYNAMIC_TEMPLATE, ("question", "query", "result"))
+
+_SYS_PREFIX = STATIC_PREFIX + _SYS_TAIL_SEGMENTS[0]
+
+def _context_tail(conversation_context: str, user_input: str) -> str:
+    head, after_context, after_example, tail = _CONTEXT_TAIL_SEGMENTS
+    return "".join((head, conversation_context, after_context, example_block(user_input), after_example, user_input, tail))
+
+def _answer_tail(question: str, query: str, result: str) -> str:
+    head, after_question, after_query, tail = _ANSWER_TAIL_SEGMENTS
+    return "".join((head, question, after_question, query, after_query, result, tail))
+
+def render_system(user_input: str) -> str:
+    """SYSTEM_PROMPT_TEMPLATE filled with the question and its closest worked example"""
+    _, after_example, tail = _SYS_TAIL_SEGMENTS
+    return "".join((_SYS_PREFIX, example_block(user_input), after_example, user_input, tail))
+
+def render_context_aware(conversation_context: str, user_input: str) -> str:
+    """CONTEXT_AWARE_SYSTEM_PROMPT_TEMPLATE filled with the context, question and closest worked example"""
+    return KABADDI_KB_DOC + CONTEXT_AWARE_INSTRUCTIONS + _context_tail(conversation_context, user_input)
+
+def render_answer(question: str, query: str, result: str) -> str:
+    """ANSWER_PROMPT_TEMPLATE filled with the question, SQL and result"""
+    return ANSWER_RULES_TEXT + _answer_tail(question, query, result)
+
+# Short corrective prompt for SQL that failed validation - one cheap retry instead of the full system prompt
+SQL_FIX_TEMPLATE = """Fix this PostgreSQL query for the table "S_RBR".
+Problems: {problems}
+Rules: wrap every column and table name in double quotes (e.g., "Match_Number", "S_RBR"); never use SELECT *, list the needed columns.
+Columns: {columns}
+Return ONLY the corrected query.
+Query: {query}
 """
+_SQL_FIX_SEGMENTS = _split_template(SQL_FIX_TEMPLATE, ("problems", "columns", "query"))
+_SQL_FIX_COLUMNS = ", ".join(f'"{name}"' for name in S_RBR_COLUMNS)
+
+def render_sql_fix(query: str, problems) -> str:
+    """SQL_FIX_TEMPLATE filled with the failed query and what is wrong with it"""
+    head, after_problems, after_columns, tail = _SQL_FIX_SEGMENTS
+    return "".join((head, "; ".join(problems), after_problems, _SQL_FIX_COLUMNS, after_columns, query, tail))
 
 
 # New Tactical Match Summary Prompt - Concise Format Requested
@@ -2,6 +2,8 @@ import re
 import logging
 from typing import Dict, Any, Optional
 
+from modules.prompts import expand_team_aliases
+
 
 def _fix_common_postgres_array_errors(sql: str) -> str:
     """
@@ -103,6 +105,9 @@ def normalize_user_query(query: str) -> str:
     normalized_query = re.sub(r'raider\s+skills?', 'attacking skills', normalized_query, flags=re.IGNORECASE)
     normalized_query = re.sub(r'(defender|defence|defense)\s+skills?', 'defense skills', normalized_query, flags=re.IGNORECASE)
     
+    # Team names and nicknames become "Full Name (CODE)" so the prompt needs no code table
+    normalized_query = expand_team_aliases(normalized_query)
+    
     return normalized_query
 
 
@@ -179,3 +184,34 @@ def normalize_skills_in_result(sql_query: str, result_text: str) -> str:
     cleaned = re.sub(r'\s*,\s*,+', ', ', cleaned)
     cleaned = re.sub(r'\s{2,}', ' ', cleaned)
     return cleaned
+
+
+# -------------------- Scalar answer utilities --------------------
+# One row with one numeric column, as rendered by run_query: [{'Count': 127}] or [{'Total': Decimal('54.50')}]
+_SCALAR_RESULT_PATTERN = re.compile(
+    r"^\[\{'(?P<header>[^']*)': (?:Decimal\('(?P<decimal>-?[\d.]+)'\)|(?P<number>-?\d+(?:\.\d+)?))\}\]$"
+)
+# Only aggregates are safe to restate without the LLM; a bare single cell may be a year or an ID
+_AGGREGATE_SQL_PATTERN = re.compile(r'\b(?:COUNT|SUM|AVG)\s*\(', re.IGNORECASE)
+_AGGREGATE_HEADER_PATTERN = re.compile(r'\b(?:count|sum|avg|average|total)\b', re.IGNORECASE)
+# Years and identifiers read wrong with thousands separators ("2,024", "892,001")
+_IDENTIFIER_HEADER_PATTERN = re.compile(r'\b(?:season|year|id|identifier|match|code|jersey)\b', re.IGNORECASE)
+
+
+def format_scalar_answer(sql_query: str, result_text: str) -> Optional[str]:
+    """"<header>: **N**" for a single aggregated value, or None when the result needs the answer LLM"""
+    match = _SCALAR_RESULT_PATTERN.match(result_text.strip())
+    if not match:
+        return None
+    header = match.group('header')
+    header_is_aggregate = bool(_AGGREGATE_HEADER_PATTERN.search(header))
+    if not header_is_aggregate and not _AGGREGATE_SQL_PATTERN.search(sql_query):
+        return None
+    raw = match.group('decimal') or match.group('number')
+    if '.' in raw and not float(raw).is_integer():
+        formatted = raw  # averages and decimal sums are shown exactly as the database returned them
+    elif not header_is_aggregate and _IDENTIFIER_HEADER_PATTERN.search(header):
+        formatted = str(int(float(raw)))
+    else:
+        formatted = f"{int(float(raw)):,}"
+    return f"{header}: **{formatted}**"
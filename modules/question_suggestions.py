@@ -3,6 +3,7 @@ AI-Powered Question Suggestion Module
 Uses AI to generate contextual follow-up questions based on conversation history and cache memory
 """
 import random
+from itertools import islice
 from typing import List, Dict, Any, Optional
 
 # AI-powered question generation prompt - Simplified and dataset-focused
@@ -87,7 +88,7 @@ class AIQuestionSuggester:
             return "No previous conversation."
         
         # Get last 3 conversation turns
-        recent_turns = list(conversation_memory.history)[-3:]
+        recent_turns = list(islice(reversed(conversation_memory.history), 3))[::-1]
         context_parts = []
         
         for turn in recent_turns:
@@ -5,8 +5,9 @@ import os
 EXCEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "SKDB.xlsx")
 
 def load_sheets():
+    # DataFrames as parsed - converting to records only for the loader to rebuild a DataFrame wastes a full copy
     xl = pd.ExcelFile(EXCEL_PATH)
     return {
-        name: xl.parse(name).to_dict(orient="records")
+        name: xl.parse(name)
         for name in ["S_RBR"]
     }
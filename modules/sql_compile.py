@@ -0,0 +1,165 @@
+"""
+SQL Compile Module
+Compiles the JSON query IR emitted by the LLM into PostgreSQL for the S_RBR table,
+and checks raw SQL from the LLM for the mistakes the prompt rules forbid
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+from modules.prompts import S_RBR_COLUMNS
+
+TABLE_NAME = "S_RBR"
+AGGREGATES = frozenset(('COUNT', 'SUM', 'AVG', 'MIN', 'MAX'))
+COMPARISON_OPS = frozenset(('=', '!=', '<>', '<', '<=', '>', '>=', 'ILIKE', 'NOT ILIKE'))
+NULL_OPS = frozenset(('IS NULL', 'IS NOT NULL'))
+ALIAS_RE = re.compile(r'^[a-z_][a-z0-9_]*$')
+IR_FENCE_RE = re.compile(r'^```(?:json|JSON)?\s*(.*?)\s*```$', re.DOTALL)
+
+# Raw SQL validation: literals and quoted identifiers are blanked out first, so whatever
+# column or table name is left in the text was written unquoted
+SQL_STATEMENT_RE = re.compile(r'^\s*(?:WITH|SELECT)\b', re.IGNORECASE)
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+QUOTED_IDENTIFIER_RE = re.compile(r'"(?:[^"]|"")*"')
+# raids_after_event() returns a fixed column set, so SELECT * is allowed on it alone
+SELECT_STAR_RE = re.compile(r'\bSELECT\s+(?:DISTINCT\s+)?(?:\w+\.)?\*(?!\s*FROM\s+raids_after_event\b)', re.IGNORECASE)
+# Case-sensitive: lowercase aliases such as "season" are legal, unquoted "Season" folds and fails
+UNQUOTED_NAME_RE = re.compile(r'\b(' + '|'.join(re.escape(name) for name in [*S_RBR_COLUMNS, TABLE_NAME]) + r')\b')
+
+class SQLCompileError(ValueError):
+    """The IR is malformed or references something outside the S_RBR schema"""
+
+def parse_ir(text: str) -> Optional[Dict[str, Any]]:
+    """The IR object if the LLM answered with one (optionally fenced), else None for plain SQL or prose"""
+    text = text.strip()
+    fenced = IR_FENCE_RE.match(text)
+    if fenced:
+        text = fenced.group(1)
+    if not text.startswith('{'):
+        return None
+    try:
+        ir = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return None
+    return ir if isinstance(ir, dict) else None
+
+def _column(name: Any) -> str:
+    """Quoted identifier for a schema column; quotes the model added anyway are tolerated"""
+    if not isinstance(name, str):
+        raise SQLCompileError(f"Column name must be a string, got {name!r}")
+    name = name.strip().strip('"')
+    if name == '*':
+        raise SQLCompileError("SELECT * is not allowed - select specific columns")
+    if name not in S_RBR_COLUMNS:
+        raise SQLCompileError(f"Unknown column: {name}")
+    return f'"{name}"'
+
+def _literal(value: Any) -> str:
+    if isinstance(value, bool) or value is None:
+        raise SQLCompileError(f"Unsupported value: {value!r}")
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise SQLCompileError(f"Unsupported value: {value!r}")
+
+def _alias(alias: Any) -> str:
+    if not isinstance(alias, str) or not ALIAS_RE.match(alias):
+        raise SQLCompileError(f"Invalid alias: {alias!r}")
+    return alias
+
+def _select_item(item: Any, aliases: set) -> str:
+    if not isinstance(item, dict):
+        return _column(item)
+    agg = str(item.get('agg', '')).upper()
+    if agg not in AGGREGATES:
+        raise SQLCompileError(f"Unsupported aggregate: {item.get('agg')!r}")
+    column = item.get('column', '*')
+    argument = '*' if agg == 'COUNT' and column == '*' else _column(column)
+    expression = f"{agg}({argument})"
+    if 'as' in item:
+        alias = _alias(item['as'])
+        aliases.add(alias)
+        expression += f" AS {alias}"
+    return expression
+
+def _condition(condition: Any) -> str:
+    if not isinstance(condition, dict):
+        raise SQLCompileError(f"Condition must be an object, got {condition!r}")
+    column = _column(condition.get('column'))
+    op = str(condition.get('op', '=')).upper()
+    if op in NULL_OPS:
+        return f"{column} {op}"
+    if op == 'IN':
+        values = condition.get('value')
+        if not isinstance(values, list) or not values:
+            raise SQLCompileError("IN needs a non-empty list of values")
+        return f"{column} IN ({', '.join(_literal(v) for v in values)})"
+    if op not in COMPARISON_OPS:
+        raise SQLCompileError(f"Unsupported operator: {op}")
+    return f"{column} {op} {_literal(condition.get('value'))}"
+
+def _order_item(item: Any, aliases: set) -> str:
+    if isinstance(item, dict):
+        target = item.get('column')
+        direction = str(item.get('dir', 'ASC')).upper()
+    else:
+        target, direction = item, 'ASC'
+    if direction not in ('ASC', 'DESC'):
+        raise SQLCompileError(f"Invalid sort direction: {direction}")
+    # Membership is only checked for strings - a list or object target would be unhashable
+    expression = target if isinstance(target, str) and target in aliases else _column(target)
+    return f"{expression} {direction}"
+
+def _as_list(ir: Dict[str, Any], key: str) -> List[Any]:
+    value = ir.get(key) or []
+    if not isinstance(value, list):
+        raise SQLCompileError(f'"{key}" must be a list')
+    return value
+
+def compile_ir(ir: Dict[str, Any]) -> str:
+    """
+    Compile {"select", "where", "group_by", "order_by", "limit"} into a SELECT on S_RBR.
+    Where-conditions are ANDed; identifiers are quoted and string values escaped here
+    """
+    table = str(ir.get('from', TABLE_NAME)).strip('"')
+    if table != TABLE_NAME:
+        raise SQLCompileError(f"Unknown table: {table}")
+
+    select = _as_list(ir, 'select')
+    if not select:
+        raise SQLCompileError('"select" must list at least one column')
+    aliases = set()
+    parts = [f"SELECT {', '.join(_select_item(item, aliases) for item in select)}", f'FROM "{TABLE_NAME}"']
+
+    where = _as_list(ir, 'where')
+    if where:
+        parts.append("WHERE " + " AND ".join(_condition(c) for c in where))
+    group_by = _as_list(ir, 'group_by')
+    if group_by:
+        parts.append("GROUP BY " + ", ".join(_column(c) for c in group_by))
+    order_by = _as_list(ir, 'order_by')
+    if order_by:
+        parts.append("ORDER BY " + ", ".join(_order_item(item, aliases) for item in order_by))
+
+    limit = ir.get('limit')
+    if limit is not None:
+        if isinstance(limit, bool) or not isinstance(limit, int) or limit <= 0:
+            raise SQLCompileError(f"Invalid limit: {limit!r}")
+        parts.append(f"LIMIT {limit}")
+
+    return " ".join(parts) + ";"
+
+def validate_sql(sql: str) -> List[str]:
+    """Problems that would make PostgreSQL reject the query or break the output rules; [] if none"""
+    if not SQL_STATEMENT_RE.match(sql):
+        return []
+    stripped = QUOTED_IDENTIFIER_RE.sub('""', STRING_LITERAL_RE.sub("''", sql))
+    problems = []
+    if SELECT_STAR_RE.search(stripped):
+        problems.append("uses SELECT * - list the columns instead")
+    unquoted = sorted(set(UNQUOTED_NAME_RE.findall(stripped)))
+    if unquoted:
+        problems.append("unquoted identifiers: " + ", ".join(unquoted))
+    return problems
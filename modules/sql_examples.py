@@ -0,0 +1,83 @@
+"""
+SQL Examples Module
+Worked SQL examples for the multi-step query patterns, retrieved per question so each
+prompt carries only the closest one instead of all of them
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+# One canonical exemplar per pattern; "hints" are extra words that point a question at it.
+# Minute-window questions get no example - the prompt's EXECUTE recent_raids(...) rule covers them
+SQL_EXAMPLES: List[Dict[str, str]] = [
+    {
+        "tag": "complex_aggregation",
+        "nl": "Show all successful raids by the season's top raider.",
+        "hints": "top best leading highest most season's raider scorer whose who",
+        "sql": """WITH top_raider AS (
+  SELECT split_part("Attacking_Player_Name", '_', 1) as player_name
+  FROM "S_RBR"
+  WHERE "Attacking_Player_Name" IS NOT NULL AND "Attacking_Player_Name" != ''
+  GROUP BY player_name
+  ORDER BY SUM("Points_Scored_By_Attacker") DESC
+  LIMIT 1
+)
+SELECT
+  s."Unique_Raid_Identifier", s."Attacking_Player_Name", s."Points_Scored_By_Attacker", s."Raid_Video_URL"
+FROM "S_RBR" s
+WHERE
+  split_part(s."Attacking_Player_Name", '_', 1) = (SELECT player_name FROM top_raider)
+  AND s."Attack_Result_Status" ILIKE 'Successful';""",
+    },
+]
+
+# Below this similarity the question matches no pattern and the prompt gets no example
+SQL_EXAMPLE_MIN_SCORE = 0.12
+
+STOP_WORDS = frozenset((
+    'show', 'me', 'all', 'the', 'a', 'an', 'of', 'by', 'in', 'on', 'for', 'to', 'and', 'what',
+    'which', 'is', 'are', 'was', 'were', 'did', 'do', 'list', 'give', 'tell', 'raid', 'raids',
+    'how', 'many', 'match', 'game', 'points'
+))
+WORD_RE = re.compile(r"[a-z']+")
+
+def _tokens(text: str) -> List[str]:
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOP_WORDS]
+
+def _build_index():
+    """TF-IDF vectors (with their norms) over each example's question and hints"""
+    documents = [Counter(_tokens(example["nl"] + " " + example["hints"])) for example in SQL_EXAMPLES]
+    document_frequency = Counter(term for document in documents for term in document)
+    idf = {term: math.log((1 + len(documents)) / (1 + df)) + 1 for term, df in document_frequency.items()}
+    vectors = []
+    for document in documents:
+        vector = {term: count * idf[term] for term, count in document.items()}
+        vectors.append((vector, math.sqrt(sum(weight * weight for weight in vector.values()))))
+    return idf, vectors
+
+_IDF, _VECTORS = _build_index()
+_UNSEEN_IDF = math.log(1 + len(SQL_EXAMPLES)) + 1
+
+def retrieve_example(question: str) -> Optional[Dict[str, str]]:
+    """The example closest to the question by TF-IDF cosine, or None if nothing is close"""
+    terms = Counter(_tokens(question))
+    if not terms:
+        return None
+    # Words no example uses weigh like the rarest term, so they dilute the match as they should
+    query = {term: count * _IDF.get(term, _UNSEEN_IDF) for term, count in terms.items()}
+    query_norm = math.sqrt(sum(weight * weight for weight in query.values()))
+
+    best, best_score = None, SQL_EXAMPLE_MIN_SCORE
+    for example, (vector, norm) in zip(SQL_EXAMPLES, _VECTORS):
+        score = sum(weight * vector.get(term, 0.0) for term, weight in query.items()) / (query_norm * norm)
+        if score >= best_score:
+            best, best_score = example, score
+    return best
+
+def example_block(question: str) -> str:
+    """Prompt text with the closest worked example, or '' when the question needs none"""
+    example = retrieve_example(question)
+    if example is None:
+        return ""
+    return f"📌 Closest worked example:\nExample Question: \"{example['nl']}\"\nExample SQL:\n{example['sql']}\n\n"